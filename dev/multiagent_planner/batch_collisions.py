@@ -0,0 +1,93 @@
+"""Collision checks over whole fleets of paths at once with numpy array operations."""
+import itertools
+import numpy as np
+from .pathfinding import EDGE_CONFLICT, VERTEX_CONFLICT, Path
+
+
+def pack_paths(paths: list[Path]) -> tuple[np.ndarray, np.ndarray]:
+    """Pack paths into a padded (robots, T, 2) int array, each robot held at its last position
+    after its path ends. Empty paths are all -1.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (robots, T, 2) positions and (robots,) path lengths
+    """
+    lengths = np.fromiter((len(path) for path in paths), dtype=np.int64, count=len(paths))
+    total = int(lengths.sum())
+    positions = np.fromiter(itertools.chain.from_iterable(itertools.chain.from_iterable(paths)),
+                            dtype=np.int64, count=2 * total).reshape(total, 2)
+    positions = np.append(positions, [[-1, -1]], axis=0)  # For empty paths
+    # Index in positions of each robot at t, stopping at its last position
+    starts = np.cumsum(lengths) - lengths
+    times = np.arange(lengths.max(initial=1))
+    idxs = np.minimum(starts[:, None] + times, (starts + lengths - 1)[:, None])
+    idxs[lengths == 0] = total
+    return positions[idxs], lengths
+
+
+def _equal_key_pairs(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return (idxs_a, idxs_b) of every pair of different indices with equal keys."""
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    idxs_a, idxs_b = [], []
+    # Equal keys are consecutive once sorted, so compare keys d apart until no run is that long
+    for d in range(1, len(keys)):
+        same = np.flatnonzero(sorted_keys[d:] == sorted_keys[:-d])
+        if not len(same):
+            break
+        idxs_a.append(order[same])
+        idxs_b.append(order[same + d])
+    if not idxs_a:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(idxs_a), np.concatenate(idxs_b)
+
+
+def find_batch_collisions(paths: list[Path]) -> np.ndarray:
+    """Find all vertex and edge swap collisions between paths with array operations.
+
+    Robots wait at the end of their path, as with find_all_collisions a pair is only checked up
+    to the end of the longer of their two paths. Fast for validating whole fleets of paths.
+
+    Args:
+        paths (list[Path]): Path of each robot, empty paths are ignored
+
+    Returns:
+        np.ndarray: (N, 4) int array of sorted (t, kind, robot_a, robot_b) collisions, with
+            robot_a < robot_b and kind VERTEX_CONFLICT or EDGE_CONFLICT
+    """
+    packed, lengths = pack_paths(paths)
+    num_robots, t_max, _ = packed.shape
+    width = int(packed[..., 1].max(initial=0)) + 1
+    cells = packed[..., 0] * width + packed[..., 1]  # (robots, T)
+    num_cells = int(cells.max(initial=0)) + 1
+    times = np.arange(t_max, dtype=np.int64)
+    robots = np.repeat(np.arange(num_robots, dtype=np.int64), t_max)
+    collisions = []
+
+    # Vertex collisions, robots at the same (cell, t)
+    keys = (times * num_cells + cells).ravel()
+    valid = np.repeat(lengths > 0, t_max)
+    idxs_a, idxs_b = _equal_key_pairs(np.where(valid, keys, -1 - np.arange(keys.size)))
+    vertex_t = idxs_a % t_max
+    robots_a, robots_b = robots[idxs_a], robots[idxs_b]
+    before_end = vertex_t < np.maximum(lengths[robots_a], lengths[robots_b])
+    collisions.append(np.stack([vertex_t, np.full_like(vertex_t, VERTEX_CONFLICT),
+                                robots_a, robots_b], axis=1)[before_end])
+
+    # Edge collisions, robots moving along the same edge at t in opposite directions
+    num_moves = max(t_max - 1, 1)  # Moves per robot, kept non-zero to index by
+    from_cells, to_cells = cells[:, :-1].ravel(), cells[:, 1:].ravel()
+    move_t = np.tile(times[1:], num_robots)
+    moves = np.flatnonzero(from_cells != to_cells)
+    low = np.minimum(from_cells[moves], to_cells[moves])
+    high = np.maximum(from_cells[moves], to_cells[moves])
+    idxs_a, idxs_b = _equal_key_pairs((move_t[moves] * num_cells + low) * num_cells + high)
+    idxs_a, idxs_b = moves[idxs_a], moves[idxs_b]
+    swapped = from_cells[idxs_a] != from_cells[idxs_b]
+    edge_t = move_t[idxs_a][swapped]
+    collisions.append(np.stack([edge_t, np.full_like(edge_t, EDGE_CONFLICT),
+                                idxs_a[swapped] // num_moves,
+                                idxs_b[swapped] // num_moves], axis=1))
+
+    result = np.concatenate(collisions)
+    result[:, 2:].sort(axis=1)
+    return result[np.lexsort(result.T[::-1])]
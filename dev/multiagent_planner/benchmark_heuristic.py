@@ -0,0 +1,46 @@
+"""Benchmark building the true distance heuristic for the bundled warehouses.
+
+Run from dev folder: `python -m multiagent_planner.benchmark_heuristic`
+Builds every warehouse's zones with the vectorized BFS, serially and over
+HEURISTIC_BUILD_PROCESSES processes, and times the queue BFS on COMPARE_GOALS of them.
+"""
+import glob
+import os
+import time
+from . import pathfinding_heuristic as pfh
+
+WAREHOUSES = sorted(glob.glob('warehouses/*.yaml'))
+COMPARE_GOALS = int(os.getenv("COMPARE_GOALS", default="20"))
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from warehouses.warehouse_loader import WorldInfo
+    for warehouse_yaml in WAREHOUSES:
+        world_info = WorldInfo.from_yaml(warehouse_yaml)
+        grid = world_info.world_grid
+        zones = list(dict.fromkeys(world_info.get_all_zones()))
+        print(f'{warehouse_yaml} {grid.shape}, {len(zones)} zones')
+
+        t_start = time.perf_counter()
+        store = pfh.HeuristicStore.build(grid, zones, processes=1)
+        duration_ms = (time.perf_counter() - t_start) * 1000
+        print(f'  vectorized: {duration_ms:9.1f} ms')
+        if pfh.HEURISTIC_BUILD_PROCESSES > 1:
+            t_start = time.perf_counter()
+            pfh.HeuristicStore.build(grid, zones, processes=pfh.HEURISTIC_BUILD_PROCESSES)
+            duration_ms = (time.perf_counter() - t_start) * 1000
+            print(f'  {pfh.HEURISTIC_BUILD_PROCESSES} processes: {duration_ms:9.1f} ms')
+
+        # Queue BFS on a few zones, scaled up to all of them
+        compare_zones = zones[:COMPARE_GOALS]
+        t_start = time.perf_counter()
+        matches = all((pfh.get_distances(grid, zone) == store[zone].to_array()).all()
+                      for zone in compare_zones)
+        duration_ms = (time.perf_counter() - t_start) * 1000 * len(zones) / len(compare_zones)
+        print(f'  queue BFS:  {duration_ms:9.1f} ms (estimated), '
+              f'{"matches" if matches else "DIFFERS"} on {len(compare_zones)} zones')
+
+
+if __name__ == '__main__':
+    main()
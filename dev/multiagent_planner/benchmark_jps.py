@@ -0,0 +1,54 @@
+"""Benchmark Jump Point Search against astar on the bundled warehouses.
+
+Run from dev folder: `python -m multiagent_planner.benchmark_jps`
+Plans BENCHMARK_PATHS paths from random robot homes to random item load zones with astar and
+jps, both with the manhattan heuristic, comparing durations, cells expanded and path lengths.
+"""
+import glob
+import os
+import random
+import time
+from . import pathfinding
+
+WAREHOUSES = sorted(glob.glob('warehouses/*.yaml'))
+BENCHMARK_PATHS = int(os.getenv("BENCHMARK_PATHS", default="100"))
+
+
+def run_search(search, grid, pairs) -> tuple[float, int, list[int]]:
+    """Plan a path for each pair, returning the duration in ms, cells expanded and path
+    lengths."""
+    cells_visited = 0
+    lengths = []
+    t_start = time.perf_counter()
+    for start, goal in pairs:
+        stats: dict = {}
+        path = search(grid, start, goal, heuristic=pathfinding.get_manhattan_heuristic(goal),
+                      stats=stats)
+        cells_visited += stats['cells_visited']
+        lengths.append(len(path))
+    return (time.perf_counter() - t_start) * 1000, cells_visited, lengths
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from warehouses.warehouse_loader import WorldInfo
+    random.seed(0)
+    for warehouse_yaml in WAREHOUSES:
+        world_info = WorldInfo.from_yaml(warehouse_yaml)
+        grid = world_info.world_grid
+        homes = [(int(row), int(col)) for row, col in world_info.robot_home_zones]
+        items = [(int(row), int(col)) for row, col in world_info.item_load_zones]
+        if not homes or not items:
+            continue
+        pairs = [(random.choice(homes), random.choice(items)) for _ in range(BENCHMARK_PATHS)]
+        pathfinding.get_jump_grid(grid)  # Build the cached jump grid outside the timings
+        astar_ms, astar_cells, astar_lengths = run_search(pathfinding.astar, grid, pairs)
+        jps_ms, jps_cells, jps_lengths = run_search(pathfinding.jps, grid, pairs)
+        print(f'{warehouse_yaml} {grid.shape}, {len(pairs)} paths, '
+              f'same lengths: {astar_lengths == jps_lengths}')
+        print(f'  astar: {astar_ms:7.1f} ms ({astar_cells} cells), '
+              f'jps: {jps_ms:7.1f} ms ({jps_cells} cells)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Benchmark tasks completed per tick without lanes, with lane costs and with hard lanes.
+
+Run from dev folder: `python -m multiagent_planner.benchmark_lanes`
+Simulates robots of BENCHMARK_WAREHOUSE like benchmark_traffic (see there for
+BENCHMARK_ROBOTS and BENCHMARK_TICKS), without traffic costs. Lanes are the warehouse's lanes
+layer, or generated along its two-wide aisles if it has none. Each LANE_COSTS cost runs with
+lanes of that cost, 0 being hard lanes with the heuristic built along them, and 'none'
+without lanes.
+"""
+import os
+import time
+from .benchmark_traffic import BENCHMARK_ROBOTS, BENCHMARK_TICKS, BENCHMARK_WAREHOUSE, simulate
+from .lanes import Lanes
+from .pathfinding_heuristic import HeuristicStore
+
+LANE_COSTS = os.getenv("LANE_COSTS", default="none,1,2,0").split(',')
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from warehouses.warehouse_loader import WorldInfo
+    world_info = WorldInfo.from_yaml(BENCHMARK_WAREHOUSE)
+    grid = world_info.world_grid
+    homes = [(int(row), int(col)) for row, col in world_info.robot_home_zones]
+    items = [(int(row), int(col)) for row, col in world_info.item_load_zones]
+    stations = [(int(row), int(col)) for row, col in world_info.station_zones]
+    heuristic = HeuristicStore.build(grid, items + stations)
+    print(f'{BENCHMARK_WAREHOUSE} {grid.shape}, {min(BENCHMARK_ROBOTS, len(homes))} robots, '
+          f'{BENCHMARK_TICKS} ticks, lanes from '
+          f'{"its lanes layer" if world_info.lanes is not None else "its aisles"}')
+    for cost in LANE_COSTS:
+        lanes = None if cost == 'none' else Lanes.from_world_info(world_info, float(cost))
+        lane_heuristic = heuristic
+        if lanes is not None and lanes.hard:
+            t_start = time.perf_counter()
+            lane_heuristic = HeuristicStore.build(grid, items + stations,
+                                                  blocked_moves=lanes.blocked_moves)
+            print(f'  Built heuristic along lanes in {time.perf_counter() - t_start:.2f} s')
+        tasks, waits, failures, t_plan = simulate(grid, homes, items, stations, lane_heuristic,
+                                                  0, lanes=lanes)
+        name = 'none' if lanes is None else 'hard' if lanes.hard else f'{lanes.cost:4.2f}'
+        print(f'  lanes {name:>4}: {tasks:4d} tasks ({tasks / BENCHMARK_TICKS:.3f} per tick), '
+              f'{waits:6d} waits, {failures:5d} failed, planning {t_plan:6.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark MAPF solvers (mapf2, mapf_cbs, mapf_ecbs) on bundled scenarios and warehouses.
+
+Run from dev folder: `python -m multiagent_planner.benchmark_mapf`
+Warehouse runs plan robots from their homes to random item load zones, set
+BENCHMARK_ROBOTS to change how many robots, and ECBS_W for the ECBS suboptimality factor.
+"""
+import os
+import random
+import time
+from . import cbs, pathfinding
+from .multiagent import get_scenario
+
+SCENARIOS = ['scenario2', 'scenario3', 'scenario4', 'scenario5']
+WAREHOUSES = ['warehouses/warehouse3.yaml', 'warehouses/warehouse_100_robots.yaml']
+BENCHMARK_ROBOTS = int(os.getenv("BENCHMARK_ROBOTS", default="30"))
+ECBS_W = float(os.getenv("ECBS_W", default="1.5"))
+MAX_SECONDS = float(os.getenv("MAX_SECONDS", default="10"))
+
+
+def run_solver(name: str, grid, starts, goals) -> str:
+    """Run solver by name, returning a one line summary of its results."""
+    stats: dict = {}
+    t_start = time.perf_counter()
+    if name == 'mapf2':
+        paths = pathfinding.mapf2(grid, starts, goals, maxiter=100, max_time=100)
+    elif name == 'mapf_cbs':
+        paths = cbs.mapf_cbs(grid, starts, goals, max_seconds=MAX_SECONDS, stats=stats)
+    else:
+        paths = cbs.mapf_ecbs(grid, starts, goals, w=ECBS_W, max_seconds=MAX_SECONDS,
+                              stats=stats)
+    duration_ms = (time.perf_counter() - t_start) * 1000
+    collisions = pathfinding.find_all_collisions(paths)
+    reached = sum(1 for path, goal in zip(paths, goals) if path and path[-1] == goal)
+    # Sum of costs up to the last step each path is away from its goal
+    cost = sum(max((t for t, pos in enumerate(path) if pos != goal), default=-1) + 1
+               for path, goal in zip(paths, goals) if path)
+    return (f'{name:>9}: {duration_ms:9.1f} ms, {len(collisions):3d} collisions, '
+            f'{reached}/{len(goals)} at goal, sum of costs {cost}'
+            f'{", expanded " + str(stats["nodes_expanded"]) if stats else ""}')
+
+
+def main():
+    solvers = ['mapf2', 'mapf_cbs', 'mapf_ecbs']
+    for scenario in SCENARIOS:
+        grid, goals, starts = get_scenario(f'multiagent_planner/scenarios/{scenario}.yaml')
+        print(f'{scenario} {grid.shape}, {len(starts)} robots')
+        for solver in solvers:
+            print(run_solver(solver, grid, starts, goals))
+
+    # pylint: disable=import-outside-toplevel
+    from warehouses.warehouse_loader import load_warehouse_yaml
+    random.seed(0)
+    for warehouse_yaml in WAREHOUSES:
+        grid, robot_home_zones, item_load_zones, _ = load_warehouse_yaml(warehouse_yaml)
+        count = min(BENCHMARK_ROBOTS, len(robot_home_zones), len(item_load_zones))
+        starts = random.sample(robot_home_zones, count)
+        goals = random.sample(item_load_zones, count)
+        starts = [(int(row), int(col)) for row, col in starts]
+        goals = [(int(row), int(col)) for row, col in goals]
+        print(f'{warehouse_yaml} {grid.shape}, {count} robots')
+        for solver in solvers:
+            print(run_solver(solver, grid, starts, goals))
+
+
+if __name__ == '__main__':
+    main()
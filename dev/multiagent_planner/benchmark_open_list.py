@@ -0,0 +1,72 @@
+"""Benchmark the open lists of the A* searches on the bundled warehouses.
+
+Run from dev folder: `python -m multiagent_planner.benchmark_open_list`
+Plans BENCHMARK_PATHS paths from random robot homes to random item load zones with astar and
+st_astar_flat for each of OPEN_LISTS, guided by the true distance heuristic, or the
+manhattan heuristic if MANHATTAN is set. st_astar_flat reserves each path as it goes, so
+later paths search around earlier ones.
+"""
+import glob
+import os
+import random
+import time
+from . import pathfinding
+from . import pathfinding_heuristic as pfh
+from .open_list import OPEN_LISTS
+from .reservation_table import ReservationTable
+
+WAREHOUSES = sorted(glob.glob('warehouses/*.yaml'))
+BENCHMARK_PATHS = int(os.getenv("BENCHMARK_PATHS", default="100"))
+MANHATTAN = bool(int(os.getenv("MANHATTAN", default="0")))
+MAX_TIME = 500
+
+
+def run_search(name: str, open_list: str, grid, pairs, heuristic) -> str:
+    """Plan a path for each pair, returning a summary of the duration and cells visited."""
+    reservations = ReservationTable(grid.shape, horizon=MAX_TIME + 1)
+    cells_visited = 0
+    t_start = time.perf_counter()
+    for start, goal in pairs:
+        if MANHATTAN:
+            heuristic_function = pathfinding.get_manhattan_heuristic(goal)
+        else:
+            heuristic_function = heuristic[goal].__getitem__
+        if name == 'astar':
+            pathfinding.astar(grid, start, goal, heuristic=heuristic_function,
+                              open_list=open_list)
+            continue
+        stats: dict = {}
+        path = pathfinding.st_astar_flat(
+            grid, start, goal, reservations, end_fast=True, max_time=MAX_TIME,
+            max_cells=100000, heuristic=heuristic_function, stats=stats, validate_ends=False,
+            open_list=open_list)
+        reservations.reserve_path(path)
+        cells_visited += stats['cells_visited']
+    duration_ms = (time.perf_counter() - t_start) * 1000
+    return f'{open_list} {duration_ms:7.1f} ms' + (
+        f' ({cells_visited} cells)' if cells_visited else '')
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from warehouses.warehouse_loader import WorldInfo
+    random.seed(0)
+    for warehouse_yaml in WAREHOUSES:
+        world_info = WorldInfo.from_yaml(warehouse_yaml)
+        grid = world_info.world_grid
+        homes = [(int(row), int(col)) for row, col in world_info.robot_home_zones]
+        items = [(int(row), int(col)) for row, col in world_info.item_load_zones]
+        if not homes or not items:
+            continue
+        pairs = [(random.choice(homes), random.choice(items)) for _ in range(BENCHMARK_PATHS)]
+        heuristic = pfh.HeuristicStore.build(grid, list({goal for _, goal in pairs}))
+        pathfinding.get_flat_grid(grid)  # Build the cached flat grid outside the timings
+        print(f'{warehouse_yaml} {grid.shape}, {len(pairs)} paths')
+        for name in ['astar', 'st_astar_flat']:
+            results = [run_search(name, open_list, grid, pairs, heuristic)
+                       for open_list in OPEN_LISTS]
+            print(f'  {name:>13}: ' + ', '.join(results))
+
+
+if __name__ == '__main__':
+    main()
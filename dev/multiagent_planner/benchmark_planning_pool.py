@@ -0,0 +1,76 @@
+"""Benchmark planning a batch of job paths serially and with the planning pool.
+
+Run from dev folder: `python -m multiagent_planner.benchmark_planning_pool`
+Plans BENCHMARK_PATHS paths from random robot homes to random item load zones of
+BENCHMARK_WAREHOUSE, serially reserving each path as it goes like the robot allocator, then
+with a PlanningPool of each of BENCHMARK_PROCESSES processes, committing the pool paths in
+order and replanning those that conflict with paths committed before them.
+"""
+import os
+import random
+import time
+from .pathfinding_heuristic import HeuristicStore
+from .planning_pool import PlanningPool, plan_path
+from .reservation_table import ReservationTable
+
+BENCHMARK_WAREHOUSE = os.getenv("BENCHMARK_WAREHOUSE",
+                                default="warehouses/warehouse_1k_robots.yaml")
+BENCHMARK_PATHS = int(os.getenv("BENCHMARK_PATHS", default="200"))
+BENCHMARK_PROCESSES = [int(processes) for processes in
+                       os.getenv("BENCHMARK_PROCESSES", default="1,2,4").split(',')]
+MAX_STEPS = 500
+
+
+def commit_path(reservations: ReservationTable, path, owner: int):
+    reservations.reserve_path(path, t_start=1, buffer=1, owner=owner)
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from warehouses.warehouse_loader import WorldInfo
+    random.seed(0)
+    world_info = WorldInfo.from_yaml(BENCHMARK_WAREHOUSE)
+    grid = world_info.world_grid
+    homes = [(int(row), int(col)) for row, col in world_info.robot_home_zones]
+    items = [(int(row), int(col)) for row, col in world_info.item_load_zones]
+    requests = [(random.choice(homes), random.choice(items)) for _ in range(BENCHMARK_PATHS)]
+    heuristic = HeuristicStore.build(grid, list({goal for _, goal in requests}))
+    static_obstacles = set(homes + items)
+    print(f'{BENCHMARK_WAREHOUSE} {grid.shape}, {len(requests)} paths, '
+          f'{os.cpu_count()} cpus')
+
+    def plan(pos_a, pos_b, reservations):
+        return plan_path(grid, pos_a, pos_b, reservations, static_obstacles, heuristic[pos_b],
+                         max_steps=MAX_STEPS, t_start=1)
+
+    reservations = ReservationTable(grid.shape, horizon=MAX_STEPS + 3)
+    plan(*requests[0], reservations)  # Build the cached flat grid outside the timings
+    t_start = time.perf_counter()
+    for owner, (pos_a, pos_b) in enumerate(requests):
+        commit_path(reservations, plan(pos_a, pos_b, reservations), owner)
+    duration_ms = (time.perf_counter() - t_start) * 1000
+    print(f'         serial: {duration_ms:8.1f} ms')
+
+    for processes in BENCHMARK_PROCESSES:
+        reservations.clear()
+        with PlanningPool(grid, heuristic, reservations.horizon, processes) as pool:
+            pool.plan_paths(requests[:processes], reservations, static_obstacles,
+                            max_steps=MAX_STEPS, t_start=1)  # Warm up the workers
+            t_start = time.perf_counter()
+            paths = pool.plan_paths(requests, reservations, static_obstacles,
+                                    max_steps=MAX_STEPS, t_start=1)
+            t_planned = time.perf_counter()
+            replanned = 0
+            for owner, ((pos_a, pos_b), path) in enumerate(zip(requests, paths)):
+                if pool.path_conflicts(path, 1, reservations):
+                    path = plan(pos_a, pos_b, reservations)
+                    replanned += 1
+                commit_path(reservations, path, owner)
+            t_end = time.perf_counter()
+        print(f'  {processes:2d} processes: {(t_end - t_start) * 1000:8.1f} ms '
+              f'(pool {(t_planned - t_start) * 1000:.1f} ms, '
+              f'replanned {replanned}/{len(requests)})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark tasks completed per tick with and without traffic costs.
+
+Run from dev folder: `python -m multiagent_planner.benchmark_traffic`
+Simulates BENCHMARK_ROBOTS robots of BENCHMARK_WAREHOUSE for BENCHMARK_TICKS world steps,
+each repeatedly going to a random free item load zone and then a random free station, which
+completes its task. Paths are planned like the robot allocator, one robot at a time against
+the reservations of the others, from the next step with waits in place costing 0.9. Each
+TRAFFIC_WEIGHTS weight runs with a TrafficMap of that weight, 0 without one.
+"""
+import os
+import random
+import time
+from typing import Optional
+from .lanes import Lanes
+from .pathfinding_heuristic import HeuristicStore
+from .planning_pool import plan_path
+from .reservation_table import ReservationTable
+from .traffic_map import TRAFFIC_DECAY, TrafficMap
+
+BENCHMARK_WAREHOUSE = os.getenv("BENCHMARK_WAREHOUSE",
+                                default="warehouses/warehouse_200_robots.yaml")
+BENCHMARK_ROBOTS = int(os.getenv("BENCHMARK_ROBOTS", default="100"))
+BENCHMARK_TICKS = int(os.getenv("BENCHMARK_TICKS", default="300"))
+TRAFFIC_WEIGHTS = [float(weight) for weight in
+                   os.getenv("TRAFFIC_WEIGHTS", default="0,0.05,0.1,0.2").split(',')]
+MAX_STEPS = 200
+
+
+def simulate(grid, homes, items, stations, heuristic, weight: float, seed: int = 0,
+             lanes: Optional[Lanes] = None):
+    """Return tasks completed, total steps waited, searches that found no path and the
+    planning time in seconds. Searches follow lanes if given."""
+    rng = random.Random(seed)
+    static_obstacles = set(homes + items + stations)
+    reservations = ReservationTable(grid.shape, horizon=MAX_STEPS + 3)
+    traffic = TrafficMap(grid.shape, decay=TRAFFIC_DECAY, weight=weight) if weight else None
+    positions = list(homes[:BENCHMARK_ROBOTS])
+    paths: list[list] = [[] for _ in positions]
+    goals: list = [None] * len(positions)
+    picked = [False] * len(positions)  # Holding an item, headed to a station
+    tasks = waits = failures = 0
+    t_plan = 0.0
+    for t in range(BENCHMARK_TICKS):
+        reservations.advance(t - reservations.t_start)
+        if traffic is not None:
+            traffic.advance(t - traffic.t)
+        taken = {goal for goal in goals if goal is not None} | set(positions)
+        for robot in rng.sample(range(len(positions)), len(positions)):
+            if paths[robot]:
+                continue
+            pos = positions[robot]
+            if goals[robot] == pos:
+                tasks += picked[robot]
+                picked[robot] = not picked[robot]
+                goals[robot] = None
+            if goals[robot] is None:
+                free = [zone for zone in (stations if picked[robot] else items)
+                        if zone not in taken]
+                if not free:
+                    continue
+                goals[robot] = rng.choice(free)
+                taken.add(goals[robot])
+            t_start = time.perf_counter()
+            path = plan_path(grid, pos, goals[robot], reservations, static_obstacles,
+                             heuristic[goals[robot]], max_steps=MAX_STEPS, t_start=t + 1,
+                             traffic=traffic, lanes=lanes)
+            t_plan += time.perf_counter() - t_start
+            failures += not path
+            if path:
+                paths[robot] = path
+                reservations.reserve_path(path, t_start=t + 1, buffer=1, owner=robot)
+                if traffic is not None:
+                    traffic.add_path(path)
+        for robot, path in enumerate(paths):
+            if path:
+                next_pos = path.pop(0)
+                waits += next_pos == positions[robot]
+                positions[robot] = next_pos
+    return tasks, waits, failures, t_plan
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from warehouses.warehouse_loader import WorldInfo
+    world_info = WorldInfo.from_yaml(BENCHMARK_WAREHOUSE)
+    grid = world_info.world_grid
+    homes = [(int(row), int(col)) for row, col in world_info.robot_home_zones]
+    items = [(int(row), int(col)) for row, col in world_info.item_load_zones]
+    stations = [(int(row), int(col)) for row, col in world_info.station_zones]
+    heuristic = HeuristicStore.build(grid, items + stations)
+    print(f'{BENCHMARK_WAREHOUSE} {grid.shape}, {min(BENCHMARK_ROBOTS, len(homes))} robots, '
+          f'{BENCHMARK_TICKS} ticks, decay {TRAFFIC_DECAY}')
+    for weight in TRAFFIC_WEIGHTS:
+        tasks, waits, failures, t_plan = simulate(grid, homes, items, stations, heuristic,
+                                                  weight)
+        print(f'  weight {weight:4.2f}: {tasks:4d} tasks ({tasks / BENCHMARK_TICKS:.3f} per '
+              f'tick), {waits:6d} waits, {failures:5d} failed, planning {t_plan:6.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,506 @@
+"""Conflict-Based Search (CBS) and its bounded-suboptimal Enhanced CBS (ECBS) variant,
+finding collision free paths for all agents at once.
+
+The high level searches a tree of constraints on single agents, splitting on conflicts
+between their paths, while the low level (constrained_st_astar) plans one agent's path
+under its constraints over flat grid cells.
+"""
+import heapq
+import time
+from collections import defaultdict
+from typing import Optional
+from .flat_grid import NO_CELL, FlatGrid, get_flat_grid
+from .pathfinding import EDGE_CONFLICT, VERTEX_CONFLICT, Path
+
+# Conflict between two agents paths as (t, kind, agent_1, agent_2, cell_1, cell_2), where kind
+# is VERTEX_CONFLICT with cell_1 == cell_2 the shared cell, or EDGE_CONFLICT where agent_1
+# moves cell_1 -> cell_2 arriving at t while agent_2 moves the other way.
+Conflict = tuple[int, int, int, int, int, int]
+# Constraint on an agent as (from_cell, to_cell, t), a vertex constraint if from_cell is NO_CELL
+Constraint = tuple[int, int, int]
+
+
+class PathIndex:
+    """Index of which agents are at each (cell, t) of a set of flat grid paths.
+
+    Agents stay at the last cell of their path after it ends, as robots wait at their goal.
+    Paths are tracked by identity, so syncing to another set of paths only touches the
+    agents whose path changed.
+    """
+
+    def __init__(self) -> None:
+        self.paths: dict[int, list[int]] = {}
+        self.visits: dict[int, dict[int, set[int]]] = defaultdict(dict)  # cell -> t -> agents
+        self.resting: dict[int, dict[int, int]] = defaultdict(dict)  # cell -> agent -> from t
+
+    def set_path(self, agent: int, path: list[int]):
+        """Set the path for agent, replacing its previous one."""
+        old_path = self.paths.get(agent)
+        if old_path is path:
+            return
+        if old_path is not None:
+            for t, cell in enumerate(old_path):
+                agents = self.visits[cell][t]
+                agents.discard(agent)
+                if not agents:
+                    del self.visits[cell][t]
+            del self.resting[old_path[-1]][agent]
+        self.paths[agent] = path
+        for t, cell in enumerate(path):
+            self.visits[cell].setdefault(t, set()).add(agent)
+        self.resting[path[-1]][agent] = len(path)
+
+    def sync(self, paths: list[list[int]]):
+        """Update the index to the given paths, indexed by agent."""
+        for agent, path in enumerate(paths):
+            self.set_path(agent, path)
+
+    def agents_at(self, cell: int, t: int) -> list[int]:
+        """Agents at cell at time t, including those resting there."""
+        agents = list(self.visits[cell].get(t, ()))
+        for agent, t_rest in self.resting[cell].items():
+            if t_rest <= t:
+                agents.append(agent)
+        return agents
+
+    def count_conflicts(self, agent: int, from_cell: int, to_cell: int, t: int) -> int:
+        """Number of other agents that agent runs into moving from_cell -> to_cell at t."""
+        count = 0
+        to_visits = self.visits.get(to_cell)
+        if to_visits:
+            agents = to_visits.get(t)
+            if agents:
+                count += len(agents) - (agent in agents)
+            if from_cell != to_cell:
+                swapping = to_visits.get(t - 1)
+                from_visits = self.visits.get(from_cell)
+                if swapping and from_visits and t in from_visits:
+                    count += len((swapping & from_visits[t]) - {agent})
+        resting = self.resting.get(to_cell)
+        if resting:
+            for other, t_rest in resting.items():
+                if t_rest <= t and other != agent:
+                    count += 1
+        return count
+
+    def find_conflicts(self, agent: int, path: list[int]) -> list[Conflict]:
+        """All conflicts of agent taking path with the other agents in the index."""
+        conflicts: list[Conflict] = []
+        for t, cell in enumerate(path):
+            for other in self.agents_at(cell, t):
+                if other != agent:
+                    conflicts.append((t, VERTEX_CONFLICT, agent, other, cell, cell))
+            prev_cell = path[t - 1] if t > 0 else cell
+            if prev_cell != cell:
+                swapping = self.visits[cell].get(t - 1)
+                if swapping:
+                    for other in swapping & self.visits[prev_cell].get(t, set()):
+                        if other != agent:
+                            conflicts.append((t, EDGE_CONFLICT, agent, other, prev_cell, cell))
+        # Other agents passing through the goal after agent has arrived and is waiting there
+        goal_cell = path[-1]
+        for t, agents in self.visits[goal_cell].items():
+            if t >= len(path):
+                for other in agents:
+                    if other != agent:
+                        conflicts.append((t, VERTEX_CONFLICT, agent, other, goal_cell, goal_cell))
+        for other, t_rest in self.resting[goal_cell].items():
+            if other != agent and t_rest > len(path):
+                # Both end up waiting at the same goal
+                conflicts.append((t_rest, VERTEX_CONFLICT, agent, other, goal_cell, goal_cell))
+        return conflicts
+
+
+def get_conflict_constraints(conflict: Conflict) -> list[tuple[int, Constraint]]:
+    """Return the (agent, constraint) pairs that each resolve a conflict for one of its agents."""
+    t, kind, agent_1, agent_2, cell_1, cell_2 = conflict
+    if kind == VERTEX_CONFLICT:
+        return [(agent_1, (NO_CELL, cell_1, t)), (agent_2, (NO_CELL, cell_1, t))]
+    return [(agent_1, (cell_1, cell_2, t)), (agent_2, (cell_2, cell_1, t))]
+
+
+def get_constraint_sets(constraints: tuple[Constraint, ...], goal_cell: int,
+                        T: int) -> tuple[set[int], set[Constraint], int]:
+    """Split constraints into vertex keys `cell * T + t`, edge constraints, and the first time
+    the agent can arrive at its goal and wait there without breaking a vertex constraint."""
+    vertex_constraints: set[int] = set()
+    edge_constraints: set[Constraint] = set()
+    min_goal_t = 0
+    for from_cell, to_cell, t in constraints:
+        if from_cell == NO_CELL:
+            vertex_constraints.add(to_cell * T + t)
+            if to_cell == goal_cell:
+                min_goal_t = max(min_goal_t, t + 1)
+        else:
+            edge_constraints.add((from_cell, to_cell, t))
+    return vertex_constraints, edge_constraints, min_goal_t
+
+
+def constrained_st_astar(flat_grid: FlatGrid, start_cell: int, goal_cell: int,
+                         goal_dists: list[int], constraints: tuple[Constraint, ...],
+                         max_time: int, max_cells=10000,
+                         path_index: Optional[PathIndex] = None,
+                         agent: int = -1, w: float = 1.0,
+                         stats: dict = None) -> Optional[list[int]]:
+    """Space-Time focal search over flat grid cells for an agent under CBS constraints.
+
+    Moves and waits both cost one step, the path ends once the agent can wait at its goal for
+    good. Nodes with f-score within w times the lowest f-score are in the focal list, which
+    is searched fewest conflicts with the other agents in path_index first. With w=1 this is
+    A* breaking ties on fewer conflicts, for w > 1 path cost is within w of optimal.
+
+    Args:
+        flat_grid (FlatGrid): Grid to path through
+        start_cell (int): Start flat cell
+        goal_cell (int): Goal flat cell
+        goal_dists (list[int]): BFS distances to goal_cell, -1 if unreachable
+        constraints (tuple[Constraint, ...]): Vertex/Edge constraints the path must satisfy
+        max_time (int): Max time step of the path
+        max_cells (int, optional): max cells to visit. Defaults to 10000.
+        path_index (PathIndex, optional): Other agent paths to avoid conflicts with
+        agent (int, optional): This agent, excluded from path_index conflicts
+        w (float, optional): Suboptimality factor for the focal list. Defaults to 1.0.
+        stats (dict, optional): store run-time stats here if it exists, including
+            'lower_bound' on the optimal path cost. Defaults to None.
+
+    Returns:
+        Optional[list[int]]: flat cells from start to goal, or None if no path was found.
+    """
+    T = max_time + 1
+    vertex_constraints, edge_constraints, min_goal_t = get_constraint_sets(
+        constraints, goal_cell, T)
+    successors = flat_grid.successors
+    if goal_dists[start_cell] < 0:
+        return None
+
+    start_key = start_cell * T
+    path_track: dict[int, Optional[int]] = {start_key: None}
+    best_conflicts = {start_key: 0}
+    closed: set[int] = set()
+    start_f = max(goal_dists[start_cell], min_goal_t)
+    # Every open node by f-score for the lower bound, all nodes of a key share the same f-score
+    open_list: list[tuple[int, int]] = [(start_f, start_key)]
+    # Nodes not yet in focal as f-score, conflicts, -t (deeper first), key
+    pending: list[tuple[int, int, int, int]] = [(start_f, 0, 0, start_key)]
+    # Focal list as conflicts, f-score, -t, key
+    focal: list[tuple[int, int, int, int]] = []
+
+    path = None
+    f_min = start_f
+    cells_visited = 0
+    while cells_visited < max_cells:
+        while open_list and open_list[0][1] in closed:
+            heapq.heappop(open_list)
+        if not open_list:
+            break
+        f_min = open_list[0][0]
+        f_bound = w * f_min
+        while pending and pending[0][0] <= f_bound:
+            f_score, conflicts, neg_t, key = heapq.heappop(pending)
+            heapq.heappush(focal, (conflicts, f_score, neg_t, key))
+        conflicts, _, _, key = heapq.heappop(focal)
+        if key in closed or best_conflicts[key] < conflicts:
+            continue
+        closed.add(key)
+        cells_visited += 1
+        cell, t = divmod(key, T)
+        if cell == goal_cell and t >= min_goal_t:
+            path = []
+            while key is not None:
+                path.append(key // T)
+                key = path_track[key]
+            path.reverse()
+            break
+
+        t_next = t + 1
+        for neighbor_cell in successors[cell]:
+            h_score = goal_dists[neighbor_cell]
+            if h_score < 0 or t_next + h_score > max_time:
+                continue
+            neighbor = neighbor_cell * T + t_next
+            if neighbor in closed or neighbor in vertex_constraints:
+                continue
+            if edge_constraints and (cell, neighbor_cell, t_next) in edge_constraints:
+                continue
+            neighbor_conflicts = conflicts
+            if path_index is not None:
+                neighbor_conflicts += path_index.count_conflicts(
+                    agent, cell, neighbor_cell, t_next)
+            previous_conflicts = best_conflicts.get(neighbor)
+            if previous_conflicts is not None and previous_conflicts <= neighbor_conflicts:
+                continue
+            best_conflicts[neighbor] = neighbor_conflicts
+            path_track[neighbor] = key
+            f_score = max(t_next + h_score, min_goal_t)
+            if previous_conflicts is None:
+                heapq.heappush(open_list, (f_score, neighbor))
+            heapq.heappush(pending, (f_score, neighbor_conflicts, -t_next, neighbor))
+
+    if stats is not None:
+        stats['cells_visited'] = cells_visited
+        stats['lower_bound'] = f_min
+    return path
+
+
+def get_mdd_layers(flat_grid: FlatGrid, start_cell: int, goal_cell: int, goal_dists: list[int],
+                   constraints: tuple[Constraint, ...], cost: int, T: int) -> list[set[int]]:
+    """Multi-value decision diagram of all paths of the given cost under constraints,
+    as the set of cells the agent can be in at each time step."""
+    vertex_constraints, edge_constraints, _ = get_constraint_sets(constraints, goal_cell, T)
+    successors = flat_grid.successors
+    layers = [{start_cell}]
+    for t in range(1, cost + 1):
+        layer = set()
+        for cell in layers[-1]:
+            for neighbor_cell in successors[cell]:
+                h_score = goal_dists[neighbor_cell]
+                if (h_score < 0 or t + h_score > cost or
+                        neighbor_cell * T + t in vertex_constraints or
+                        (cell, neighbor_cell, t) in edge_constraints):
+                    continue
+                layer.add(neighbor_cell)
+        layers.append(layer)
+    # Keep only cells that lead to the goal at cost
+    layers[cost] &= {goal_cell}
+    for t in range(cost - 1, -1, -1):
+        layers[t] = {cell for cell in layers[t] if any(
+            neighbor_cell in layers[t + 1] and (cell, neighbor_cell, t + 1) not in edge_constraints
+            for neighbor_cell in successors[cell])}
+    return layers
+
+
+class ConstraintTreeNode:
+    """High-level CBS node, with paths for all agents under this node's constraints."""
+
+    def __init__(self, paths: list[list[int]], constraints: list[tuple[Constraint, ...]],
+                 conflicts: list[Conflict], lower_bounds: list[int]) -> None:
+        self.paths = paths
+        self.constraints = constraints  # constraints[agent] = (constraint, ...)
+        self.conflicts = conflicts
+        self.lower_bounds = lower_bounds  # Per agent lower bound on optimal path cost
+        self.cost = sum(len(path) - 1 for path in paths)  # Sum of costs
+        self.lower_bound = sum(lower_bounds)
+        self.expanded = False
+
+
+def conflict_based_search(grid, starts, goals, w: float = 1.0, max_time=100, max_nodes=1000,
+                          max_seconds: Optional[float] = None, max_cells=10000,
+                          stats: dict = None) -> list[Path]:
+    """Conflict-Based Search with focal lists, shared by mapf_cbs and mapf_ecbs.
+
+    High level searches a constraint tree, splitting a conflict into two children that each
+    add a constraint to one of its agents and replan it with constrained_st_astar.
+    Nodes with cost within w times the lowest lower bound are in the focal list, which is
+    searched fewest conflicts first. With w=1 this is optimal CBS, splitting cardinal
+    conflicts first (per agent MDDs), otherwise the earliest conflict is split.
+    Conflicts are tracked per node and updated only for the replanned agent, and children
+    with the same cost and fewer conflicts are taken in place by bypassing.
+
+    Returns:
+        list[Path]: paths for each agent, waiting at their goal after their path ends. If the
+            budget runs out these are from the node with fewest conflicts, check stats['solved'].
+            Empty list if some agent has no path at all.
+    """
+    assert len(starts) == len(goals)
+    t_begin = time.perf_counter()
+    flat_grid = get_flat_grid(grid)
+    T = max_time + 1
+    start_cells = [flat_grid.cell(start) for start in starts]
+    goal_cells = [flat_grid.cell(goal) for goal in goals]
+    dists_by_goal: dict[int, list[int]] = {}
+    for goal_cell in goal_cells:
+        if goal_cell not in dists_by_goal:
+            dists_by_goal[goal_cell] = flat_grid.distances_from(goal_cell)
+
+    path_index = PathIndex()
+    low_level_stats: dict = {}
+
+    def replan(agent: int, constraints: tuple[Constraint, ...]) -> Optional[list[int]]:
+        return constrained_st_astar(
+            flat_grid, start_cells[agent], goal_cells[agent], dists_by_goal[goal_cells[agent]],
+            constraints, max_time, max_cells, path_index, agent, w, low_level_stats)
+
+    # Root paths planned in order, each avoiding conflicts with the ones before it
+    paths: list[list[int]] = []
+    conflicts: list[Conflict] = []
+    lower_bounds: list[int] = []
+    for agent in range(len(starts)):
+        path = replan(agent, ())
+        if path is None:
+            return []
+        conflicts.extend(path_index.find_conflicts(agent, path))
+        path_index.set_path(agent, path)
+        paths.append(path)
+        lower_bounds.append(low_level_stats['lower_bound'])
+    root = ConstraintTreeNode(paths, [()] * len(starts), conflicts, lower_bounds)
+
+    mdd_cache: dict[tuple[int, tuple[Constraint, ...], int], list[set[int]]] = {}
+
+    def is_cardinal(node: ConstraintTreeNode, agent: int, conflict: Conflict) -> bool:
+        """True if resolving conflict by constraining agent must increase its cost."""
+        t, kind, agent_1, _, cell_1, cell_2 = conflict
+        cost = len(node.paths[agent]) - 1
+        if t > cost:
+            return True  # Agent is waiting at its goal, so would need to arrive later
+        key = (agent, node.constraints[agent], cost)
+        layers = mdd_cache.get(key)
+        if layers is None:
+            layers = get_mdd_layers(flat_grid, start_cells[agent], goal_cells[agent],
+                                    dists_by_goal[goal_cells[agent]], node.constraints[agent],
+                                    cost, T)
+            mdd_cache[key] = layers
+        if kind == VERTEX_CONFLICT:
+            return layers[t] == {cell_1}
+        from_cell, to_cell = (cell_1, cell_2) if agent == agent_1 else (cell_2, cell_1)
+        return layers[t - 1] == {from_cell} and layers[t] == {to_cell}
+
+    def choose_conflict(node: ConstraintTreeNode) -> Conflict:
+        """Earliest conflict of the most cardinal ones, cardinal > semi-cardinal > other."""
+        if w > 1:
+            return min(node.conflicts)  # Paths aren't optimal, so their MDDs don't apply
+
+        def priority(conflict: Conflict):
+            cardinal = (is_cardinal(node, conflict[2], conflict) +
+                        is_cardinal(node, conflict[3], conflict))
+            return (-cardinal, conflict)
+        return min(node.conflicts, key=priority)
+
+    node_id = 0
+    # Every unexpanded node by lower bound, nodes not yet in focal by cost, and focal by
+    # number of conflicts
+    open_list = [(root.lower_bound, node_id, root)]
+    pending = [(root.cost, node_id, root)]
+    focal: list[tuple[int, int, int, ConstraintTreeNode]] = []
+    best_node = root
+    nodes_expanded = 0
+    solved = False
+    while True:
+        if nodes_expanded >= max_nodes:
+            break
+        if max_seconds is not None and time.perf_counter() - t_begin > max_seconds:
+            break
+        while open_list and open_list[0][2].expanded:
+            heapq.heappop(open_list)
+        if not open_list:
+            break
+        cost_bound = w * open_list[0][0]
+        while pending and pending[0][0] <= cost_bound:
+            cost, pending_id, pending_node = heapq.heappop(pending)
+            heapq.heappush(focal, (len(pending_node.conflicts), cost, pending_id, pending_node))
+        node = None
+        while focal:
+            _, _, _, node = heapq.heappop(focal)
+            if not node.expanded:
+                break
+            node = None
+        if node is None:
+            break
+        if len(node.conflicts) < len(best_node.conflicts):
+            best_node = node
+        if not node.conflicts:
+            best_node = node
+            solved = True
+            break
+        nodes_expanded += 1
+        node.expanded = True
+        path_index.sync(node.paths)
+        conflict = choose_conflict(node)
+
+        children = []
+        for agent, constraint in get_conflict_constraints(conflict):
+            constraints = node.constraints[agent] + (constraint,)
+            path = replan(agent, constraints)
+            if path is None:
+                continue
+            child_conflicts = [c for c in node.conflicts if agent != c[2] and agent != c[3]]
+            child_conflicts.extend(path_index.find_conflicts(agent, path))
+            child_paths = node.paths.copy()
+            child_paths[agent] = path
+            if (len(path) == len(node.paths[agent]) and
+                    len(child_conflicts) < len(node.conflicts)):
+                # Bypass, same cost with fewer conflicts, so take the path instead of branching
+                node.paths = child_paths
+                node.conflicts = child_conflicts
+                node.expanded = False
+                children = [node]
+                break
+            child_constraints = node.constraints.copy()
+            child_constraints[agent] = constraints
+            child_lower_bounds = node.lower_bounds.copy()
+            child_lower_bounds[agent] = max(low_level_stats['lower_bound'],
+                                            node.lower_bounds[agent])
+            children.append(ConstraintTreeNode(
+                child_paths, child_constraints, child_conflicts, child_lower_bounds))
+        for child in children:
+            node_id += 1
+            heapq.heappush(open_list, (child.lower_bound, node_id, child))
+            heapq.heappush(pending, (child.cost, node_id, child))
+
+    if stats is not None:
+        stats['nodes_expanded'] = nodes_expanded
+        stats['solved'] = solved
+        stats['cost'] = best_node.cost
+        stats['lower_bound'] = best_node.lower_bound
+        stats['conflicts'] = len(best_node.conflicts)
+        stats['duration_sec'] = time.perf_counter() - t_begin
+    positions = flat_grid.positions
+    return [[positions[cell] for cell in path] for path in best_node.paths]
+
+
+def mapf_cbs(grid, starts, goals, max_time=100, max_nodes=1000,
+             max_seconds: Optional[float] = None, max_cells=10000,
+             stats: dict = None) -> list[Path]:
+    """Conflict-Based Search for collision free paths minimizing the sum of path costs.
+
+    High level searches a constraint tree, splitting on the most important conflict
+    (cardinal ones first, per agent MDDs), low level is constrained_st_astar for one agent.
+    Conflicts are tracked per node and updated only for the replanned agent, and children
+    with the same cost and fewer conflicts are taken in place by bypassing.
+
+    Args:
+        grid (2D np array): NxN int array, obstacles are non-zero
+        starts (list[Position]): Start positions of agents
+        goals (list[Position]): Goal positions of agents
+        max_time (int, optional): Max time step of any path. Defaults to 100.
+        max_nodes (int, optional): Max constraint tree nodes to expand. Defaults to 1000.
+        max_seconds (float, optional): Time budget in seconds. Defaults to None (no limit).
+        max_cells (int, optional): max cells to visit per low level search. Defaults to 10000.
+        stats (dict, optional): store run-time stats here if it exists. Defaults to None.
+
+    Returns:
+        list[Path]: paths for each agent, waiting at their goal after their path ends. If the
+            budget runs out these are from the node with fewest conflicts, check stats['solved'].
+            Empty list if some agent has no path at all.
+    """
+    return conflict_based_search(grid, starts, goals, 1.0, max_time, max_nodes, max_seconds,
+                                 max_cells, stats)
+
+
+def mapf_ecbs(grid, starts, goals, w: float = 1.5, max_time=100, max_nodes=1000,
+              max_seconds: Optional[float] = None, max_cells=10000,
+              stats: dict = None) -> list[Path]:
+    """Enhanced CBS, bounded-suboptimal collision free paths for large numbers of agents.
+
+    Both levels use focal search with suboptimality factor w. The low level searches paths
+    within w of each agent's optimal cost, fewest conflicts with other agent paths first,
+    and the high level expands constraint tree nodes with cost within w of the lowest lower
+    bound, fewest conflicts first. The sum of costs found is within w of optimal.
+
+    Args:
+        grid (2D np array): NxN int array, obstacles are non-zero
+        starts (list[Position]): Start positions of agents
+        goals (list[Position]): Goal positions of agents
+        w (float, optional): Suboptimality factor, 1.0 is optimal CBS. Defaults to 1.5.
+        max_time (int, optional): Max time step of any path. Defaults to 100.
+        max_nodes (int, optional): Max constraint tree nodes to expand. Defaults to 1000.
+        max_seconds (float, optional): Time budget in seconds. Defaults to None (no limit).
+        max_cells (int, optional): max cells to visit per low level search. Defaults to 10000.
+        stats (dict, optional): store run-time stats here if it exists. Defaults to None.
+
+    Returns:
+        list[Path]: paths for each agent, waiting at their goal after their path ends. If the
+            budget runs out these are from the node with fewest conflicts, check stats['solved'].
+            Empty list if some agent has no path at all.
+    """
+    return conflict_based_search(grid, starts, goals, w, max_time, max_nodes, max_seconds,
+                                 max_cells, stats)
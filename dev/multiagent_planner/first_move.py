@@ -0,0 +1,115 @@
+"""First-move tables, following a shortest path to a goal without any search.
+
+A true distance field already holds every shortest path to its goal, each cell's next step
+is a neighbor one step closer. A FirstMoveTable keeps that move for every cell, run-length
+compressed per row like a compressed path database, since neighboring cells along a row mostly
+head the same way. Following it from any cell gives a free-space shortest path in O(path
+length), with no open list. Tables are built with the heuristic's batched BFS, optionally
+with cells paths shouldn't cross (ex. zones) as walls.
+"""
+from bisect import bisect_right
+from typing import Optional
+import numpy as np
+from .flat_grid import DIRECTIONS
+from .pathfinding import Path, Position
+from .pathfinding_heuristic import (HEURISTIC_BUILD_PROCESSES, get_distances_batch,
+                                    map_distance_batches)
+
+NO_MOVE = len(DIRECTIONS)  # Move of the goal, and of cells that can't reach it
+
+
+def get_first_moves(distances: np.ndarray) -> np.ndarray:
+    """Index in DIRECTIONS of the next step of a shortest path to the goal for every cell,
+    the first neighbor closest to the goal. Unreachable cells next to reachable ones (ex. a
+    blocked start) step to their closest reachable neighbor.
+
+    Args:
+        distances (np.ndarray): Distances to the goal, -1 for unreachable cells
+
+    Returns:
+        np.ndarray: int8 move per cell, NO_MOVE for the goal and cells that can't reach it
+    """
+    rows, cols = distances.shape
+    far = np.iinfo(np.int64).max
+    dists = distances.astype(np.int64)
+    dists[dists < 0] = far
+    padded = np.pad(dists, 1, constant_values=far)
+    moves = np.full((rows, cols), NO_MOVE, dtype=np.int8)
+    closest = np.full((rows, cols), far, dtype=np.int64)
+    for move, (d_row, d_col) in enumerate(DIRECTIONS):
+        neighbor = padded[1 + d_row:1 + d_row + rows, 1 + d_col:1 + d_col + cols]
+        closer = (neighbor < closest) & (neighbor < dists)
+        moves[closer] = move
+        closest[closer] = neighbor[closer]
+    return moves
+
+
+class FirstMoveTable:
+    """First moves towards one goal, as runs of equal moves along each row."""
+
+    def __init__(self, goal: Position, moves: np.ndarray) -> None:
+        self.goal = goal
+        self.shape = moves.shape
+        rows, cols = moves.shape
+        run_starts = np.ones((rows, cols), dtype=bool)
+        run_starts[:, 1:] = moves[:, 1:] != moves[:, :-1]
+        run_rows, run_cols = np.nonzero(run_starts)
+        # Runs of row r are run_cols/run_moves[row_offsets[r]:row_offsets[r + 1]], kept as
+        # lists since lookups are one cell at a time
+        self.row_offsets: list[int] = np.searchsorted(run_rows, np.arange(rows + 1)).tolist()
+        self.run_cols: list[int] = run_cols.tolist()
+        self.run_moves: list[int] = moves[run_rows, run_cols].tolist()
+
+    @staticmethod
+    def build(goal: Position, grid, blocked: Optional[np.ndarray] = None) -> 'FirstMoveTable':
+        """Build the table for goal on grid, with the cells of the blocked mask (ex. zones)
+        treated as walls other than to start from, see get_first_moves."""
+        [distances] = get_distances_batch(get_blocked_grid(grid, blocked), [goal])
+        return FirstMoveTable(goal, get_first_moves(distances))
+
+    def __len__(self) -> int:
+        """Number of runs stored, vs rows * cols cells."""
+        return len(self.run_cols)
+
+    def move(self, pos: Position) -> int:
+        """Index in DIRECTIONS of the first move from pos, or NO_MOVE."""
+        row, col = pos
+        idx = bisect_right(self.run_cols, col, self.row_offsets[row],
+                           self.row_offsets[row + 1]) - 1
+        return self.run_moves[idx]
+
+    def path(self, pos_a: Position, max_steps: Optional[int] = None) -> Path:
+        """Follow first moves from pos_a to the goal.
+
+        Returns:
+            Path: shortest free-space path from pos_a to the goal, or empty list if it can't
+                reach the goal or would take more than max_steps
+        """
+        path = [pos_a]
+        pos = pos_a
+        while pos != self.goal:
+            move = self.move(pos)
+            if move == NO_MOVE or (max_steps is not None and len(path) > max_steps):
+                return []
+            d_row, d_col = DIRECTIONS[move]
+            pos = (pos[0] + d_row, pos[1] + d_col)
+            path.append(pos)
+        return path
+
+
+def get_blocked_grid(grid, blocked: Optional[np.ndarray] = None) -> np.ndarray:
+    """Grid with the cells of the blocked mask as walls."""
+    if blocked is None:
+        return np.asarray(grid)
+    return np.where(blocked, 1, grid)
+
+
+def build_first_move_tables(grid, goals: list[Position], blocked: Optional[np.ndarray] = None,
+                            processes: int = HEURISTIC_BUILD_PROCESSES
+                            ) -> dict[Position, FirstMoveTable]:
+    """Build the first-move tables of goals, with the same batched BFS as the heuristic."""
+    tables = {}
+    batches = map_distance_batches(get_blocked_grid(grid, blocked), goals, processes=processes)
+    for goal, distances in zip(goals, (field for batch in batches for field in batch)):
+        tables[goal] = FirstMoveTable(goal, get_first_moves(distances))
+    return tables
@@ -0,0 +1,82 @@
+"""Flattened grid representation with precomputed neighbor tables.
+
+Cells are indexed as `cell = row * cols + col`, which lets searches key their
+open/closed sets by plain ints instead of (row, col, t) tuples.
+"""
+import numpy as np
+
+# Neighbor order matches st_astar: up, down, left, right
+DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+NO_CELL = -1  # Neighbor table entry for walls or out of grid
+
+
+class FlatGrid:
+    """Flattened view of a 2D grid, with per cell neighbor tables for 4-connected moves."""
+
+    def __init__(self, graph: np.ndarray) -> None:
+        self.grid = np.array(graph, copy=True)
+        self.rows, self.cols = self.grid.shape
+        self.size = self.rows * self.cols
+        # Per cell (row, col) tuples, reused so lookups into position sets don't allocate
+        self.positions: list[tuple[int, int]] = [
+            (row, col) for row in range(self.rows) for col in range(self.cols)]
+        # neighbors[cell] = [up, down, left, right], NO_CELL if blocked or outside grid
+        self.neighbors: list[list[int]] = []
+        for row, col in self.positions:
+            cell_neighbors = []
+            for d_row, d_col in DIRECTIONS:
+                n_row, n_col = row + d_row, col + d_col
+                if (0 <= n_row < self.rows and 0 <= n_col < self.cols and
+                        self.grid[n_row, n_col] == 0):
+                    cell_neighbors.append(n_row * self.cols + n_col)
+                else:
+                    cell_neighbors.append(NO_CELL)
+            self.neighbors.append(cell_neighbors)
+        # Same table without the blocked entries, for searches that don't care about direction
+        self.open_neighbors: list[list[int]] = [
+            [n for n in cell_neighbors if n != NO_CELL] for cell_neighbors in self.neighbors]
+        # Space-time successors, waiting in place first then open neighbors in order
+        self.successors: list[list[int]] = [
+            [cell] + cell_neighbors for cell, cell_neighbors in enumerate(self.open_neighbors)]
+
+    def cell(self, pos: tuple[int, int]) -> int:
+        """Return flat cell index for a (row, col) position."""
+        return pos[0] * self.cols + pos[1]
+
+    def matches(self, graph: np.ndarray) -> bool:
+        """True if this flat grid was built from a grid equal to the given one."""
+        return graph.shape == self.grid.shape and np.array_equal(graph, self.grid)
+
+    def distances_from(self, cell: int) -> list[int]:
+        """BFS distances from cell to every other cell, -1 if unreachable."""
+        distances = [-1] * self.size
+        distances[cell] = 0
+        frontier = [cell]
+        dist = 0
+        while frontier:
+            dist += 1
+            next_frontier = []
+            for curr in frontier:
+                for neighbor in self.open_neighbors[curr]:
+                    if distances[neighbor] == -1:
+                        distances[neighbor] = dist
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        return distances
+
+
+# Cache of flat grids by id of the source grid, validated against grid contents on lookup
+_flat_grid_cache: dict[int, FlatGrid] = {}
+_FLAT_GRID_CACHE_SIZE = 8
+
+
+def get_flat_grid(graph: np.ndarray) -> FlatGrid:
+    """Return a cached FlatGrid for graph, rebuilding it if the grid contents changed."""
+    flat_grid = _flat_grid_cache.get(id(graph))
+    if flat_grid is not None and flat_grid.matches(graph):
+        return flat_grid
+    flat_grid = FlatGrid(graph)
+    if len(_flat_grid_cache) >= _FLAT_GRID_CACHE_SIZE:
+        _flat_grid_cache.pop(next(iter(_flat_grid_cache)))
+    _flat_grid_cache[id(graph)] = flat_grid
+    return flat_grid
@@ -0,0 +1,90 @@
+"""Precomputed jump distances for Jump Point Search on 4-connected grids.
+
+JPS only keeps canonical shortest paths, ones that turn from moving vertically to moving
+horizontally only where they have to, where the cell beside them on the side they turn to is
+open but the one beside the cell they came from is a wall (a forced neighbor). Turning from
+horizontal to vertical is allowed anywhere, so moving horizontally stops at cells a vertical
+move from would reach such a jump point.
+
+For each cell and direction a JumpGrid stores how many open cells there are before a wall, and
+how many steps to the first jump point in that direction (0 if none before the wall), so a
+search jumps whole straight runs at once. Only the goal, which depends on the search, is
+checked on the way.
+"""
+import numpy as np
+from .flat_grid import DIRECTIONS
+
+JUMP_UP, JUMP_DOWN, JUMP_LEFT, JUMP_RIGHT = range(len(DIRECTIONS))  # Indices into DIRECTIONS
+
+
+class JumpGrid:
+    """Wall and jump point distances for each cell of a grid in each of DIRECTIONS."""
+
+    def __init__(self, graph: np.ndarray) -> None:
+        self.grid = np.array(graph, copy=True)
+        self.rows, self.cols = self.grid.shape
+        is_open = self.grid == 0
+        # Open cells padded with a border of walls, so neighbors off the grid are walls
+        padded = np.pad(is_open, 1, constant_values=False)
+        # wall_dists[d, row, col] open steps from (row, col) in direction d before a wall, and
+        # jump_dists[d, row, col] steps to the first jump point in direction d, 0 if none
+        self.wall_dists = np.zeros((len(DIRECTIONS), self.rows, self.cols), dtype=np.int32)
+        self.jump_dists = np.zeros((len(DIRECTIONS), self.rows, self.cols), dtype=np.int32)
+        for direction in (JUMP_UP, JUMP_DOWN):
+            d_row = DIRECTIONS[direction][0]
+            # Forced to turn at a cell if it's open to the side but the side of the cell it
+            # came from isn't
+            behind = padded[1 - d_row:1 - d_row + self.rows]
+            side = padded[1:1 + self.rows]
+            forced = ((side[:, 2:] & ~behind[:, 2:]) | (side[:, :-2] & ~behind[:, :-2]))
+            self._scan(direction, is_open, forced & is_open)
+        # Moving horizontally, stop where a vertical move would reach a jump point
+        turns = (self.jump_dists[JUMP_UP] > 0) | (self.jump_dists[JUMP_DOWN] > 0)
+        for direction in (JUMP_LEFT, JUMP_RIGHT):
+            self._scan(direction, is_open, turns & is_open)
+        # Per direction flat lists indexed by `cell = row * cols + col`, for fast lookups
+        self.wall_dist_lists: list[list[int]] = [
+            dists.ravel().tolist() for dists in self.wall_dists]
+        self.jump_dist_lists: list[list[int]] = [
+            dists.ravel().tolist() for dists in self.jump_dists]
+
+    def _scan(self, direction: int, is_open: np.ndarray, jump_points: np.ndarray):
+        """Fill the wall and jump point distances in direction, a row or column at a time
+        from the far side back."""
+        d_row, d_col = DIRECTIONS[direction]
+        # Transposed views for horizontal directions, so this always scans rows
+        wall_dists, jump_dists = self.wall_dists[direction], self.jump_dists[direction]
+        if d_col:
+            wall_dists, jump_dists = wall_dists.T, jump_dists.T
+            is_open, jump_points = is_open.T, jump_points.T
+        step = d_row or d_col
+        count = wall_dists.shape[0]
+        lines = range(count - 2, -1, -1) if step > 0 else range(1, count)
+        for line in lines:
+            next_line = line + step
+            next_open = is_open[next_line]
+            wall_dists[line] = np.where(next_open, wall_dists[next_line] + 1, 0)
+            jump_dists[line] = np.where(
+                next_open & jump_points[next_line], 1,
+                np.where(next_open & (jump_dists[next_line] > 0), jump_dists[next_line] + 1, 0))
+
+    def matches(self, graph: np.ndarray) -> bool:
+        """True if this jump grid was built from a grid equal to the given one."""
+        return graph.shape == self.grid.shape and np.array_equal(graph, self.grid)
+
+
+# Cache of jump grids by id of the source grid, validated against grid contents on lookup
+_jump_grid_cache: dict[int, JumpGrid] = {}
+_JUMP_GRID_CACHE_SIZE = 8
+
+
+def get_jump_grid(graph: np.ndarray) -> JumpGrid:
+    """Return a cached JumpGrid for graph, rebuilding it if the grid contents changed."""
+    jump_grid = _jump_grid_cache.get(id(graph))
+    if jump_grid is not None and jump_grid.matches(graph):
+        return jump_grid
+    jump_grid = JumpGrid(graph)
+    if len(_jump_grid_cache) >= _JUMP_GRID_CACHE_SIZE:
+        _jump_grid_cache.pop(next(iter(_jump_grid_cache)))
+    _jump_grid_cache[id(graph)] = jump_grid
+    return jump_grid
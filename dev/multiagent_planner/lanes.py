@@ -0,0 +1,179 @@
+"""One-way lanes and highways, keeping robots in an aisle moving the same way.
+
+Robots meeting head on in an aisle can only get past each other by one of them backing out or
+waiting for the other, so most failed and slow searches in a busy warehouse are swap
+conflicts in aisles. Lanes give cells a direction: moving out of a lane cell against its
+direction is against the lane, moving along it or across it (into a zone or the other lane of
+the aisle) never is. Lanes either forbid moves against them (hard, cost 0), which takes swaps
+in lanes out of the search space altogether, or add cost to them (soft), so searches only
+take them when going around costs more.
+
+Lanes come from a warehouse's lanes layer, a string per grid row with a symbol of
+LANE_SYMBOLS per cell for its direction or '.' for none, or generate_lanes puts a lane each way
+along every two-wide aisle.
+"""
+import os
+from typing import TYPE_CHECKING, Optional
+import numpy as np
+from .flat_grid import DIRECTIONS, FlatGrid
+from .traffic_map import MOVES
+if TYPE_CHECKING:
+    from warehouses.warehouse_loader import WorldInfo
+
+# Extra cost of a move against a lane in steps, 0 forbids them
+LANE_COST = float(os.getenv("LANE_COST", default="0"))
+
+# Lane direction of a cell, NO_LANE or an index into DIRECTIONS
+NO_LANE = -1
+UP, DOWN, LEFT, RIGHT = (DIRECTIONS.index(step) for step in [(-1, 0), (1, 0), (0, -1), (0, 1)])
+# Symbol of each lane direction in a lanes layer, in DIRECTIONS order, and of no lane
+LANE_SYMBOLS = '^v<>'
+NO_LANE_SYMBOL = '.'
+# Index in DIRECTIONS of each (d_row + 1) * 3 + (d_col + 1) step
+_DIRECTION_INDEX = np.full(9, -1, dtype=np.intp)
+for _direction, (_d_row, _d_col) in enumerate(DIRECTIONS):
+    _DIRECTION_INDEX[(_d_row + 1) * 3 + _d_col + 1] = _direction
+
+
+def parse_lanes(rows: list[str], shape: tuple[int, int]) -> np.ndarray:
+    """Lane directions of a lanes layer, a string per grid row of shape."""
+    if len(rows) != shape[0] or any(len(row) != shape[1] for row in rows):
+        raise ValueError(f'Lanes layer does not match the grid {shape}')
+    directions = np.full(shape, NO_LANE, dtype=np.int8)
+    for row, symbols in enumerate(rows):
+        for col, symbol in enumerate(symbols):
+            if symbol in LANE_SYMBOLS:
+                directions[row, col] = LANE_SYMBOLS.index(symbol)
+            elif symbol != NO_LANE_SYMBOL:
+                raise ValueError(f'Unknown lane symbol {symbol!r} at {(row, col)}, expected one '
+                                 f'of {LANE_SYMBOLS + NO_LANE_SYMBOL!r}')
+    return directions
+
+
+def format_lanes(directions: np.ndarray) -> list[str]:
+    """Lanes layer of lane directions, ex. to save generated lanes to a warehouse yaml."""
+    return [''.join(LANE_SYMBOLS[direction] if direction != NO_LANE else NO_LANE_SYMBOL
+                    for direction in row) for row in directions.tolist()]
+
+
+def transpose_lanes(directions: np.ndarray) -> np.ndarray:
+    """Lane directions of the transposed grid, ex. in x,y for a grid loaded in row, col."""
+    swapped = np.array([LEFT, RIGHT, UP, DOWN], dtype=np.int8)  # DIRECTIONS transposed
+    return np.where(directions == NO_LANE, NO_LANE, swapped[directions]).T.astype(np.int8)
+
+
+def generate_lanes(grid, zones: list[tuple[int, int]] = ()) -> np.ndarray:
+    """Lane directions for grid with a lane each way along every aisle exactly two cells wide,
+    keeping to the right: going right on the lower row, left on the upper one, down the left
+    column and up the right one. Zones count as walls, as other robots don't pass through them.
+
+    Crossing over to the other lane is always allowed, so any cell of an aisle can still reach
+    any other, and cells wider open space (ex. where aisles cross) stay without lanes.
+    """
+    blocked = np.asarray(grid) != 0
+    for zone in zones:
+        blocked[zone[0], zone[1]] = True
+    rows, cols = blocked.shape
+    padded = np.pad(blocked, 2, constant_values=True)
+
+    def blocked_at(d_row: int, d_col: int) -> np.ndarray:
+        return padded[2 + d_row:2 + d_row + rows, 2 + d_col:2 + d_col + cols]
+
+    directions = np.full((rows, cols), NO_LANE, dtype=np.int8)
+    # Upper cells of horizontal aisles, open with the cell below, walls above and two below
+    upper = ~blocked & ~blocked_at(1, 0) & blocked_at(-1, 0) & blocked_at(2, 0)
+    directions[upper] = LEFT
+    directions[1:][upper[:-1]] = RIGHT
+    # Left cells of vertical aisles, where neither cell is in a horizontal aisle already
+    no_lane = directions == NO_LANE
+    left = ~blocked & ~blocked_at(0, 1) & blocked_at(0, -1) & blocked_at(0, 2) & no_lane
+    left[:, :-1] &= no_lane[:, 1:]
+    directions[left] = DOWN
+    directions[:, 1:][left[:, :-1]] = UP
+    return directions
+
+
+class Lanes:
+    """Lane directions of a grid, as blocked moves or extra move costs for st_astar and
+    st_astar_flat, and as blocked moves for the heuristic (see get_distances_batch).
+
+    With cost 0 moves against a lane are blocked, else they cost that many extra steps. True
+    distances ignoring lanes are still an admissible heuristic with lane costs, with blocked
+    moves distances along the lanes are tighter and find cells lanes cut off.
+    """
+
+    def __init__(self, directions: np.ndarray, cost: float = LANE_COST) -> None:
+        self.directions = np.asarray(directions, dtype=np.int8)
+        self.cost = cost
+        # against[d, row, col] True if moving in direction d of DIRECTIONS out of the cell
+        # goes against its lane
+        self.against = np.stack([self.directions == DIRECTIONS.index((-d_row, -d_col))
+                                 for d_row, d_col in DIRECTIONS])
+        # costs[m, row, col] extra cost of move m of MOVES from the cell, inf if blocked
+        self.costs = np.zeros((len(MOVES),) + self.directions.shape)
+        self.costs[1:][self.against] = np.inf if self.hard else cost
+        # Successors and successor costs of the last flat grid used
+        self._flat_grid: Optional[FlatGrid] = None
+        self._successors: list[list[int]] = []
+        self._successor_costs: Optional[list[dict[int, float]]] = None
+
+    @staticmethod
+    def from_world_info(world_info: 'WorldInfo', cost: float = LANE_COST) -> 'Lanes':
+        """Lanes of a warehouse's lanes layer, or generated along its aisles if it has none."""
+        directions = world_info.lanes
+        if directions is None:
+            directions = generate_lanes(world_info.world_grid, world_info.get_all_zones())
+        return Lanes(directions, cost)
+
+    @property
+    def hard(self) -> bool:
+        """True if moves against lanes are blocked rather than costed."""
+        return self.cost <= 0
+
+    @property
+    def blocked_moves(self) -> Optional[np.ndarray]:
+        """Moves blocked by hard lanes as against, or None for lane costs."""
+        return self.against if self.hard else None
+
+    def get_move_costs(self, pos: tuple[int, int]) -> list[float]:
+        """Extra costs of the moves from pos, in MOVES order, inf if blocked."""
+        return self.costs[:, pos[0], pos[1]].tolist()
+
+    def _build_successors(self, flat_grid: FlatGrid):
+        self._flat_grid = flat_grid
+        costs = self.costs.reshape(len(MOVES), -1).tolist()
+        self._successors = []
+        successor_costs = []
+        for cell, neighbors in enumerate(flat_grid.neighbors):
+            cell_successors = [cell]
+            cell_costs = {cell: 0.0}
+            for direction, neighbor in enumerate(neighbors):
+                cost = costs[1 + direction][cell]
+                if neighbor >= 0 and cost != np.inf:
+                    cell_successors.append(neighbor)
+                    cell_costs[neighbor] = cost
+            self._successors.append(cell_successors)
+            successor_costs.append(cell_costs)
+        self._successor_costs = None if self.hard else successor_costs
+
+    def get_successors(self, flat_grid: FlatGrid) -> list[list[int]]:
+        """flat_grid.successors without the moves hard lanes block."""
+        if self._flat_grid is not flat_grid:
+            self._build_successors(flat_grid)
+        return self._successors
+
+    def get_successor_costs(self, flat_grid: FlatGrid) -> Optional[list[dict[int, float]]]:
+        """Extra cost of each move in get_successors by successor cell, None if hard."""
+        if self._flat_grid is not flat_grid:
+            self._build_successors(flat_grid)
+        return self._successor_costs
+
+    def count_against(self, path: list[tuple[int, int]]) -> int:
+        """Number of moves of path against lanes."""
+        if len(path) < 2:
+            return 0
+        cells = np.asarray(path, dtype=np.intp)
+        steps = cells[1:] - cells[:-1]
+        moves = np.abs(steps).sum(axis=1) == 1  # Not waits
+        directions = _DIRECTION_INDEX[(steps[moves, 0] + 1) * 3 + steps[moves, 1] + 1]
+        return int(self.against[directions, cells[:-1][moves, 0], cells[:-1][moves, 1]].sum())
@@ -0,0 +1,250 @@
+"""Large Neighborhood Search (MAPF-LNS) improving committed paths in spare time.
+
+Paths are committed one robot at a time, each only avoiding the ones committed before it, so
+later robots take detours and waits a joint plan wouldn't need. Each LNS iteration picks a
+small neighborhood of robots, releases their reservations and replans them one at a time in
+random order against everyone else's, keeping the new paths only if their sum of costs (path
+lengths) went down and restoring the old ones otherwise. Every path is planned and reserved
+the way the robot allocator plans and reserves them, so kept paths never collide.
+
+Neighborhoods are picked as in MAPF-LNS (Li et al. 2021), weighted by how much each kind
+improved lately:
+ - random: robots picked at random
+ - agent: the most delayed robot, and robots whose paths cross its shortest free path
+ - intersection: robots whose paths pass closest to an intersection cell on some path
+"""
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Optional
+import numpy as np
+from .flat_grid import DIRECTIONS
+from .pathfinding import Path, Position
+from .planning_pool import plan_path
+from .reservation_table import ReservationTable
+
+# Robots replanned together each LNS iteration
+LNS_NEIGHBORHOOD_SIZE = int(os.getenv("LNS_NEIGHBORHOOD_SIZE", default="4"))
+# How fast neighborhood weights follow the latest improvements, between 0 and 1
+LNS_REACTION = float(os.getenv("LNS_REACTION", default="0.1"))
+
+NEIGHBORHOODS = ('random', 'agent', 'intersection')
+MIN_WEIGHT = 0.01  # Keeps every neighborhood picked now and then
+
+
+def get_delay(path: Path, true_dists) -> int:
+    """Steps path takes past the shortest free path between its ends."""
+    return len(path) - 1 - max(int(true_dists[path[0]]), 0)
+
+
+def get_shortest_cells(true_dists, pos_a: Position, pos_b: Position,
+                       shape: tuple[int, int]) -> list[Position]:
+    """Cells of a shortest free path from a to b on a grid of the given shape, following the
+    true distances to b down."""
+    cells = [pos_a]
+    pos = pos_a
+    while pos != pos_b and true_dists[pos] > 0:
+        for d_row, d_col in DIRECTIONS:
+            neighbor = (pos[0] + d_row, pos[1] + d_col)
+            if (0 <= neighbor[0] < shape[0] and 0 <= neighbor[1] < shape[1] and
+                    0 <= true_dists[neighbor] < true_dists[pos]):
+                pos = neighbor
+                break
+        else:
+            break
+        cells.append(pos)
+    return cells
+
+
+def get_intersections(grid) -> np.ndarray:
+    """Mask of open cells with at least three open neighbors."""
+    padded = np.pad(np.asarray(grid) == 0, 1, constant_values=False)
+    rows, cols = np.shape(grid)
+    open_neighbors = sum(padded[1 + d_row:1 + d_row + rows, 1 + d_col:1 + d_col + cols]
+                         .astype(np.int8) for d_row, d_col in DIRECTIONS)
+    return padded[1:-1, 1:-1] & (open_neighbors >= 3)
+
+
+def get_visits(paths: dict[Any, Path]) -> dict[Position, dict[Any, None]]:
+    """Owners of the paths passing each cell, in path order."""
+    visits: dict[Position, dict[Any, None]] = {}
+    for owner, path in paths.items():
+        for pos in path:
+            visits.setdefault(pos, {})[owner] = None
+    return visits
+
+
+class LNSOptimizer:
+    """Improves the sum of costs of paths reserved in a ReservationTable by replanning
+    neighborhoods of them, see optimize."""
+
+    def __init__(self, neighborhood_size: int = LNS_NEIGHBORHOOD_SIZE,
+                 engine: str = 'st_astar_flat', max_steps: int = 500, buffer: int = 1,
+                 reaction: float = LNS_REACTION, seed: Optional[int] = None) -> None:
+        self.neighborhood_size = neighborhood_size
+        self.engine = engine
+        self.max_steps = max_steps
+        self.buffer = buffer  # As reserved by the robot allocator
+        self.reaction = reaction
+        self.rng = random.Random(seed)
+        self.weights = {name: 1.0 for name in NEIGHBORHOODS}
+        # Delayed robots agent neighborhoods already picked, until they've picked them all
+        self.tabu: set = set()
+        # Iterations run, neighborhoods improved with the steps saved, and ones given up on as
+        # a search found no path in time
+        self.iterations = 0
+        self.improved = 0
+        self.cost_saved = 0
+        self.failed = 0
+
+    def optimize(self, grid, heuristic_dict, reservations: ReservationTable,
+                 paths: dict[Any, Path], static_obstacles, t_start: int, time_budget: float,
+                 max_iterations: Optional[int] = None) -> dict[Any, Path]:
+        """Replan neighborhoods of paths until time_budget runs out, keeping only improvements.
+
+        Args:
+            grid (2D np array): NxN int array, obstacles are non-zero
+            heuristic_dict: True distances to each path end, indexed by end then position
+            reservations (ReservationTable): Table with each path reserved for its owner, and
+                all the other paths to avoid
+            paths (dict): owner -> path from t_start to its end, an end that is valid at all
+                times (ex. a zone)
+            static_obstacles (set): set{(row,col), ...} of obstacles to avoid
+            t_start (int): Time of the first step of each path
+            time_budget (float): Seconds to optimize for, searches give up when it runs out
+            max_iterations (int, optional): Stop after this many neighborhoods. Defaults to
+                None.
+
+        Returns:
+            dict: owner -> new path for each owner whose path changed, already reserved for
+                it from t_start
+        """
+        deadline = time.perf_counter() + time_budget
+        paths = dict(paths)
+        improved_paths = {}
+        visits = get_visits(paths)
+        delays = {owner: get_delay(path, heuristic_dict[path[-1]])
+                  for owner, path in paths.items()}
+        intersections = get_intersections(grid)
+        iterations = 0
+        # Stops early once no path can get any shorter
+        while (any(delays.values()) and time.perf_counter() < deadline and
+               (max_iterations is None or iterations < max_iterations)):
+            iterations += 1
+            self.iterations += 1
+            name = self.rng.choices(NEIGHBORHOODS, [self.weights[name]
+                                                    for name in NEIGHBORHOODS])[0]
+            neighborhood = self.get_neighborhood(name, paths, visits, delays, heuristic_dict,
+                                                 intersections)
+            saved = 0
+            # Paths already as short as they can be only move others out of the way, which
+            # can't shorten anything if they're all like that
+            if any(delays[owner] for owner in neighborhood):
+                new_paths = self.replan(grid, heuristic_dict, reservations, paths, neighborhood,
+                                        static_obstacles, t_start, deadline)
+                if new_paths:
+                    saved = sum(len(paths[owner]) - len(new_paths[owner])
+                                for owner in neighborhood)
+                    improved_paths.update((owner, path) for owner, path in new_paths.items()
+                                          if path != paths[owner])
+                    paths.update(new_paths)
+                    visits = get_visits(paths)
+                    delays.update((owner, get_delay(path, heuristic_dict[path[-1]]))
+                                  for owner, path in new_paths.items())
+                    self.improved += 1
+                    self.cost_saved += saved
+            self.weights[name] = max(
+                self.reaction * saved + (1 - self.reaction) * self.weights[name], MIN_WEIGHT)
+        return improved_paths
+
+    def get_neighborhood(self, name: str, paths: dict[Any, Path],
+                         visits: dict[Position, dict[Any, None]], delays: dict[Any, int],
+                         heuristic_dict, intersections: np.ndarray) -> list:
+        """Owners of paths to replan together, with the neighborhood of the given name, from
+        the cells each path visits and how delayed it is (see get_delay)."""
+        size = min(self.neighborhood_size, len(paths))
+        neighborhood: dict[Any, None] = {}
+        if name == 'agent':
+            delayed = [owner for owner, delay in delays.items() if delay > 0]
+            if delayed and self.tabu.issuperset(delayed):
+                self.tabu.clear()
+            delayed = [owner for owner in delayed if owner not in self.tabu]
+            if delayed:
+                owner = max(delayed, key=delays.get)
+                self.tabu.add(owner)
+                neighborhood[owner] = None
+                path = paths[owner]
+                cells = get_shortest_cells(heuristic_dict[path[-1]], path[0], path[-1],
+                                           intersections.shape)
+                crossing = list(dict.fromkeys(
+                    other for pos in cells for other in visits.get(pos, ()) if other != owner))
+                for other in self.rng.sample(crossing, min(len(crossing), size - 1)):
+                    neighborhood[other] = None
+        elif name == 'intersection':
+            cells = [pos for pos in visits if intersections[pos]]
+            if cells:
+                # Robots passing the intersection, then the cells around it outwards
+                start = self.rng.choice(cells)
+                queue = deque([start])
+                seen = {start}
+                while queue and len(neighborhood) < size:
+                    pos = queue.popleft()
+                    for owner in visits.get(pos, ()):
+                        if len(neighborhood) < size:
+                            neighborhood[owner] = None
+                    for d_row, d_col in DIRECTIONS:
+                        neighbor = (pos[0] + d_row, pos[1] + d_col)
+                        if (0 <= neighbor[0] < intersections.shape[0] and
+                                0 <= neighbor[1] < intersections.shape[1] and
+                                neighbor not in seen):
+                            seen.add(neighbor)
+                            queue.append(neighbor)
+        # Random robots, or the rest of a neighborhood that came up short
+        if len(neighborhood) < size:
+            others = [owner for owner in paths if owner not in neighborhood]
+            for owner in self.rng.sample(others, size - len(neighborhood)):
+                neighborhood[owner] = None
+        return list(neighborhood)
+
+    def replan(self, grid, heuristic_dict, reservations: ReservationTable,
+               paths: dict[Any, Path], neighborhood: list, static_obstacles, t_start: int,
+               deadline: float) -> Optional[dict[Any, Path]]:
+        """Replan the paths of a neighborhood one at a time in random order, each reserved as
+        it's planned. Keeps them if their sum of costs went down, otherwise restores the old
+        reservations.
+
+        Returns:
+            dict: owner -> new path for the neighborhood, or None if it wasn't improved
+        """
+        records = {owner: reservations.owners[owner] for owner in neighborhood}
+        for owner in neighborhood:
+            reservations.release_owner(owner)
+        new_paths = {}
+        for owner in self.rng.sample(neighborhood, len(neighborhood)):
+            pos_a, pos_b = paths[owner][0], paths[owner][-1]
+            path = plan_path(grid, pos_a, pos_b, reservations, static_obstacles,
+                             heuristic_dict[pos_b], engine=self.engine,
+                             max_steps=self.max_steps, t_start=t_start,
+                             time_budget=max(deadline - time.perf_counter(), 0))
+            if not path:
+                self.failed += 1
+                break
+            reservations.reserve_path(path, t_start, self.buffer, owner=owner)
+            new_paths[owner] = path
+        if (len(new_paths) == len(neighborhood) and
+                sum(map(len, new_paths.values())) < sum(len(paths[owner])
+                                                        for owner in neighborhood)):
+            return new_paths
+        for owner in new_paths:
+            reservations.release_owner(owner)
+        for owner, (path, path_t_start, buffer, t_end) in records.items():
+            reservations.reserve_path(path, path_t_start, buffer, owner=owner, t_end=t_end)
+        return None
+
+    def stats(self) -> dict:
+        """Iterations run, neighborhoods improved with the steps saved and failed ones, and
+        the current neighborhood weights."""
+        return {'iterations': self.iterations, 'improved': self.improved,
+                'cost_saved': self.cost_saved, 'failed': self.failed,
+                'weights': {name: round(weight, 3) for name, weight in self.weights.items()}}
@@ -0,0 +1,76 @@
+"""Open lists for the A* searches, keeping their frontier of cells to expand."""
+import heapq
+from typing import Any
+
+
+class HeapOpenList:
+    """Open list on a binary heap, pops the lowest f-score, ties going to the larger g-score
+    and then the lower item."""
+
+    def __init__(self) -> None:
+        self.heap: list[tuple[float, float, Any]] = []
+
+    def push(self, f_score: float, g_score: float, item: Any):
+        heapq.heappush(self.heap, (f_score, -g_score, item))
+
+    def pop(self) -> Any:
+        return heapq.heappop(self.heap)[2]
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+
+class BucketOpenList:
+    """Open list as a bucket queue, for searches whose f and g scores are multiples of
+    resolution, ex. step costs of 1 and 0.9 with an integer distance heuristic.
+
+    Items are appended to a list per (f, g) bucket, ties within a bucket popping the last
+    pushed item, and only new bucket keys, plain ints, go through a heap. Pops the lowest
+    f-score, ties going to the larger g-score. Scores off the resolution are rounded to it,
+    so the search may be off by up to that much from optimal.
+    """
+    G_BITS = 32  # Bits of the bucket key holding the g-score
+
+    def __init__(self, resolution: float = 0.1) -> None:
+        self.scale = 1 / resolution
+        self.buckets: dict[int, list[Any]] = {}  # bucket key -> items
+        self.keys: list[int] = []  # heap of bucket keys
+        self.size = 0
+
+    def push(self, f_score: float, g_score: float, item: Any):
+        # Lower f first, then higher g
+        key = (round(f_score * self.scale) << self.G_BITS) - round(g_score * self.scale)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [item]
+            heapq.heappush(self.keys, key)
+        else:
+            bucket.append(item)
+        self.size += 1
+
+    def pop(self) -> Any:
+        key = self.keys[0]
+        bucket = self.buckets[key]
+        item = bucket.pop()
+        if not bucket:
+            del self.buckets[key]
+            heapq.heappop(self.keys)
+        self.size -= 1
+        return item
+
+    def __len__(self) -> int:
+        return self.size
+
+
+# Open lists selectable by name in the A* searches
+OPEN_LISTS = {
+    'heap': HeapOpenList,
+    'bucket': BucketOpenList,
+}
+
+
+def make_open_list(open_list: str):
+    """Return a new empty open list by its name in OPEN_LISTS."""
+    if open_list not in OPEN_LISTS:
+        raise ValueError(f'Unknown open list {open_list}, expected one of {list(OPEN_LISTS)}')
+    return OPEN_LISTS[open_list]()
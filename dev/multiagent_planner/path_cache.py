@@ -0,0 +1,182 @@
+"""Cache of free-space paths between zone pairs, repaired around reservations when used.
+
+Robots keep travelling the same few legs (home to item zone, item zone to station, station to
+home), so instead of a full space-time search for each, the path a robot would take with no
+other robots around is kept per (pos_a, pos_b). When used it's checked step by step against
+the obstacles at that time, and each stretch running into one is replaced by a short local
+search around it, later steps shifted by any waits it added.
+"""
+from collections import OrderedDict
+import os
+from typing import Optional
+from . import pathfinding as pf
+from .pathfinding import Path, Position
+
+# Paths kept by a PathCache, least recently used evicted first
+PATH_CACHE_SIZE = int(os.getenv("PATH_CACHE_SIZE", default="1024"))
+# Steps before and after a conflict a repair search replaces
+PATH_REPAIR_STEPS = int(os.getenv("PATH_REPAIR_STEPS", default="4"))
+# Repair searches tried on a path before giving up for a full search
+PATH_MAX_REPAIRS = int(os.getenv("PATH_MAX_REPAIRS", default="8"))
+
+PathKey = tuple[Position, Position]  # (pos_a, pos_b)
+
+
+class PathCache:
+    """LRU cache of the shortest paths between position pairs avoiding only the grid and
+    fixed obstacles (ex. zones), repaired around the other robots by plan.
+
+    Paths are planned as the robot allocator plans them, start and end positions are valid
+    at all times."""
+
+    def __init__(self, grid, fixed_obstacles: Optional[set[Position]] = None,
+                 max_size: int = PATH_CACHE_SIZE, repair_steps: int = PATH_REPAIR_STEPS,
+                 max_repairs: int = PATH_MAX_REPAIRS) -> None:
+        self.grid = grid
+        self.fixed_obstacles = fixed_obstacles if fixed_obstacles is not None else set()
+        self.max_size = max_size
+        self.repair_steps = repair_steps
+        self.max_repairs = max_repairs
+        self.paths: OrderedDict[PathKey, Path] = OrderedDict()
+        # Lookups, hits if the path was cached. Paths repaired, the repair searches run for
+        # them and paths given up on as they couldn't be repaired.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.repaired = 0
+        self.repairs = 0
+        self.failed = 0
+
+    def get_free_path(self, pos_a: Position, pos_b: Position, true_dists,
+                      max_steps: int = 500) -> Path:
+        """Return the cached free-space path from a to b, planning it if not cached.
+
+        Args:
+            pos_a (Position): Start position
+            pos_b (Position): Finish position
+            true_dists: Distances to pos_b indexed by position, ex. heuristic_dict[pos_b]
+            max_steps (int, optional): Max path steps searched. Defaults to 500.
+
+        Returns:
+            Path: the free-space path, or empty list if there is none
+        """
+        key = (pos_a, pos_b)
+        path = self.paths.get(key)
+        if path is not None:
+            self.hits += 1
+            self.paths.move_to_end(key)
+            return path
+        self.misses += 1
+
+        def true_heuristic(pos: Position) -> float:
+            return true_dists[pos]
+        path = pf.st_astar_flat(
+            self.grid, pos_a, pos_b, static_obstacles=self.fixed_obstacles, max_time=max_steps,
+            end_fast=True, heuristic=true_heuristic, validate_ends=False)
+        self.paths[key] = path
+        if len(self.paths) > self.max_size:
+            self.paths.popitem(last=False)
+            self.evictions += 1
+        return path
+
+    def plan(self, pos_a: Position, pos_b: Position, dynamic_obstacles, static_obstacles,
+             true_dists, max_steps: int = 500, t_start: int = 0,
+             stats: Optional[dict] = None) -> Path:
+        """Plan a path from a to b from the cached free-space path, repairing each stretch of
+        it that runs into an obstacle with a local search, like plan_path.
+
+        Args:
+            pos_a (Position): Start position
+            pos_b (Position): Finish position
+            dynamic_obstacles: set{(row,col,t), ...} of obstacles to avoid, or a
+                ReservationTable
+            static_obstacles (set): set{(row,col), ...} of obstacles to avoid
+            true_dists: Distances to pos_b indexed by position, ex. heuristic_dict[pos_b]
+            max_steps (int, optional): Max path steps. Defaults to 500.
+            t_start (int, optional): Time of the first step in dynamic obstacles.
+                Defaults to 0.
+            stats (dict, optional): store run-time stats here if it exists. Defaults to None.
+
+        Returns:
+            Path: A list of positions along the path, or empty list if there is no free-space
+                path or it couldn't be repaired within max_repairs searches
+        """
+        hits = self.hits
+        path = self.get_free_path(pos_a, pos_b, true_dists, max_steps)
+        path, repairs = self.repair(path, dynamic_obstacles, static_obstacles, max_steps,
+                                    t_start)
+        self.repairs += repairs
+        if repairs and path:
+            self.repaired += 1
+        elif not path:
+            self.failed += 1
+        if stats is not None:
+            stats['path_cache_hit'] = self.hits > hits
+            stats['path_repairs'] = repairs
+            stats['path_length'] = len(path)
+        return path
+
+    def repair(self, path: Path, dynamic_obstacles, static_obstacles, max_steps: int = 500,
+               t_start: int = 0) -> tuple[Path, int]:
+        """Replace each stretch of path around a step running into an obstacle, from
+        repair_steps before it to repair_steps after, with a space-time search rejoining the
+        path there. Later steps are checked again, shifted by any waits added.
+
+        Returns:
+            tuple[Path, int]: the repaired path, or empty list if it couldn't be repaired,
+                and how many repair searches were run
+        """
+        if not path:
+            return [], 0
+        repairs = 0
+        idx = 1
+        while True:
+            idx = pf.find_path_conflict(path, dynamic_obstacles, static_obstacles, t_start, idx)
+            if idx is None:
+                break
+            if repairs == self.max_repairs:
+                return [], repairs
+            repairs += 1
+            idx_start = max(idx - self.repair_steps, 0)
+            idx_end = min(idx + self.repair_steps, len(path) - 1)
+            # Searched from the start of the stretch at its time, waits allowed. The cell it
+            # rejoins at is only valid at all times if it's the end, otherwise it's checked
+            # again with the rest of the path.
+            steps = idx_end - idx_start
+            segment = pf.st_astar_flat(
+                self.grid, path[idx_start], path[idx_end], dynamic_obstacles,
+                static_obstacles, max_time=min(2 * steps + self.repair_steps,
+                                               max_steps - idx_start),
+                t_start=t_start + idx_start, end_fast=True,
+                heuristic=pf.get_manhattan_heuristic(path[idx_end]), validate_ends=False)
+            if not segment:
+                return [], repairs
+            path = path[:idx_start] + segment + path[idx_end + 1:]
+            if len(path) > max_steps + 1:
+                return [], repairs
+            idx = idx_start + 1
+        return path, repairs
+
+    def set_cells(self, grid, cells: list[Position], blocked: bool = True) -> int:
+        """Use the changed grid, dropping cached paths through newly blocked cells, or all of
+        them on unblocking cells as shorter paths may open up.
+
+        Returns:
+            int: how many paths were dropped
+        """
+        self.grid = grid
+        count = len(self.paths)
+        if blocked:
+            cells = set(cells)
+            self.paths = OrderedDict((key, path) for key, path in self.paths.items()
+                                     if cells.isdisjoint(path))
+        else:
+            self.paths.clear()
+        return count - len(self.paths)
+
+    def stats(self) -> dict[str, int]:
+        """Cache size, hit/miss/eviction counts and how many paths were repaired, with how
+        many repair searches, or couldn't be."""
+        return {'cached': len(self.paths), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'repaired': self.repaired,
+                'repairs': self.repairs, 'failed': self.failed}
@@ -1,13 +1,22 @@
 """A* and STA* pathfinding algorithms."""
-import heapq
 from collections import defaultdict
 import math
-from typing import Callable, Optional
+import time
+from typing import Callable, Iterable, Optional
+from .flat_grid import DIRECTIONS, get_flat_grid
+from .jump_grid import JUMP_DOWN, JUMP_LEFT, JUMP_RIGHT, JUMP_UP, get_jump_grid
+from .lanes import Lanes
+from .open_list import make_open_list
+from .reservation_table import ReservationTable
+from .traffic_map import TrafficMap
 
 # Type Aliases
 Position = tuple[int, int]  # (row, col)
 PositionST = tuple[int, int, int]  # (row, col, time)
 Collision = tuple[int, int, int, int]  # (path_idx, row, col, time)
+# Kinds of collisions and conflicts between two paths
+VERTEX_CONFLICT = 0  # Both at the same cell at the same time
+EDGE_CONFLICT = 1  # Swapping cells between two time steps
 Path = list[Position]
 PathST = list[PositionST]
 # Heuristic Function is heuristic from pos_a to a fixed goal position that is set ahead
@@ -27,9 +36,48 @@ def get_euclidean_heuristic(pos_b):
     return euclidean_heuristic
 
 
+# Cells expanded between checks of a search's time budget
+TIME_BUDGET_CHECK_CELLS = 64
+
+
+def get_last_reserved_time(dynamic_obstacles) -> Callable[[int, int], float]:
+    """Return a function giving the last time (row, col) is reserved in dynamic obstacles,
+    or -inf if never, so a partial path can end where nothing will run into it."""
+    if isinstance(dynamic_obstacles, ReservationTable):
+        cache: dict[Position, float] = {}
+
+        def last_reserved_time(row: int, col: int) -> float:
+            last = cache.get((row, col))
+            if last is None:
+                times = dynamic_obstacles.reserved_times(
+                    row, col, dynamic_obstacles.t_start, dynamic_obstacles.t_end - 1)
+                last = cache[row, col] = times[-1] if times else -math.inf
+            return last
+        return last_reserved_time
+    last_times: dict[Position, float] = {}
+    for row, col, t in dynamic_obstacles:
+        last_times[row, col] = max(last_times.get((row, col), -math.inf), t)
+    return lambda row, col: last_times.get((row, col), -math.inf)
+
+
+def find_path_conflict(path: list[Position], dynamic_obstacles, static_obstacles,
+                       t_start: int = 0, idx_start: int = 1) -> Optional[int]:
+    """Index of the first step of path from idx_start in a static obstacle, or a dynamic
+    obstacle at t_start + index, None if there's none. The start and end positions are valid
+    at all times, as searched with validate_ends=False."""
+    ends = (path[0], path[-1]) if path else ()
+    for idx in range(idx_start, len(path)):
+        pos = path[idx]
+        if pos in ends:
+            continue
+        if pos in static_obstacles or (pos[0], pos[1], t_start + idx) in dynamic_obstacles:
+            return idx
+    return None
+
+
 def astar(graph, pos_a: Position, pos_b: Position, max_steps=10000,
-          heuristic: Optional[HeuristicFunction] = None
-          ) -> list[Position]:
+          heuristic: Optional[HeuristicFunction] = None, open_list: str = 'heap',
+          stats: Optional[dict] = None) -> list[Position]:
     """A* search through graph from p
 
     Args:
@@ -38,6 +86,8 @@ def astar(graph, pos_a: Position, pos_b: Position, max_steps=10000,
         pos_b (Position): Finish position
         max_steps (int, optional): Max number of steps. Defaults to 10000.
         heuristic (HeuristicFunction, optional): Heuristic used for pos_b
+        open_list (str, optional): Open list from OPEN_LISTS. Defaults to 'heap'.
+        stats (dict, optional): store run-time stats here if it exists. Defaults to None.
 
     Raises:
         ValueError: If start/end positions are in walls or out of grid
@@ -72,16 +122,14 @@ def astar(graph, pos_a: Position, pos_b: Position, max_steps=10000,
     path_track[pos_a] = None
     g_scores[pos_a] = 0  # Starting position is zero
 
-    # priority queue via heapq
     # f-score: f-score = g-score + h, best guess cost from node to goal
     f_score = g_scores[pos_a] + heuristic(pos_a)
-    # priority queue contains (f-score, parent, pos)
-    priority_queue: list[tuple[float, Optional[Position], Position]] = [
-        (f_score, None, pos_a)]
+    priority_queue = make_open_list(open_list)
+    priority_queue.push(f_score, 0, pos_a)
 
     cells_visited = 0
     while (priority_queue or cells_visited < max_steps):
-        _, _, curr = heapq.heappop(priority_queue)
+        curr = priority_queue.pop()
         cells_visited += 1
         if curr == pos_b:
             break
@@ -98,8 +146,7 @@ def astar(graph, pos_a: Position, pos_b: Position, max_steps=10000,
                     ((neighbor not in g_scores) or potential_g_score < g_scores[neighbor])):
                 g_scores[neighbor] = potential_g_score
                 f_score = g_scores[neighbor] + heuristic(neighbor)
-                new_node = (f_score, curr, neighbor)
-                heapq.heappush(priority_queue, new_node)
+                priority_queue.push(f_score, potential_g_score, neighbor)
                 path_track[neighbor] = curr
 
     def get_path(curr_node):
@@ -110,6 +157,8 @@ def astar(graph, pos_a: Position, pos_b: Position, max_steps=10000,
 
         return list(reversed(path))
 
+    if stats is not None:
+        stats['cells_visited'] = cells_visited
     # If path was found
     if curr == pos_b:
         return get_path(curr)
@@ -117,12 +166,131 @@ def astar(graph, pos_a: Position, pos_b: Position, max_steps=10000,
     return []
 
 
+def jps(graph, pos_a: Position, pos_b: Position, max_steps=10000,
+        heuristic: Optional[HeuristicFunction] = None, open_list: str = 'heap',
+        stats: Optional[dict] = None) -> list[Position]:
+    """Jump Point Search through a 4-connected graph, drop-in replacement for astar.
+
+    Only expands the jump points of canonical shortest paths (see jump_grid), jumping along
+    straight runs with the distances of a cached JumpGrid, so long open aisles take a few
+    expansions instead of one per cell. Paths are as short as astar's, but may take a
+    different one of several shortest paths.
+
+    Args:
+        graph (2D np array): The grid to path through
+        pos_a (Position): Start position
+        pos_b (Position): Finish position
+        max_steps (int, optional): Max number of jump points expanded. Defaults to 10000.
+        heuristic (HeuristicFunction, optional): Heuristic used for pos_b
+        open_list (str, optional): Open list from OPEN_LISTS. Defaults to 'heap'.
+        stats (dict, optional): store run-time stats here if it exists. Defaults to None.
+
+    Raises:
+        ValueError: If start/end positions are in walls or out of grid
+
+    Returns:
+        list[Position]: path from start to finish, or empty list.
+    """
+    if graph[pos_a[0], pos_a[1]] > 0 or graph[pos_b[0], pos_b[1]] > 0:
+        raise ValueError('Start/End locations in walls')
+    if heuristic is None:
+        heuristic = get_euclidean_heuristic(pos_b)
+
+    jump_grid = get_jump_grid(graph)
+    cols = jump_grid.cols
+    wall_dists = jump_grid.wall_dist_lists
+    jump_dists = jump_grid.jump_dist_lists
+    goal_row, goal_col = pos_b
+
+    def jump(row: int, col: int, direction: int) -> Optional[Position]:
+        """Next jump point or the goal moving from (row, col) in direction, if any."""
+        cell = row * cols + col
+        jump_dist = jump_dists[direction][cell]
+        end = jump_dist or wall_dists[direction][cell]
+        d_row, d_col = DIRECTIONS[direction]
+        if d_row:
+            if col == goal_col and 0 < (goal_row - row) * d_row <= end:
+                return pos_b
+            return (row + d_row * jump_dist, col) if jump_dist else None
+        goal_dist = (goal_col - col) * d_col
+        if 0 < goal_dist <= end:
+            if row == goal_row:
+                return pos_b
+            # Turning towards the goal reaches it if nothing's in the way
+            turn_cell = row * cols + goal_col
+            vertical = JUMP_UP if goal_row < row else JUMP_DOWN
+            if abs(goal_row - row) <= wall_dists[vertical][turn_cell]:
+                return (row, goal_col)
+        return (row, col + d_col * jump_dist) if jump_dist else None
+
+    def forced(row: int, col: int, direction: int, side: int) -> bool:
+        """True if moving vertically into (row, col), turning to side is forced."""
+        d_row = DIRECTIONS[direction][0]
+        side_col = col + DIRECTIONS[side][1]
+        return (0 <= side_col < cols and graph[row, side_col] == 0 and
+                (not 0 <= row - d_row < jump_grid.rows or graph[row - d_row, side_col] > 0))
+
+    # Search states are (position, direction it was reached in), None for the start
+    start = (pos_a, None)
+    g_scores: dict[tuple[Position, Optional[int]], int] = {start: 0}
+    path_track: dict[tuple[Position, Optional[int]], Optional[tuple]] = {start: None}
+    priority_queue = make_open_list(open_list)
+    priority_queue.push(heuristic(pos_a), 0, start)
+    cells_visited = 0
+    curr = None
+    while priority_queue and cells_visited < max_steps:
+        curr = priority_queue.pop()
+        cells_visited += 1
+        pos, direction = curr
+        if pos == pos_b:
+            break
+        if direction is None:
+            directions = [JUMP_UP, JUMP_DOWN, JUMP_LEFT, JUMP_RIGHT]
+        elif direction in (JUMP_LEFT, JUMP_RIGHT):
+            directions = [direction, JUMP_UP, JUMP_DOWN]
+        else:
+            directions = [direction] + [side for side in (JUMP_LEFT, JUMP_RIGHT)
+                                        if forced(pos[0], pos[1], direction, side)]
+        for next_direction in directions:
+            next_pos = jump(pos[0], pos[1], next_direction)
+            if next_pos is None:
+                continue
+            state = (next_pos, next_direction)
+            g_score = g_scores[curr] + abs(next_pos[0] - pos[0]) + abs(next_pos[1] - pos[1])
+            if state not in g_scores or g_score < g_scores[state]:
+                g_scores[state] = g_score
+                path_track[state] = curr
+                priority_queue.push(g_score + heuristic(next_pos), g_score, state)
+    if stats is not None:
+        stats['cells_visited'] = cells_visited
+    if curr is None or curr[0] != pos_b:
+        return []
+
+    # Fill in the straight runs between jump points
+    jump_points = []
+    while curr is not None:
+        jump_points.append(curr[0])
+        curr = path_track[curr]
+    jump_points.reverse()
+    path = [pos_a]
+    for (row_a, col_a), (row_b, col_b) in zip(jump_points, jump_points[1:]):
+        steps = abs(row_b - row_a) + abs(col_b - col_a)
+        d_row, d_col = (row_b - row_a) // steps, (col_b - col_a) // steps
+        path.extend((row_a + d_row * step, col_a + d_col * step)
+                    for step in range(1, steps + 1))
+    if stats is not None:
+        stats['path_length'] = len(path)
+    return path
+
+
 def st_astar(graph, pos_a: Position, pos_b: Position, dynamic_obstacles: set = set(),
              static_obstacles: set = set(), max_time=20,
              max_cells=10000, t_start=0, end_fast=False,
              heuristic: Optional[HeuristicFunction] = None,
              stats: dict = None,
-             validate_ends=True) -> Path:
+             validate_ends=True, open_list: str = 'heap',
+             time_budget: Optional[float] = None, partial=False,
+             traffic: Optional[TrafficMap] = None, lanes: Optional[Lanes] = None) -> Path:
     """Space-Time A* search.
 
     Each tile is position.
@@ -133,7 +301,8 @@ def st_astar(graph, pos_a: Position, pos_b: Position, dynamic_obstacles: set = s
         graph (_type_): NxN int array, obstacles are non-zero
         pos_a (Position): _description_
         pos_b (Position): _description_
-        dynamic_obstacles (set): set{(row,col,t), ...} of obstacles to avoid. Defaults to set().
+        dynamic_obstacles (set): set{(row,col,t), ...} of obstacles to avoid, or a
+            ReservationTable. Defaults to set().
         static_obstacles (set): set{(row,col), ...} of obstacles to avoid. Defaults to set().
         max_time (int, optional): max time to search up to. Defaults to 20.
         max_cells (int, optional): max cells to visit. Defaults to 10000.
@@ -142,6 +311,14 @@ def st_astar(graph, pos_a: Position, pos_b: Position, dynamic_obstacles: set = s
         heuristic (HeuristicFunction, optional): Heuristic (set for pos_b), Defaults to euclidean_heuristic
         stats (dict, optional): store run-time stats here if it exists. Defaults to None.
         validate_ends (bool, optional): Check if start and end positions are valid. Defaults to True.
+        open_list (str, optional): Open list from OPEN_LISTS. Defaults to 'heap'.
+        time_budget (float, optional): seconds to search for before giving up. Defaults to None.
+        partial (bool, optional): If pos_b isn't reached, return the path to the searched
+            position closest to it by heuristic that nothing is reserved at afterwards, so a
+            robot can wait there. Defaults to False.
+        traffic (TrafficMap, optional): Congestion costs added to each move. Defaults to None.
+        lanes (Lanes, optional): One-way lanes, blocking moves against them or adding their
+            cost. Defaults to None.
 
     Raises:
         ValueError: _description_
@@ -189,20 +366,34 @@ def st_astar(graph, pos_a: Position, pos_b: Position, dynamic_obstacles: set = s
     # f-score: f-score = g-score + h, best guess cost from node to goal
     f_score = g_scores[curr] + heuristic(pos_a)
 
-    # priority queue via heapq
-    # f-score, parent, pos, time
-    priority_queue: list[tuple[float, Optional[PositionST], PositionST]] = [
-        (f_score, None, curr)]
+    priority_queue = make_open_list(open_list)
+    priority_queue.push(f_score, 0, curr)
+
+    t_deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    timed_out = False
+    # Partial path end, has to be closer to pos_b than pos_a, preferring earlier times
+    best_partial: Optional[PositionST] = None
+    best_partial_score = (heuristic(pos_a), t_start)
+    last_reserved_time = get_last_reserved_time(dynamic_obstacles) if partial else None
 
     cells_visited = 0
     while (priority_queue and cells_visited < max_cells):
-        _, _, curr = heapq.heappop(priority_queue)
+        if (t_deadline is not None and cells_visited % TIME_BUDGET_CHECK_CELLS == 0 and
+                time.perf_counter() > t_deadline):
+            timed_out = True
+            break
+        curr = priority_queue.pop()
         # End once destination reached
         if end_fast and curr[:2] == pos_b:
             break
         # Only quit at max_time
         if curr == (pos_b[0], pos_b[1], max_time):
             break
+        if last_reserved_time is not None:
+            partial_score = (heuristic(curr[:2]), curr[2])
+            if (partial_score < best_partial_score and
+                    last_reserved_time(curr[0], curr[1]) < curr[2]):
+                best_partial, best_partial_score = curr, partial_score
 
         row, col, t = curr
 
@@ -213,7 +404,15 @@ def st_astar(graph, pos_a: Position, pos_b: Position, dynamic_obstacles: set = s
                                        (row, col-1, t+1),
                                        (row, col+1, t+1)]
         neighbor_scores = [0.9, 1, 1, 1, 1] # Waiting costs slightly less than moving.
+        if traffic is not None:
+            neighbor_scores = [score + cost for score, cost in
+                               zip(neighbor_scores, traffic.get_move_costs((row, col)))]
+        if lanes is not None:
+            neighbor_scores = [score + cost for score, cost in
+                               zip(neighbor_scores, lanes.get_move_costs((row, col)))]
         for neighbor, neighbor_score in zip(neighbors, neighbor_scores):
+            if neighbor_score == math.inf:
+                continue  # Against a hard lane
             # cost from start to current to neighbor
             potential_g_score = g_scores[curr] + neighbor_score
             # If neighbor available, and tentative g score better than existing if available.
@@ -221,10 +420,7 @@ def st_astar(graph, pos_a: Position, pos_b: Position, dynamic_obstacles: set = s
                     ((neighbor not in g_scores) or potential_g_score < g_scores[neighbor])):
                 g_scores[neighbor] = potential_g_score
                 f_score = g_scores[neighbor] + heuristic(neighbor[:2])
-                new_node: tuple[float, PositionST, PositionST] = (
-                    f_score, curr, neighbor)
-                heapq.heappush(
-                    priority_queue, new_node)
+                priority_queue.push(f_score, potential_g_score, neighbor)
                 path_track[neighbor] = curr
         cells_visited += 1
 
@@ -239,63 +435,428 @@ def st_astar(graph, pos_a: Position, pos_b: Position, dynamic_obstacles: set = s
     path = []
     if curr[:2] == pos_b:
         path = get_path(curr)
+    elif best_partial is not None:
+        path = get_path(best_partial)
 
     if stats is not None:
         stats['cells_visited'] = cells_visited
         stats['path_length'] = len(path)
+        if partial:
+            stats['partial'] = bool(path) and path[-1] != pos_b
+        if time_budget is not None:
+            stats['timed_out'] = timed_out
 
     return path
 
 
-def find_all_collisions(paths: list[list[Position]]):
-    collisions = []
-    for i, path_i in enumerate(paths):
-        for j in range(i+1, len(paths)):
-            collisions.extend(find_collisions(path_i, paths[j], label=j))
-    return collisions
+def st_astar_flat(graph, pos_a: Position, pos_b: Position, dynamic_obstacles: set = set(),
+                  static_obstacles: set = set(), max_time=20,
+                  max_cells=10000, t_start=0, end_fast=False,
+                  heuristic: Optional[HeuristicFunction] = None,
+                  stats: dict = None,
+                  validate_ends=True, open_list: str = 'heap',
+                  time_budget: Optional[float] = None, partial=False,
+                  traffic: Optional[TrafficMap] = None, lanes: Optional[Lanes] = None) -> Path:
+    """Space-Time A* search on a flattened grid, drop-in replacement for st_astar.
+
+    Same arguments and results as st_astar, but cells are flat indices into a cached
+    FlatGrid with precomputed neighbor tables, and search states are packed as
+    `cell * T + t` ints instead of (row, col, t) tuples. Integer keys order the same
+    way as the tuples did, so ties are broken identically with the same open_list.
+    A ReservationTable given as dynamic_obstacles is queried by flat cell directly.
+
+    Returns:
+        path (Path): A list of positions along the found path (or empty list if fail)
+    """
+    if graph[pos_a[0], pos_a[1]] > 0 or graph[pos_b[0], pos_b[1]] > 0:
+        raise ValueError('Start/End locations in walls')
+    if validate_ends and (pos_a in static_obstacles or pos_b in static_obstacles):
+        return []  # Start/End in static obstacles
+
+    flat_grid = get_flat_grid(graph)
+    positions = flat_grid.positions
+    # Hard lanes leave out the moves against them
+    successors = flat_grid.successors if lanes is None else lanes.get_successors(flat_grid)
+    start_cell = flat_grid.cell(pos_a)
+    goal_cell = flat_grid.cell(pos_b)
+
+    # Default to euclidean heuristic if none was provided
+    if (heuristic is None):
+        heuristic = get_euclidean_heuristic(pos_b)
+    heuristic_cache: dict[int, float] = {}
+
+    # Times searched are t_start to max_time+t_start, so T spans all of them
+    t_last = max_time + t_start
+    T = t_last + 1
+    final_key = goal_cell * T + max_time
+
+    curr = start_cell * T + t_start
+    path_track: dict[int, Optional[int]] = {curr: None}  # key -> parent key
+    g_scores = {curr: 0}
+    f_score = g_scores[curr] + heuristic(pos_a)
+    priority_queue = make_open_list(open_list)
+    priority_queue.push(f_score, 0, curr)
+
+    reservations = dynamic_obstacles if isinstance(dynamic_obstacles, ReservationTable) else None
+    # Congestion cost of each move by successor cell, per cell
+    successor_costs = traffic.get_successor_costs(flat_grid) if traffic is not None else None
+    # Cost of each move against lanes by successor cell, per cell
+    lane_costs = lanes.get_successor_costs(flat_grid) if lanes is not None else None
+
+    t_deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    timed_out = False
+    # Partial path end, has to be closer to pos_b than pos_a, preferring earlier times
+    best_partial: Optional[int] = None
+    best_partial_score = (heuristic(pos_a), t_start)
+    last_reserved_time = get_last_reserved_time(dynamic_obstacles) if partial else None
+
+    cells_visited = 0
+    while (priority_queue and cells_visited < max_cells):
+        if (t_deadline is not None and cells_visited % TIME_BUDGET_CHECK_CELLS == 0 and
+                time.perf_counter() > t_deadline):
+            timed_out = True
+            break
+        curr = priority_queue.pop()
+        cell, t = divmod(curr, T)
+        # End once destination reached
+        if end_fast and cell == goal_cell:
+            break
+        # Only quit at max_time
+        if curr == final_key:
+            break
+        if last_reserved_time is not None and cell != start_cell:
+            partial_score = (heuristic_cache[cell], t)
+            if (partial_score < best_partial_score and
+                    last_reserved_time(*positions[cell]) < t):
+                best_partial, best_partial_score = curr, partial_score
+
+        t_next = t + 1
+        if t_next <= t_last:
+            g_curr = g_scores[curr]
+            reserved = reservations.cells_at(t_next) if reservations is not None else None
+            for neighbor_cell in successors[cell]:
+                # Start/end positions are considered valid at all times if not validating ends
+                if validate_ends or (neighbor_cell != start_cell and neighbor_cell != goal_cell):
+                    pos = positions[neighbor_cell]
+                    if pos in static_obstacles:
+                        continue
+                    if reservations is None:
+                        if (pos[0], pos[1], t_next) in dynamic_obstacles:
+                            continue
+                    elif reserved is not None and reserved[neighbor_cell]:
+                        continue
+                neighbor = neighbor_cell * T + t_next
+                # Waiting costs slightly less than moving.
+                potential_g_score = g_curr + (0.9 if neighbor_cell == cell else 1)
+                if successor_costs is not None:
+                    potential_g_score += successor_costs[cell][neighbor_cell]
+                if lane_costs is not None:
+                    potential_g_score += lane_costs[cell][neighbor_cell]
+                if neighbor not in g_scores or potential_g_score < g_scores[neighbor]:
+                    g_scores[neighbor] = potential_g_score
+                    h_score = heuristic_cache.get(neighbor_cell)
+                    if h_score is None:
+                        h_score = heuristic(positions[neighbor_cell])
+                        heuristic_cache[neighbor_cell] = h_score
+                    priority_queue.push(potential_g_score + h_score, potential_g_score, neighbor)
+                    path_track[neighbor] = curr
+        cells_visited += 1
 
-def find_given_collisions(paths: list[list[Position]], selected_idxs: list[int]):
+    path = []
+    end_key = curr if curr // T == goal_cell else best_partial
+    if end_key is not None:
+        key = end_key
+        while key is not None:
+            path.append(positions[key // T])  # remove time from path
+            key = path_track[key]
+        path.reverse()
+
+    if stats is not None:
+        stats['cells_visited'] = cells_visited
+        stats['path_length'] = len(path)
+        if partial:
+            stats['partial'] = bool(path) and path[-1] != pos_b
+        if time_budget is not None:
+            stats['timed_out'] = timed_out
+
+    return path
+
+
+def windowed_st_astar(graph, pos_a: Position, pos_b: Position, dynamic_obstacles: set = set(),
+                      static_obstacles: set = set(), window=20,
+                      max_cells=10000, t_start=0,
+                      heuristic: Optional[HeuristicFunction] = None,
+                      stats: dict = None,
+                      validate_ends=True, open_list: str = 'heap',
+                      time_budget: Optional[float] = None) -> Path:
+    """Windowed Space-Time A* (WHCA*), a full path from a to b that only avoids dynamic
+    obstacles for its first window steps.
+
+    Times t_start to t_start + window - 1 are searched in space-time like st_astar_flat.
+    Past that every time collapses into one layer searched as plain A* over cells, so
+    the rest of the path only avoids static obstacles, relying on the heuristic (ideally
+    true distances) to go straight there. The path is meant to be replanned before it
+    leaves the window. Ends as soon as pos_b is reached, like st_astar with end_fast.
+
+    Args:
+        graph (_type_): NxN int array, obstacles are non-zero
+        pos_a (Position): Start position
+        pos_b (Position): Finish position
+        dynamic_obstacles (set): set{(row,col,t), ...} of obstacles to avoid, or a
+            ReservationTable. Defaults to set().
+        static_obstacles (set): set{(row,col), ...} of obstacles to avoid. Defaults to set().
+        window (int, optional): number of path steps checked against dynamic obstacles.
+        max_cells (int, optional): max cells to search. Defaults to 10000.
+        t_start (int, optional): offset start time if this path starts later in dynamic obstacles.
+        heuristic (HeuristicFunction, optional): Heuristic (set for pos_b), Defaults to
+            euclidean_heuristic
+        stats (dict, optional): store run-time stats here if it exists. Defaults to None.
+        validate_ends (bool, optional): Check if start and end positions are valid.
+            Defaults to True.
+        open_list (str, optional): Open list from OPEN_LISTS. Defaults to 'heap'.
+        time_budget (float, optional): seconds to search for before giving up. Defaults to None.
+
+    Raises:
+        ValueError: If start/end positions are in walls
+
+    Returns:
+        path (Path): A list of positions along the found path (or empty list if fail)
+    """
+    if graph[pos_a[0], pos_a[1]] > 0 or graph[pos_b[0], pos_b[1]] > 0:
+        raise ValueError('Start/End locations in walls')
+    if validate_ends and (pos_a in static_obstacles or pos_b in static_obstacles):
+        return []  # Start/End in static obstacles
+
+    flat_grid = get_flat_grid(graph)
+    positions = flat_grid.positions
+    successors = flat_grid.successors
+    open_neighbors = flat_grid.open_neighbors
+    start_cell = flat_grid.cell(pos_a)
+    goal_cell = flat_grid.cell(pos_b)
+
+    if (heuristic is None):
+        heuristic = get_euclidean_heuristic(pos_b)
+    heuristic_cache: dict[int, float] = {}
+
+    # Time layer every step from the end of the window on shares
+    t_window = t_start + max(window, 1)
+    T = t_window + 1
+
+    curr = start_cell * T + t_start
+    path_track: dict[int, Optional[int]] = {curr: None}  # key -> parent key
+    g_scores = {curr: 0}
+    f_score = g_scores[curr] + heuristic(pos_a)
+    priority_queue = make_open_list(open_list)
+    priority_queue.push(f_score, 0, curr)
+
+    reservations = dynamic_obstacles if isinstance(dynamic_obstacles, ReservationTable) else None
+
+    t_deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    timed_out = False
+    cells_visited = 0
+    while (priority_queue and cells_visited < max_cells):
+        if (t_deadline is not None and cells_visited % TIME_BUDGET_CHECK_CELLS == 0 and
+                time.perf_counter() > t_deadline):
+            timed_out = True
+            break
+        curr = priority_queue.pop()
+        cell, t = divmod(curr, T)
+        if cell == goal_cell:
+            break
+
+        t_next = min(t + 1, t_window)
+        g_curr = g_scores[curr]
+        reserved = None
+        if t_next < t_window and reservations is not None:
+            reserved = reservations.cells_at(t_next)
+        # Past the window waiting gets nowhere, only move
+        for neighbor_cell in (successors[cell] if t_next < t_window else open_neighbors[cell]):
+            if validate_ends or (neighbor_cell != start_cell and neighbor_cell != goal_cell):
+                pos = positions[neighbor_cell]
+                if pos in static_obstacles:
+                    continue
+                if t_next < t_window:
+                    if reservations is None:
+                        if (pos[0], pos[1], t_next) in dynamic_obstacles:
+                            continue
+                    elif reserved is not None and reserved[neighbor_cell]:
+                        continue
+            neighbor = neighbor_cell * T + t_next
+            # Waiting costs slightly less than moving.
+            potential_g_score = g_curr + (0.9 if neighbor_cell == cell else 1)
+            if neighbor not in g_scores or potential_g_score < g_scores[neighbor]:
+                g_scores[neighbor] = potential_g_score
+                h_score = heuristic_cache.get(neighbor_cell)
+                if h_score is None:
+                    h_score = heuristic(positions[neighbor_cell])
+                    heuristic_cache[neighbor_cell] = h_score
+                priority_queue.push(potential_g_score + h_score, potential_g_score, neighbor)
+                path_track[neighbor] = curr
+        cells_visited += 1
+
+    path = []
+    if curr // T == goal_cell:
+        key = curr
+        while key is not None:
+            path.append(positions[key // T])  # remove time from path
+            key = path_track[key]
+        path.reverse()
+
+    if stats is not None:
+        stats['cells_visited'] = cells_visited
+        stats['path_length'] = len(path)
+        if time_budget is not None:
+            stats['timed_out'] = timed_out
+
+    return path
+
+
+class CollisionIndex:
+    """Hash of which paths are at each (position, t) and take each move (from, to, t).
+
+    Paths stay at their last position after they end, as robots wait at their goal. Each path
+    is hashed once, so finding all collisions is linear in the total path length rather than
+    comparing every pair of paths, and solvers can swap out single paths as they replan them.
+    """
+
+    def __init__(self, paths: Optional[list[Path]] = None) -> None:
+        self.paths: dict[int, Path] = {}
+        self.visits: dict[Position, dict[int, set[int]]] = defaultdict(dict)  # pos -> t -> idxs
+        # (from, to) -> t -> idxs, moves arriving at t, including waits where from == to
+        self.moves: dict[tuple[Position, Position], dict[int, set[int]]] = defaultdict(dict)
+        self.resting: dict[Position, dict[int, int]] = defaultdict(dict)  # pos -> idx -> from t
+        if paths:
+            for path_idx, path in enumerate(paths):
+                self.set_path(path_idx, path)
+
+    def set_path(self, path_idx: int, path: Path):
+        """Set the path for path_idx, replacing its previous one. Path is not modified."""
+        self.remove_path(path_idx)
+        self.paths[path_idx] = path
+        if not path:
+            return
+        for t, pos in enumerate(path):
+            self.visits[pos].setdefault(t, set()).add(path_idx)
+            if t > 0:
+                self.moves[path[t-1], pos].setdefault(t, set()).add(path_idx)
+        self.resting[path[-1]][path_idx] = len(path)
+
+    def remove_path(self, path_idx: int):
+        """Remove the path for path_idx if there is one."""
+        path = self.paths.pop(path_idx, None)
+        if not path:
+            return
+        for t, pos in enumerate(path):
+            self._discard(self.visits[pos], t, path_idx)
+            if t > 0:
+                self._discard(self.moves[path[t-1], pos], t, path_idx)
+        del self.resting[path[-1]][path_idx]
+
+    @staticmethod
+    def _discard(times: dict[int, set[int]], t: int, path_idx: int):
+        idxs = times[t]
+        idxs.discard(path_idx)
+        if not idxs:
+            del times[t]
+
+    def path_collisions(self, path_idx: int) -> list[tuple[int, int, int, Position]]:
+        """Collisions of the path for path_idx with every other path in the index.
+
+        Returns:
+            list[tuple[int, int, int, Position]]: Sorted (other_idx, t, kind, pos) collisions,
+                kind is VERTEX_CONFLICT or EDGE_CONFLICT. pos is where the other path is at t.
+        """
+        path = self.paths.get(path_idx)
+        if not path:
+            return []
+        collisions = []
+        for t, pos in enumerate(path):
+            for other in self.visits[pos].get(t, ()):
+                if other != path_idx:
+                    collisions.append((other, t, VERTEX_CONFLICT, pos))
+            for other, t_rest in self.resting[pos].items():
+                if t_rest <= t and other != path_idx:
+                    collisions.append((other, t, VERTEX_CONFLICT, pos))
+            if t > 0:
+                prev_pos = path[t-1]
+                # Other paths taking the same edge the other way, or waiting along with this one
+                for other in self.moves[pos, prev_pos].get(t, ()):
+                    if other != path_idx:
+                        collisions.append((other, t, EDGE_CONFLICT, prev_pos))
+                if prev_pos == pos:
+                    for other, t_rest in self.resting[pos].items():
+                        if t_rest <= t and other != path_idx:
+                            collisions.append((other, t, EDGE_CONFLICT, pos))
+        # Other paths passing through or waiting at the goal after this one has ended there
+        goal = path[-1]
+        for t, others in self.visits[goal].items():
+            if t >= len(path):
+                collisions.extend((other, t, VERTEX_CONFLICT, goal)
+                                  for other in others if other != path_idx)
+        for t, others in self.moves[goal, goal].items():
+            if t >= len(path):
+                collisions.extend((other, t, EDGE_CONFLICT, goal)
+                                  for other in others if other != path_idx)
+        collisions.sort()
+        return collisions
+
+    def find_collisions(self, selected_idxs: Optional[Iterable[int]] = None) -> list[Collision]:
+        """Collisions between paths, each pair reported once labelled with the other path.
+
+        Args:
+            selected_idxs (Iterable[int], optional): Only find collisions of these paths with
+                any other path, ordered by these. Defaults to all paths, ordered by index, with
+                pairs labelled by the larger index.
+
+        Returns:
+            list[Collision]: (path_idx, row, col, t) collisions, ordered as find_collisions
+                would return them pair by pair.
+        """
+        checked: set[int] = set()
+        collisions: list[Collision] = []
+        for path_idx in (sorted(self.paths) if selected_idxs is None else selected_idxs):
+            checked.add(path_idx)
+            for other, t, _kind, pos in self.path_collisions(path_idx):
+                if other in checked or (selected_idxs is None and other < path_idx):
+                    continue
+                collisions.append((other, pos[0], pos[1], t))
+        return collisions
+
+
+def find_all_collisions(paths: list[Path]) -> list[Collision]:
+    """Find all vertex and edge collisions between paths, see find_collisions."""
+    return CollisionIndex(paths).find_collisions()
+
+
+def find_given_collisions(paths: list[Path], selected_idxs: Iterable[int]) -> list[Collision]:
+    """Find collisions of the selected paths with any other path, see find_collisions."""
     # selected_idxs are the indices of paths that should be compared to other paths
-    collisions = []
-    checked = set()
-    for i in selected_idxs:
-        for j, paths_j in enumerate(paths):
-            if i == j:
-                continue
-            if (i,j) in checked or (j,i) in checked:
-                continue
-            checked.add((i,j))
-            collisions.extend(find_collisions(paths[i], paths_j, label=j))
-    return collisions
+    return CollisionIndex(paths).find_collisions(list(selected_idxs))
 
 
 def find_collisions(path1: list[Position],
                     path2: list[Position], label: int = 1) -> list[Collision]:
     # Find any vertex and edge collisions, and return a list of (path_idx,row,col,t) collisions
     # for edge collisions, obstacles are for path2 to avoid
-
-    # extend shorter path with waits
-    # tmax = min(len(path1), len(path2))
     if not path1 or not path2:
         return []
-    diff = len(path2) - len(path1)
-    if diff > 0:
-        # if path 2 longer
-        path1.extend(diff*[path1[-1]])
-    elif diff < 0:
-        path2.extend((-diff)*[path2[-1]])
-
-    tmax = len(path1)
+
+    # Shorter path waits at its end
+    def pos_at(path: list[Position], t: int) -> Position:
+        return path[t] if t < len(path) else path[-1]
+
+    tmax = max(len(path1), len(path2))
     collisions: list[Collision] = []  # (path_name,row,col,t)
     for t in range(tmax):
+        pos1, pos2 = pos_at(path1, t), pos_at(path2, t)
         # vertex collision
-        if path1[t] == path2[t]:
-            collisions.append((label, path1[t][0], path1[t][1], t))
+        if pos1 == pos2:
+            collisions.append((label, pos1[0], pos1[1], t))
 
         # edge collision, robots swap locations, just add all times
-        if (t-1 >= 0) and path1[t-1] == path2[t] and path1[t] == path2[t-1]:
+        if t > 0 and pos_at(path1, t-1) == pos2 and pos1 == pos_at(path2, t-1):
             # obstacle for path 2
-            collisions.append((label, path2[t][0], path2[t][1], t))
+            collisions.append((label, pos2[0], pos2[1], t))
 
             # todo: add dynamic obstacles with path reference
             # collisions.append([path1[t-1][0], path1[t-1][1], t])
@@ -307,11 +868,11 @@ def find_collisions(path1: list[Position],
 def mapf0(grid, starts, goals):
     # For several robots with given start/goal locations and a grid
     # Get paths for all, do all as independent
-    #  - independent A-star for each as initial paths
+    #  - independent A-star (as JPS) for each as initial paths
     assert len(starts) == len(goals)
     paths = []
     for i, start in enumerate(starts):
-        paths.append(astar(grid, start, goals[i]))
+        paths.append(jps(grid, start, goals[i]))
     return paths
 
 
@@ -319,15 +880,16 @@ def mapf1(grid, starts, goals, maxiter=5, max_time=20):
     # For several robots with given start/goal locations and a grid
     # Attempt to find paths for all that don't collide
     # Attempt 1:
-    #  - independent A-star for each as initial paths
+    #  - independent A-star (as JPS) for each as initial paths
     #  - check for collisions as dynamic obstacles
     #  - st_astar for paths (priority ordering) that collide until no collisions
     assert len(starts) == len(goals)
     paths = []
     for i, start in enumerate(starts):
-        paths.append(astar(grid, start, goals[i]))
+        paths.append(jps(grid, start, goals[i]))
 
-    collisions = find_all_collisions(paths)
+    collision_index = CollisionIndex(paths)
+    collisions = collision_index.find_collisions()
     # dict of collisions per path
     path_collisions = defaultdict(set)
     for collision in collisions:
@@ -351,7 +913,8 @@ def mapf1(grid, starts, goals, maxiter=5, max_time=20):
             grid, starts[path_idx], goals[path_idx], dynamic_obstacles, max_time=max_time)
         # print('After:')
         # print(paths[path_idx])
-        collisions = find_all_collisions(paths)
+        collision_index.set_path(path_idx, paths[path_idx])
+        collisions = collision_index.find_collisions()
         if not collisions:
             break
 
@@ -365,16 +928,17 @@ def mapf1(grid, starts, goals, maxiter=5, max_time=20):
 def mapf2(grid, starts, goals, maxiter=5, max_time=20):
     # For several robots with given start/goal locations and a grid
     # Attempt 2:
-    #  - independent A-star for each as initial paths
+    #  - independent A-star (as JPS) for each as initial paths
     #  - All paths w/o collisions are locked and considered dynamic obstacles
     #  - For paths with collisions
     #    - st_astar for paths (priority ordering) that collide until no collisions
     assert len(starts) == len(goals)
     paths: list[Path] = []
     for i, start in enumerate(starts):
-        paths.append(astar(grid, start, goals[i]))
+        paths.append(jps(grid, start, goals[i]))
 
-    collisions = find_all_collisions(paths)
+    collision_index = CollisionIndex(paths)
+    collisions = collision_index.find_collisions()
     # dict of collisions per path
     path_collisions = defaultdict(set)
     for collision in collisions:
@@ -407,12 +971,13 @@ def mapf2(grid, starts, goals, maxiter=5, max_time=20):
         # Update given path with new one avoiding collisions and other legal paths
         paths[path_idx] = st_astar(
             grid, starts[path_idx], goals[path_idx], dynamic_obstacles, max_time=max_time)
-        
+        collision_index.set_path(path_idx, paths[path_idx])
+
         # Check to see if any colliding paths remain, break if not
         # collisions = find_given_collisions(paths, path_collisions.keys())
         # We only need to check the colliding paths since we the non-colliding paths are unchanged 
         # and the colliding ones avoid existing paths.
-        collisions = find_given_collisions(paths, path_collisions.keys())
+        collisions = collision_index.find_collisions(list(path_collisions.keys()))
         # if not collisions:
         #     break
 
@@ -430,4 +995,4 @@ def mapf2(grid, starts, goals, maxiter=5, max_time=20):
             break
 
     print(f'Iterated {i} times')
-    return paths
\ No newline at end of file
+    return paths
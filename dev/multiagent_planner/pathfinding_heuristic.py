@@ -1,13 +1,31 @@
 # This folder provides a function for generating an optimal heuristic table for a given grid
 # optimal as in A* shortest path from any open cell to any other open cell
-from collections import deque
+import base64
+from collections import OrderedDict, deque
 import functools
+import hashlib
+import heapq
+import json
+import multiprocessing
 import pickle
 import os
 import time
+from typing import Iterator, Optional, Union
 import numpy as np
 from .pathfinding import Position
 
+# Distances are stored as uint16, with the max value marking unreachable cells
+UNREACHABLE = int(np.iinfo(np.uint16).max)
+# Goals searched together by get_distances_batch, bounds memory to a few arrays of
+# (batch, rows, cols)
+BFS_BATCH_SIZE = int(os.getenv('BFS_BATCH_SIZE', default='32'))
+# Processes used to build heuristics, each building a batch of goals at a time
+HEURISTIC_BUILD_PROCESSES = int(os.getenv('HEURISTIC_BUILD_PROCESSES', default='1'))
+# Version of the saved HeuristicStore header and layout, older files are rebuilt
+HEURISTIC_FORMAT_VERSION = 1
+# Distance fields kept by a LazyHeuristic for goals outside its preloaded ones
+HEURISTIC_CACHE_SIZE = int(os.getenv('HEURISTIC_CACHE_SIZE', default='256'))
+
 
 def timeit(func):
     @functools.wraps(func)
@@ -52,14 +70,94 @@ def get_distances(grid, start: Position, dtype=None) -> np.ndarray:
                 queue.append((new_x, new_y))
     return distances
 
+def get_distances_batch(grid, starts: list[Position], dtype=np.int32,
+                        unreachable: int = -1,
+                        blocked_moves: Optional[np.ndarray] = None) -> np.ndarray:
+    """BFS distances from each start, same as get_distances for each of them, as a
+    (len(starts), rows, cols) array with unreachable for cells that can't be reached.
+
+    Instead of a queue of cells, whole frontiers of every start expand at once by shifting
+    boolean arrays one cell in each direction, so each BFS level is a handful of numpy ops.
+
+    With blocked_moves, bool (4, rows, cols) True where moving in that direction of
+    DIRECTIONS out of the cell is not allowed (see Lanes), moves only go one way, so the
+    distances are from each cell to the start instead, as a heuristic to it needs.
+    """
+    open_cells = np.asarray(grid) == 0
+    rows, cols = open_cells.shape
+    starts_array = np.array(starts, dtype=np.intp).reshape(-1, 2)
+    batch = len(starts_array)
+    distances = np.full((batch, rows, cols), unreachable, dtype=dtype)
+    frontier = np.zeros((batch, rows, cols), dtype=bool)
+    frontier[np.arange(batch), starts_array[:, 0], starts_array[:, 1]] = True
+    distances[frontier] = 0
+    unvisited = np.broadcast_to(open_cells, frontier.shape) & ~frontier
+    next_frontier = np.empty_like(frontier)
+    # Cells that can move up, down, left and right, in DIRECTIONS order
+    allowed = ~np.asarray(blocked_moves, dtype=bool) if blocked_moves is not None else None
+    dist = 0
+    while True:
+        dist += 1
+        # Cells next to the frontier, moving down, up, right and left
+        next_frontier[:] = False
+        if allowed is None:
+            next_frontier[:, 1:, :] |= frontier[:, :-1, :]
+            next_frontier[:, :-1, :] |= frontier[:, 1:, :]
+            next_frontier[:, :, 1:] |= frontier[:, :, :-1]
+            next_frontier[:, :, :-1] |= frontier[:, :, 1:]
+        else:
+            # Only cells allowed to move back onto the frontier
+            next_frontier[:, 1:, :] |= frontier[:, :-1, :] & allowed[0, 1:, :]
+            next_frontier[:, :-1, :] |= frontier[:, 1:, :] & allowed[1, :-1, :]
+            next_frontier[:, :, 1:] |= frontier[:, :, :-1] & allowed[2, :, 1:]
+            next_frontier[:, :, :-1] |= frontier[:, :, 1:] & allowed[3, :, :-1]
+        next_frontier &= unvisited
+        if not next_frontier.any():
+            break
+        np.logical_xor(unvisited, next_frontier, out=unvisited)
+        np.copyto(distances, dist, where=next_frontier)
+        frontier, next_frontier = next_frontier, frontier
+    return distances
+
+
+def _get_distances_batch_args(args) -> np.ndarray:
+    """get_distances_batch taking a tuple of its arguments, for process pools."""
+    return get_distances_batch(*args)
+
+
+def map_distance_batches(grid, starts: list[Position], dtype=np.int32, unreachable: int = -1,
+                         processes: int = HEURISTIC_BUILD_PROCESSES,
+                         batch_size: int = BFS_BATCH_SIZE,
+                         blocked_moves: Optional[np.ndarray] = None) -> Iterator[np.ndarray]:
+    """Yield get_distances_batch results for starts in batches of batch_size, in order,
+    spread over a pool of processes if more than one."""
+    batches = [(grid, starts[idx:idx + batch_size], dtype, unreachable, blocked_moves)
+               for idx in range(0, len(starts), batch_size)]
+    if processes > 1 and len(batches) > 1:
+        with multiprocessing.Pool(min(processes, len(batches))) as pool:
+            yield from pool.imap(_get_distances_batch_args, batches)
+    else:
+        yield from map(_get_distances_batch_args, batches)
+
+
 # @timeit
-def build_true_heuristic(grid, positions: list[Position]):
+def build_true_heuristic(grid, positions: list[Position],
+                         processes: int = HEURISTIC_BUILD_PROCESSES,
+                         blocked_moves: Optional[np.ndarray] = None):
     """
     Builds a heuristic dict keyed for all given positions
     heuristic_dict[pos] = 2D np grid with each cell containing integer distance to it from pos
     Impassable cells are -1 score
+    With blocked_moves (see get_distances_batch) distances are to pos along allowed moves
     """
-    true_heuristic_dict_for_grid = {Position(pos): get_distances(grid, pos) for pos in positions}
+    positions = [Position(pos) for pos in positions]
+    true_heuristic_dict_for_grid = {}
+    idx = 0
+    for distances in map_distance_batches(grid, positions, dtype=np.asarray(grid).dtype,
+                                          processes=processes, blocked_moves=blocked_moves):
+        for field in distances:
+            true_heuristic_dict_for_grid[positions[idx]] = field
+            idx += 1
     return true_heuristic_dict_for_grid
 
 def write_heuristic_to_file(filename: str, heuristic: dict):
@@ -71,24 +169,529 @@ def load_heuristic_from_file(filename: str):
         _dict = pickle.load(f)    
     return _dict
 
+
+class DistanceField:
+    """Distances to one goal of a HeuristicStore, indexed by position like the 2D grids of
+    a heuristic dict, with -1 for unreachable cells."""
+
+    def __init__(self, distances: np.ndarray) -> None:
+        self.distances = distances  # uint16 (rows, cols), UNREACHABLE if unreachable
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.distances.shape
+
+    def __getitem__(self, pos: Position) -> int:
+        dist = int(self.distances[pos])
+        return -1 if dist == UNREACHABLE else dist
+
+    def to_array(self) -> np.ndarray:
+        """Return distances as an int array with -1 for unreachable cells."""
+        distances = self.distances.astype(np.int32)
+        distances[distances == UNREACHABLE] = -1
+        return distances
+
+
+def heuristic_fingerprint(grid, goals: list[Position],
+                          blocked_moves: Optional[np.ndarray] = None) -> str:
+    """Hash of the grid's walls, the goals and any blocked moves, which together decide
+    every distance."""
+    walls = np.asarray(grid) != 0
+    digest = hashlib.sha256()
+    digest.update(np.array(walls.shape, dtype=np.int64).tobytes())
+    digest.update(np.packbits(walls).tobytes())
+    digest.update(np.array(goals, dtype=np.int64).reshape(-1, 2).tobytes())
+    if blocked_moves is not None:
+        digest.update(b'lanes')
+        digest.update(np.packbits(np.asarray(blocked_moves, dtype=bool)).tobytes())
+    return digest.hexdigest()
+
+
+def _open_neighbors(open_cells: np.ndarray, row: int, col: int) -> list[Position]:
+    rows, cols = open_cells.shape
+    return [(n_row, n_col) for n_row, n_col in
+            ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1))
+            if 0 <= n_row < rows and 0 <= n_col < cols and open_cells[n_row, n_col]]
+
+
+def get_stale_goals(distances: np.ndarray, old_grid, grid) -> np.ndarray:
+    """Which distance fields of old_grid, as uint16 (goals, rows, cols), need a rebuild for
+    grid. The rest only differ at the changed cells themselves, see patch_fields.
+
+    Only the fields around each changed cell are checked. A blocked cell matters to a
+    field if a cell one step further from the goal has no other open cell one step closer,
+    so would have to go around. An opened cell matters if it joins cells further than 2
+    steps apart, a shortcut, or joins unreached cells to reached ones.
+
+    Returns:
+        np.ndarray: bool per goal, True if its field needs a rebuild
+    """
+    old_open = np.asarray(old_grid) == 0
+    new_open = np.asarray(grid) == 0
+    changed = old_open != new_open
+    stale = np.zeros(len(distances), dtype=bool)
+    for row, col in np.argwhere(changed):
+        dist = distances[:, row, col].astype(np.int64)
+        if new_open[row, col]:
+            neighbors = _open_neighbors(new_open, row, col)
+            if not neighbors:
+                continue
+            near = np.stack([distances[:, n_row, n_col].astype(np.int64)
+                             for n_row, n_col in neighbors])
+            reached = near != UNREACHABLE
+            any_reached = reached.any(axis=0)
+            if any(changed[pos] for pos in neighbors):
+                stale |= any_reached  # Next to another opened cell, too much to check
+                continue
+            lowest = np.where(reached, near, UNREACHABLE).min(axis=0)
+            highest = np.where(reached, near, -1).max(axis=0)
+            stale |= any_reached & ((highest - lowest > 2) | ~reached.all(axis=0))
+        else:
+            reached = dist != UNREACHABLE
+            for n_row, n_col in _open_neighbors(new_open, row, col):
+                child = reached & (distances[:, n_row, n_col] == dist + 1)
+                other_parent = np.zeros_like(child)
+                for parent in _open_neighbors(new_open, n_row, n_col):
+                    other_parent |= distances[:, parent[0], parent[1]] == dist
+                stale |= child & ~other_parent
+    return stale
+
+
+def patch_fields(distances: np.ndarray, old_grid, grid):
+    """Update distance fields of old_grid in place for grid, at the changed cells only.
+    Only valid for fields get_stale_goals says don't need a rebuild."""
+    old_open = np.asarray(old_grid) == 0
+    new_open = np.asarray(grid) == 0
+    distances[:, old_open & ~new_open] = UNREACHABLE
+    for row, col in np.argwhere(new_open & ~old_open):
+        neighbors = _open_neighbors(new_open, row, col)
+        if not neighbors:
+            distances[:, row, col] = UNREACHABLE
+            continue
+        near = np.stack([distances[:, n_row, n_col].astype(np.int64)
+                         for n_row, n_col in neighbors])
+        lowest = near.min(axis=0)
+        distances[:, row, col] = np.where(lowest == UNREACHABLE, UNREACHABLE, lowest + 1)
+
+
+def repair_field(field: np.ndarray, goal: Position, old_grid, grid,
+                 max_cells: Optional[int] = None) -> bool:
+    """Repair one uint16 distance field of old_grid in place for grid, only touching cells
+    whose distance changes, like LPA*/D* Lite do for their g-values.
+
+    Blocked cells first: cells in increasing distance lose their distance if every open
+    neighbor one step closer lost it too, then get the best distance through the cells
+    that kept theirs. Opened cells then spread any shorter distances outwards.
+
+    Returns:
+        bool: False if the goal itself changed or more than max_cells cells were touched,
+            leaving the field partially repaired, so it should be rebuilt instead
+    """
+    old_open = np.asarray(old_grid) == 0
+    new_open = np.asarray(grid) == 0
+    if old_open[goal] != new_open[goal]:
+        return False
+    if max_cells is None:
+        max_cells = field.size
+    touched = 0
+
+    # Cells that can't keep their distance, found closest to the goal first
+    blocked = [tuple(pos) for pos in np.argwhere(old_open & ~new_open)]
+    lost: set[Position] = set()
+    queue = [(int(field[pos]), pos) for pos in blocked if field[pos] != UNREACHABLE]
+    heapq.heapify(queue)
+    while queue:
+        dist, pos = heapq.heappop(queue)
+        for neighbor in _open_neighbors(new_open, *pos):
+            if neighbor in lost or field[neighbor] != dist + 1:
+                continue
+            if any(field[parent] == dist and parent not in lost
+                   for parent in _open_neighbors(new_open, *neighbor)):
+                continue  # Still has a way to the goal as short as before
+            lost.add(neighbor)
+            touched += 1
+            if touched > max_cells:
+                return False
+            heapq.heappush(queue, (dist + 1, neighbor))
+    for pos in blocked:
+        field[pos] = UNREACHABLE
+    for pos in lost:
+        field[pos] = UNREACHABLE
+
+    # Spread distances into lost and opened cells from their neighbors
+    queue = []
+    for pos in list(lost) + [tuple(pos) for pos in np.argwhere(new_open & ~old_open)]:
+        field[pos] = UNREACHABLE
+        near = [int(field[neighbor]) for neighbor in _open_neighbors(new_open, *pos)]
+        dist = min(near, default=UNREACHABLE)
+        if dist != UNREACHABLE:
+            heapq.heappush(queue, (dist + 1, pos))
+    while queue:
+        dist, pos = heapq.heappop(queue)
+        if dist >= field[pos]:
+            continue
+        field[pos] = dist
+        touched += 1
+        if touched > max_cells:
+            return False
+        for neighbor in _open_neighbors(new_open, *pos):
+            if dist + 1 < field[neighbor]:
+                heapq.heappush(queue, (dist + 1, neighbor))
+    return True
+
+
+def repair_fields(distances: np.ndarray, goals: list[Position], old_grid, grid,
+                  max_cells: Optional[int] = None,
+                  blocked_moves: Optional[np.ndarray] = None) -> int:
+    """Update uint16 (goals, rows, cols) distance fields of old_grid in place for grid.
+
+    Fields get_stale_goals finds unaffected are just patched at the changed cells, stale
+    ones are repaired with repair_field, and any that touch more than max_cells cells
+    (defaults to an eighth of the grid) are rebuilt with a batched BFS instead. Patches and
+    repairs assume moves go both ways, so with blocked_moves every field is rebuilt.
+
+    Returns:
+        int: how many fields were repaired or rebuilt
+    """
+    if blocked_moves is not None:
+        for batch_start in range(0, len(goals), BFS_BATCH_SIZE):
+            slots = slice(batch_start, batch_start + BFS_BATCH_SIZE)
+            distances[slots] = get_distances_batch(grid, goals[slots], dtype=np.uint16,
+                                                   unreachable=UNREACHABLE,
+                                                   blocked_moves=blocked_moves)
+        return len(goals)
+    stale = get_stale_goals(distances, old_grid, grid)
+    if not stale.all():
+        patched = distances[~stale]
+        patch_fields(patched, old_grid, grid)
+        distances[~stale] = patched
+    if max_cells is None:
+        max_cells = max(np.size(grid) // 8, 1)
+    slots_to_build = [slot for slot in np.flatnonzero(stale)
+                      if not repair_field(distances[slot], goals[slot], old_grid, grid,
+                                          max_cells)]
+    for batch_start in range(0, len(slots_to_build), BFS_BATCH_SIZE):
+        slots = slots_to_build[batch_start:batch_start + BFS_BATCH_SIZE]
+        distances[slots] = get_distances_batch(grid, [goals[slot] for slot in slots],
+                                               dtype=np.uint16, unreachable=UNREACHABLE)
+    return int(stale.sum())
+
+
+class HeuristicStore:
+    """True distance heuristic for many goals packed in one contiguous uint16
+    (goals, rows, cols) array, with a goal -> slot index.
+
+    Saved as a .npy of distances plus a JSON header with the format version, goals, grid
+    walls, any moves blocked by lanes and their fingerprint, and loaded memory-mapped so
+    startup doesn't read every distance field, and processes opening the same file share its
+    pages. Looks up like a heuristic dict, `store[pos_b][pos_a]`.
+    """
+
+    def __init__(self, goals: list[Position], distances: np.ndarray,
+                 grid: Optional[np.ndarray] = None,
+                 blocked_moves: Optional[np.ndarray] = None) -> None:
+        if distances.dtype != np.uint16 or distances.shape[0] != len(goals):
+            raise ValueError(f'Expected uint16 distances for {len(goals)} goals, '
+                             f'got {distances.dtype} {distances.shape}')
+        self.goals = [Position((int(row), int(col))) for row, col in goals]
+        self.slots = {goal: slot for slot, goal in enumerate(self.goals)}
+        self.distances = distances
+        self.grid = grid  # Grid the distances are for, if known
+        self.blocked_moves = blocked_moves  # Moves lanes block (see get_distances_batch)
+
+    @staticmethod
+    def from_heuristic_dict(heuristic_dict: dict[Position, np.ndarray]) -> 'HeuristicStore':
+        """Pack a heuristic dict of 2D distance grids (-1 unreachable) into a store."""
+        goals = list(heuristic_dict)
+        shape = next(iter(heuristic_dict.values())).shape if goals else (0, 0)
+        distances = np.empty((len(goals), *shape), dtype=np.uint16)
+        for slot, goal in enumerate(goals):
+            field = heuristic_dict[goal]
+            if field.max(initial=0) >= UNREACHABLE:
+                raise ValueError(f'Distances to {goal} do not fit in uint16')
+            distances[slot] = np.where(field < 0, UNREACHABLE, field)
+        return HeuristicStore(goals, distances)
+
+    @staticmethod
+    def build(grid, goals: list[Position],
+              processes: int = HEURISTIC_BUILD_PROCESSES,
+              blocked_moves: Optional[np.ndarray] = None) -> 'HeuristicStore':
+        """Build the true distance heuristic of grid for all goals, with vectorized BFS
+        across processes if more than one, along the moves blocked_moves allows if given."""
+        if grid.size >= UNREACHABLE:
+            raise ValueError(f'Grid {grid.shape} too large for uint16 distances')
+        goals = list(dict.fromkeys(Position((int(row), int(col))) for row, col in goals))
+        distances = np.empty((len(goals), *grid.shape), dtype=np.uint16)
+        slot = 0
+        for batch in map_distance_batches(grid, goals, dtype=np.uint16, unreachable=UNREACHABLE,
+                                          processes=processes, blocked_moves=blocked_moves):
+            distances[slot:slot + len(batch)] = batch
+            slot += len(batch)
+        return HeuristicStore(goals, distances, grid=np.asarray(grid) != 0,
+                              blocked_moves=blocked_moves)
+
+    def rebuild(self, grid, goals: list[Position],
+                processes: int = HEURISTIC_BUILD_PROCESSES,
+                blocked_moves: Optional[np.ndarray] = None) -> tuple['HeuristicStore', int]:
+        """Build a store for grid and goals, reusing the distance fields of this store
+        (whose grid must be known) that get_stale_goals finds unchanged. With lanes in either
+        store every goal is built, as reuse assumes moves go both ways.
+
+        Returns:
+            tuple[HeuristicStore, int]: new store, and how many of its goals were built
+        """
+        goals = list(dict.fromkeys(Position((int(row), int(col))) for row, col in goals))
+        if (self.grid is None or self.grid.shape != np.shape(grid) or
+                self.blocked_moves is not None or blocked_moves is not None):
+            return HeuristicStore.build(grid, goals, processes, blocked_moves), len(goals)
+        stale = get_stale_goals(self.distances, self.grid, grid)
+        distances = np.empty((len(goals), *self.grid.shape), dtype=np.uint16)
+        slots_to_build, slots_reused = [], []
+        for slot, goal in enumerate(goals):
+            old_slot = self.slots.get(goal)
+            if old_slot is None or stale[old_slot]:
+                slots_to_build.append(slot)
+            else:
+                distances[slot] = self.distances[old_slot]
+                slots_reused.append(slot)
+        reused = distances[slots_reused]
+        patch_fields(reused, self.grid, grid)
+        distances[slots_reused] = reused
+        built = HeuristicStore.build(grid, [goals[slot] for slot in slots_to_build], processes)
+        distances[slots_to_build] = built.distances
+        return HeuristicStore(goals, distances, grid=np.asarray(grid) != 0), len(slots_to_build)
+
+    def set_cells(self, cells: list[Position], blocked: bool = True) -> int:
+        """Block or unblock cells of the store's grid, repairing the distance fields that
+        change. Memory-mapped distances are copied into memory first.
+
+        Returns:
+            int: how many distance fields were repaired or rebuilt
+        """
+        if self.grid is None:
+            raise ValueError('Heuristic store without a grid can not be repaired')
+        grid = self.grid.copy()
+        for cell in cells:
+            grid[cell] = blocked
+        if not self.distances.flags.writeable:
+            self.distances = np.array(self.distances)
+        repaired = repair_fields(self.distances, self.goals, self.grid, grid,
+                                 blocked_moves=self.blocked_moves)
+        self.grid = grid
+        return repaired
+
+    @staticmethod
+    def header_filename(filename: str) -> str:
+        return f'{os.path.splitext(filename)[0]}.json'
+
+    def save(self, filename: str):
+        """Save distances to filename (.npy) and the header next to it. Files are written
+        to a temporary file and moved in place, so stores still mapping the old file
+        keep working."""
+        header = {
+            'version': HEURISTIC_FORMAT_VERSION,
+            'goals': [list(goal) for goal in self.goals],
+        }
+        if self.grid is not None:
+            header.update({
+                'fingerprint': heuristic_fingerprint(self.grid, self.goals, self.blocked_moves),
+                'shape': list(self.grid.shape),
+                'walls': base64.b64encode(np.packbits(self.grid != 0).tobytes()).decode(),
+            })
+            if self.blocked_moves is not None:
+                header['lanes'] = base64.b64encode(
+                    np.packbits(np.asarray(self.blocked_moves, dtype=bool)).tobytes()).decode()
+        with open(f'{filename}.tmp', 'wb') as f:
+            np.save(f, self.distances)
+        with open(f'{filename}.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        os.replace(f'{filename}.tmp', filename)
+        os.replace(f'{filename}.json.tmp', HeuristicStore.header_filename(filename))
+
+    @staticmethod
+    def load_header(filename: str) -> Optional[dict]:
+        """Return the header saved with filename, or None if missing or another version."""
+        try:
+            with open(HeuristicStore.header_filename(filename), encoding='utf-8') as f:
+                header = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(header, dict) or header.get('version') != HEURISTIC_FORMAT_VERSION:
+            return None
+        return header
+
+    @staticmethod
+    def load(filename: str, mmap_mode: Optional[str] = 'r') -> 'HeuristicStore':
+        """Load a saved store, memory-mapped read-only by default."""
+        header = HeuristicStore.load_header(filename)
+        if header is None:
+            raise ValueError(f'No heuristic header for {filename} with version '
+                             f'{HEURISTIC_FORMAT_VERSION}')
+        grid = None
+        blocked_moves = None
+        if 'walls' in header:
+            rows, cols = header['shape']
+            walls = np.unpackbits(np.frombuffer(base64.b64decode(header['walls']), np.uint8),
+                                  count=rows * cols)
+            grid = walls.reshape(rows, cols).astype(bool)
+            if 'lanes' in header:
+                blocked = np.unpackbits(np.frombuffer(base64.b64decode(header['lanes']),
+                                                      np.uint8), count=4 * rows * cols)
+                blocked_moves = blocked.reshape(4, rows, cols).astype(bool)
+        distances = np.load(filename, mmap_mode=mmap_mode)
+        return HeuristicStore([tuple(goal) for goal in header['goals']], distances, grid=grid,
+                              blocked_moves=blocked_moves)
+
+    def __getitem__(self, goal: Position) -> DistanceField:
+        # asarray drops the memmap subclass, which is slower to index
+        return DistanceField(np.asarray(self.distances[self.slots[goal]]))
+
+    def get(self, goal: Position, default=None) -> Optional[DistanceField]:
+        return self[goal] if goal in self.slots else default
+
+    def __contains__(self, goal) -> bool:
+        return goal in self.slots
+
+    def __len__(self) -> int:
+        return len(self.goals)
+
+    def __iter__(self) -> Iterator[Position]:
+        return iter(self.goals)
+
+
+class LazyHeuristic:
+    """True distance heuristic for any open cell of a grid as goal, looked up like a
+    heuristic dict, `heuristic[pos_b][pos_a]`.
+
+    Goals in the preloaded heuristic (ex. a HeuristicStore of all zones) are looked up
+    there, any other goal's distance field is built with a BFS on first use and kept in
+    an LRU cache of at most max_size fields, so memory stays bounded on large grids. With
+    blocked_moves the BFS only takes moves lanes allow, like the preloaded heuristic should.
+    """
+
+    def __init__(self, grid, preloaded: Optional['HeuristicDict'] = None,
+                 max_size: int = HEURISTIC_CACHE_SIZE,
+                 blocked_moves: Optional[np.ndarray] = None) -> None:
+        self.grid = np.array(grid, copy=True)
+        self.preloaded = preloaded if preloaded is not None else {}
+        self.max_size = max_size
+        self.blocked_moves = blocked_moves
+        self.cache: OrderedDict[Position, DistanceField] = OrderedDict()
+        # Lookups of goals outside preloaded, hits if already in the cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def is_goal(self, goal) -> bool:
+        """True if goal is an open cell in the grid."""
+        return (0 <= goal[0] < self.grid.shape[0] and 0 <= goal[1] < self.grid.shape[1] and
+                self.grid[goal[0], goal[1]] == 0)
+
+    def __getitem__(self, goal: Position):
+        field = self.preloaded.get(goal)
+        if field is not None:
+            return field
+        field = self.cache.get(goal)
+        if field is not None:
+            self.hits += 1
+            self.cache.move_to_end(goal)
+            return field
+        if not self.is_goal(goal):
+            raise KeyError(goal)
+        self.misses += 1
+        field = DistanceField(get_distances_batch(
+            self.grid, [goal], dtype=np.uint16, unreachable=UNREACHABLE,
+            blocked_moves=self.blocked_moves)[0])
+        self.cache[goal] = field
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return field
+
+    def get(self, goal: Position, default=None):
+        return self[goal] if goal in self else default
+
+    def __contains__(self, goal) -> bool:
+        return goal in self.preloaded or self.is_goal(goal)
+
+    def set_cells(self, cells: list[Position], blocked: bool = True) -> int:
+        """Block or unblock cells of the grid, repairing the preloaded heuristic and cached
+        distance fields that change. Cached goals that got blocked are dropped.
+
+        Returns:
+            int: how many distance fields were repaired or rebuilt
+        """
+        grid = self.grid.copy()
+        for cell in cells:
+            grid[cell] = 1 if blocked else 0
+        repaired = 0
+        if isinstance(self.preloaded, HeuristicStore):
+            repaired += self.preloaded.set_cells(cells, blocked)
+        elif self.preloaded:
+            # Plain heuristic dict, rebuilt as a whole
+            goals = list(self.preloaded)
+            distances = HeuristicStore.from_heuristic_dict(self.preloaded).distances
+            repaired += repair_fields(distances, goals, self.grid, grid,
+                                      blocked_moves=self.blocked_moves)
+            for goal, field in zip(goals, distances):
+                self.preloaded[goal] = DistanceField(field).to_array()
+        goals = [goal for goal in self.cache if grid[goal] == 0]
+        self.cache = OrderedDict((goal, self.cache[goal]) for goal in goals)
+        if goals:
+            distances = np.stack([self.cache[goal].distances for goal in goals])
+            repaired += repair_fields(distances, goals, self.grid, grid,
+                                      blocked_moves=self.blocked_moves)
+            for goal, field in zip(goals, distances):
+                self.cache[goal] = DistanceField(field)
+        self.grid = grid
+        return repaired
+
+    def stats(self) -> dict[str, int]:
+        """Cache size and hit/miss/eviction counts."""
+        return {'cached': len(self.cache), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
+# Heuristic for a set of goals, heuristic[pos_b][pos_a] is the distance from pos_a to pos_b
+HeuristicDict = Union[dict[Position, np.ndarray], HeuristicStore, LazyHeuristic]
+
+
 def load_heuristic(warehouse_yaml: str, world_info: 'WorldInfo', logger: str,
-                   force_rebuild=False) -> dict[Position, np.ndarray]:
-    """Tries to load heuristic dict from file, else builds and saves it. Returns the dict"""
-    filename = f'{os.path.splitext(warehouse_yaml)[0]}_heuristic.pkl'
-    if os.path.exists(filename) and not force_rebuild:
-        logger.info(f'Found existing heuristic for {warehouse_yaml} -> {filename}, loading')
-        t_start = time.perf_counter()
-        _dict = load_heuristic_from_file(filename)
-        logger.info(f'Loaded true heuristic grid in {(time.perf_counter() - t_start)*1000:.2f} ms')
-    else:
+                   force_rebuild=False,
+                   blocked_moves: Optional[np.ndarray] = None) -> HeuristicStore:
+    """Tries to load heuristic store from file, else builds and saves it. Returns the store,
+    memory-mapped from the file. With blocked_moves, distances follow the lanes blocking them
+    (see Lanes).
+
+    The saved store is only used if its fingerprint matches the world grid, zones and blocked
+    moves. If the layout changed, only distance fields of new goals or goals whose distances
+    change beyond the edited cells are rebuilt."""
+    filename = f'{os.path.splitext(warehouse_yaml)[0]}_heuristic.npy'
+    grid = world_info.world_grid
+    goals = list(dict.fromkeys(Position(pos) for pos in world_info.get_all_zones()))
+    header = HeuristicStore.load_header(filename) if os.path.exists(filename) else None
+    if force_rebuild or header is None:
         # Build true heuristic function
         t_start = time.perf_counter()
         logger.info(f'Building true heuristic for {warehouse_yaml}')
         # Build true heuristic grid
-        _dict = build_true_heuristic(world_info.world_grid, world_info.get_all_zones())
-        logger.info(f'Built true heuristic grid in {(time.perf_counter() - t_start)*1000:.2f} ms')
-        write_heuristic_to_file(filename, _dict)
-    return _dict
+        store = HeuristicStore.build(grid, goals, blocked_moves=blocked_moves)
+        logger.info(f'Built true heuristic grid for {warehouse_yaml} with {len(store)} goals '
+                    f'in {(time.perf_counter() - t_start)*1000:.2f} ms')
+        store.save(filename)
+    elif header.get('fingerprint') != heuristic_fingerprint(grid, goals, blocked_moves):
+        t_start = time.perf_counter()
+        logger.info(f'Heuristic {filename} is for another layout of {warehouse_yaml}, updating')
+        store, built_count = HeuristicStore.load(filename).rebuild(
+            grid, goals, blocked_moves=blocked_moves)
+        logger.info(f'Rebuilt {built_count}/{len(store)} goals of true heuristic grid for '
+                    f'{warehouse_yaml} in {(time.perf_counter() - t_start)*1000:.2f} ms')
+        store.save(filename)
+    logger.info(f'Loading heuristic for {warehouse_yaml} -> {filename}')
+    t_start = time.perf_counter()
+    store = HeuristicStore.load(filename)
+    logger.info(f'Loaded true heuristic grid in {(time.perf_counter() - t_start)*1000:.2f} ms')
+    return store
 
 if __name__ == '__main__':
     from warehouses.warehouse_loader import WorldInfo
@@ -96,7 +699,7 @@ if __name__ == '__main__':
     # Load world info from yaml
     warehouse_yaml = os.getenv('WAREHOUSE_YAML', 'warehouses/main_warehouse.yaml')
     
-    heuristic_filename = f'{os.path.splitext(warehouse_yaml)[0]}_heuristic.pkl'
+    heuristic_filename = f'{os.path.splitext(warehouse_yaml)[0]}_heuristic.npy'
 
     world_info = WorldInfo.from_yaml(warehouse_yaml)
     print(
@@ -106,16 +709,17 @@ if __name__ == '__main__':
     if os.path.exists(heuristic_filename):
         print(f'Found existing heuristic for {warehouse_yaml} -> {heuristic_filename}, loading')
         t_start = time.perf_counter()
-        true_heuristic_dict = load_heuristic_from_file(heuristic_filename)
+        true_heuristic_dict = HeuristicStore.load(heuristic_filename)
         print(f'Loaded true heuristic grid in {(time.perf_counter() - t_start)*1000:.2f} ms')
     else:
         # Build true heuristic function
         t_start = time.perf_counter()
         print(f'Building true heuristic for {warehouse_yaml}')
         # Build true heuristic grid
-        true_heuristic_dict = build_true_heuristic(world_info.world_grid, world_info.get_all_zones())
+        true_heuristic_dict = HeuristicStore.build(
+            world_info.world_grid, world_info.get_all_zones())
         print(f'Built true heuristic grid in {(time.perf_counter() - t_start)*1000:.2f} ms')
-        write_heuristic_to_file(heuristic_filename, true_heuristic_dict)
+        true_heuristic_dict.save(heuristic_filename)
 
     # def show_size_stats():
     #     entry: np.ndarray = next(iter(true_heuristic_dict.values()))
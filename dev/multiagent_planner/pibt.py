@@ -0,0 +1,96 @@
+"""Priority Inheritance with Backtracking (PIBT), plans the next step of every agent at once.
+
+Agents pick their next cell in priority order, closest to their goal first. An agent that
+wants a cell held by a lower priority agent lends it its priority, pushing it out of the
+way first, and backtracks to its next choice if that agent has nowhere to go. Each step
+is roughly linear in the number of agents, so the cost per step stays predictable.
+"""
+from typing import Callable, Optional
+from .flat_grid import get_flat_grid
+from .pathfinding import Position
+
+DistanceFunction = Callable[[Position], float]  # Distance from a position to an agents goal
+
+
+def pibt_step(grid, positions: list[Position], distances: list[DistanceFunction],
+              priorities: list[float], blocked: set[Position] = set(),
+              goals: Optional[list[Position]] = None) -> list[Position]:
+    """Return the next position of every agent, free of vertex and swap collisions.
+
+    Args:
+        grid (2D np array): NxN int array, obstacles are non-zero
+        positions (list[Position]): Current agent positions, all different
+        distances (list[DistanceFunction]): Per agent distance to its goal, used to order
+            its next cell choices. Negative distances are unreachable and tried last.
+        priorities (list[float]): Per agent priority, higher plans first
+        blocked (set[Position], optional): Positions agents may not move into unless it is their
+            goal, ex. zones. Defaults to set().
+        goals (list[Position], optional): Per agent goal, only needed with blocked positions.
+
+    Returns:
+        list[Position]: next position for each agent, its current position if waiting.
+    """
+    flat_grid = get_flat_grid(grid)
+    cell_positions = flat_grid.positions
+    successors = flat_grid.successors
+    cells = [flat_grid.cell(pos) for pos in positions]
+    occupied_now = {cell: agent for agent, cell in enumerate(cells)}
+    occupied_next: dict[int, int] = {}
+    next_cells: list[Optional[int]] = [None] * len(cells)
+
+    def candidate_order(agent: int, cell: int):
+        dist = distances[agent](cell_positions[cell])
+        if dist < 0:
+            dist = float('inf')
+        # Closest to goal first, then free cells before ones taken by other agents
+        return (dist, cell in occupied_now and occupied_now[cell] != agent)
+
+    def candidates_for(agent: int):
+        return iter(sorted(successors[cells[agent]], key=lambda c: candidate_order(agent, c)))
+
+    def plan(root: int):
+        """Pick the next cell for root, pushing lower priority agents out of the way.
+        Pushes are searched depth first with an explicit stack, as chains can be long."""
+        # Agents being planned, each with its remaining candidate cells
+        stack = [(root, candidates_for(root))]
+        pushed_ok: Optional[bool] = None  # Result of the last agent popped off the stack
+        while stack:
+            agent, candidates = stack[-1]
+            if pushed_ok:
+                stack.pop()  # Agent it pushed moved out of the way, so this one can move too
+                continue
+            cell = cells[agent]
+            goal = goals[agent] if goals else None
+            pushed_ok = None
+            for candidate in candidates:
+                if candidate in occupied_next:
+                    continue
+                if (blocked and candidate != cell and cell_positions[candidate] in blocked and
+                        cell_positions[candidate] != goal):
+                    continue
+                other = occupied_now.get(candidate)
+                if other is not None and next_cells[other] == cell:
+                    continue  # Would swap places with other
+                next_cells[agent] = candidate
+                occupied_next[candidate] = agent
+                if other is not None and other != agent and next_cells[other] is None:
+                    # Priority inheritance, other has to move out first. If it can't it stays
+                    # in candidate, and this agent backtracks to its next choice.
+                    stack.append((other, candidates_for(other)))
+                    break
+                pushed_ok = True
+                break
+            else:
+                # Nowhere to go, stay
+                next_cells[agent] = cell
+                occupied_next[cell] = agent
+                pushed_ok = False
+                stack.pop()
+                continue
+            if pushed_ok:
+                stack.pop()
+
+    for agent in sorted(range(len(cells)), key=lambda agent: -priorities[agent]):
+        if next_cells[agent] is None:
+            plan(agent)
+    return [cell_positions[cell] for cell in next_cells]
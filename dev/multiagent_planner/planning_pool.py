@@ -0,0 +1,251 @@
+"""Pool of processes planning independent paths in parallel.
+
+The grid, the true distance heuristic and a snapshot of the reservation table live in shared
+memory, so workers read them without copying. Every path of a batch is planned against the
+same snapshot, so paths in a batch don't see each other. Callers commit them one at a time in
+priority order, and check each against the reservations committed since the snapshot with
+path_conflicts, replanning any that conflict.
+"""
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Optional
+import numpy as np
+from . import pathfinding as pf
+from .lanes import Lanes
+from .pathfinding import Path, Position
+from .pathfinding_heuristic import HeuristicDict, HeuristicStore, LazyHeuristic
+from .reservation_table import ReservationTable
+from .sipp import sipp
+from .traffic_map import TrafficMap
+
+# Search engines selectable for plan_path, all share the st_astar signature
+PATH_ENGINES = {
+    'st_astar': pf.st_astar,
+    'st_astar_flat': pf.st_astar_flat,
+    'sipp': sipp,
+}
+
+# Engines taking congestion costs from a TrafficMap
+TRAFFIC_ENGINES = ('st_astar', 'st_astar_flat')
+# Engines following one-way Lanes
+LANE_ENGINES = ('st_astar', 'st_astar_flat')
+
+PlanRequest = tuple[Position, Position]  # (pos_a, pos_b)
+# Shared array as (shared memory name, shape, dtype name), enough for workers to attach to it
+SharedArraySpec = tuple[str, tuple[int, ...], str]
+
+
+def plan_path(grid, pos_a: Position, pos_b: Position, dynamic_obstacles, static_obstacles,
+              true_dists, engine: str = 'st_astar_flat', window: Optional[int] = None,
+              max_steps: int = 500, t_start: int = 0, stats: Optional[dict] = None,
+              time_budget: Optional[float] = None, partial: bool = False,
+              traffic: Optional[TrafficMap] = None, lanes: Optional[Lanes] = None) -> Path:
+    """Plan a path from a to b with the true distances to b as heuristic, as the robot
+    allocator does, start and end positions are valid at all times.
+
+    Args:
+        grid (2D np array): NxN int array, obstacles are non-zero
+        pos_a (Position): Start position
+        pos_b (Position): Finish position
+        dynamic_obstacles: set{(row,col,t), ...} of obstacles to avoid, or a ReservationTable
+        static_obstacles (set): set{(row,col), ...} of obstacles to avoid
+        true_dists: Distances to pos_b indexed by position, ex. heuristic_dict[pos_b]
+        engine (str, optional): Search from PATH_ENGINES. Defaults to 'st_astar_flat'.
+        window (int, optional): If given, plan with windowed_st_astar, only avoiding dynamic
+            obstacles for this many steps. Defaults to None.
+        max_steps (int, optional): Max path steps searched. Defaults to 500.
+        t_start (int, optional): Time of the first step in dynamic obstacles. Defaults to 0.
+        stats (dict, optional): store run-time stats here if it exists. Defaults to None.
+        time_budget (float, optional): seconds to search for before giving up. Defaults to
+            None.
+        partial (bool, optional): If pos_b isn't reached return the best partial path, as
+            st_astar, not used in windowed search. Defaults to False.
+        traffic (TrafficMap, optional): Congestion costs added to each move, only with the
+            TRAFFIC_ENGINES and not in windowed search. Defaults to None.
+        lanes (Lanes, optional): One-way lanes to follow, only with the LANE_ENGINES and not
+            in windowed search. Defaults to None.
+
+    Returns:
+        Path: A list of positions along the found path (or empty list if fail)
+    """
+    def true_heuristic(pos: Position) -> float:
+        return true_dists[pos]
+    if window:
+        # Past the window only the true distance heuristic guides the path
+        return pf.windowed_st_astar(
+            grid, pos_a, pos_b, dynamic_obstacles, static_obstacles=static_obstacles,
+            window=window, heuristic=true_heuristic, stats=stats, validate_ends=False,
+            t_start=t_start, time_budget=time_budget)
+    cost_kwargs = {}
+    if traffic is not None:
+        if engine not in TRAFFIC_ENGINES:
+            raise ValueError(f'Path engine {engine} has no traffic costs, expected one of '
+                             f'{TRAFFIC_ENGINES}')
+        cost_kwargs['traffic'] = traffic
+    if lanes is not None:
+        if engine not in LANE_ENGINES:
+            raise ValueError(f'Path engine {engine} does not follow lanes, expected one of '
+                             f'{LANE_ENGINES}')
+        cost_kwargs['lanes'] = lanes
+    return PATH_ENGINES[engine](
+        grid, pos_a, pos_b, dynamic_obstacles, static_obstacles=static_obstacles,
+        end_fast=True, max_time=max_steps, heuristic=true_heuristic, stats=stats,
+        validate_ends=False, t_start=t_start, time_budget=time_budget, partial=partial,
+        **cost_kwargs)
+
+
+def _create_shared_array(array: np.ndarray) -> tuple[shared_memory.SharedMemory, np.ndarray]:
+    """Copy array into new shared memory, returning the memory and an array view of it."""
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+    shared[...] = array
+    return memory, shared
+
+
+def _attach_shared_array(spec: SharedArraySpec) -> tuple[shared_memory.SharedMemory, np.ndarray]:
+    name, shape, dtype = spec
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+
+
+# Per worker process state, set up once by _init_worker
+_worker: dict = {}
+
+
+def _init_worker(grid_spec: SharedArraySpec, goals: list[Position],
+                 distances_spec: SharedArraySpec, table_spec: SharedArraySpec):
+    memories = []
+    for name, spec in [('grid', grid_spec), ('distances', distances_spec),
+                       ('table', table_spec)]:
+        memory, _worker[name] = _attach_shared_array(spec)
+        memories.append(memory)
+    _worker['memories'] = memories  # Kept open for as long as the worker runs
+    grid = _worker['grid']
+    # Goals outside the shared ones are built as needed by each worker
+    _worker['heuristic'] = LazyHeuristic(
+        grid, HeuristicStore(goals, _worker['distances'], grid=grid != 0))
+
+
+def _plan_chunk(args) -> list[Path]:
+    """Plan each request of a chunk against the shared reservation table snapshot."""
+    requests, table_t_start, static_obstacles, engine, window, max_steps, t_start = args
+    grid = _worker['grid']
+    table = _worker['table']
+    reservations = ReservationTable(grid.shape, table.shape[0], t_start=table_t_start,
+                                    table=table)
+    heuristic = _worker['heuristic']
+    return [plan_path(grid, pos_a, pos_b, reservations, static_obstacles, heuristic[pos_b],
+                      engine=engine, window=window, max_steps=max_steps, t_start=t_start)
+            for pos_a, pos_b in requests]
+
+
+def snapshot_conflicts(path: Path, t_start: int, reservations: ReservationTable,
+                       snapshot: np.ndarray, snapshot_t_start: Optional[int]) -> bool:
+    """True if path, planned from t_start against a snapshot of the reservations table, runs
+    into any cell reserved since then, other than its start and end which paths may always
+    use. Also true if the reservations window moved since the snapshot."""
+    if snapshot_t_start != reservations.t_start:
+        return True  # Snapshot times no longer line up
+    ends = {tuple(path[0]), tuple(path[-1])} if path else set()
+    for t, pos in enumerate(path, t_start):
+        if tuple(pos) in ends or not reservations.in_window(t):
+            continue
+        slot = t % reservations.horizon
+        if reservations.table[slot, pos[0], pos[1]] > snapshot[slot, pos[0], pos[1]]:
+            return True
+    return False
+
+
+def get_heuristic_store(heuristic_dict: HeuristicDict) -> HeuristicStore:
+    """Return the distances of a heuristic dict, store or the preloaded goals of a lazy
+    heuristic as a HeuristicStore."""
+    if isinstance(heuristic_dict, LazyHeuristic):
+        heuristic_dict = heuristic_dict.preloaded
+    if isinstance(heuristic_dict, HeuristicStore):
+        return heuristic_dict
+    return HeuristicStore.from_heuristic_dict(heuristic_dict)
+
+
+class PlanningPool:
+    """Worker processes planning batches of paths, each against a snapshot of a reservation
+    table, with the grid, heuristic and snapshot in shared memory.
+
+    The grid and heuristic are copied in once, so the pool has to be recreated if they change.
+    Workers of a batch that timed out are restarted, so they don't keep planning it against
+    the next batch's snapshot.
+    """
+
+    def __init__(self, grid, heuristic_dict: HeuristicDict, horizon: int,
+                 processes: int) -> None:
+        grid = np.asarray(grid)
+        store = get_heuristic_store(heuristic_dict)
+        self.processes = processes
+        self.grid_memory, grid = _create_shared_array(grid)
+        self.distances_memory, distances = _create_shared_array(store.distances)
+        self.table_memory, self.snapshot = _create_shared_array(
+            np.zeros((horizon, *grid.shape), dtype=np.uint8))
+        self.snapshot_t_start: Optional[int] = None
+        specs = [(memory.name, array.shape, array.dtype.str) for memory, array in [
+            (self.grid_memory, grid), (self.distances_memory, distances),
+            (self.table_memory, self.snapshot)]]
+        self.worker_initargs = (specs[0], store.goals, specs[1], specs[2])
+        self.pool = self._start_workers()
+
+    def _start_workers(self):
+        return multiprocessing.Pool(self.processes, initializer=_init_worker,
+                                    initargs=self.worker_initargs)
+
+    def plan_paths(self, requests: list[PlanRequest], reservations: ReservationTable,
+                   static_obstacles: set[Position], engine: str = 'st_astar_flat',
+                   window: Optional[int] = None, max_steps: int = 500, t_start: int = 0,
+                   timeout: Optional[float] = None) -> list[Optional[Path]]:
+        """Plan a path for every request in parallel, all against a snapshot of the current
+        reservations. Arguments are as for plan_path.
+
+        Returns:
+            list[Optional[Path]]: path per request (empty if none was found), all None if the
+                paths were not all planned within timeout seconds
+        """
+        if reservations.table.shape != self.snapshot.shape:
+            raise ValueError(f'Reservation table {reservations.table.shape} does not match '
+                             f'the pool snapshot {self.snapshot.shape}')
+        self.snapshot[...] = reservations.table
+        self.snapshot_t_start = reservations.t_start
+        if not requests:
+            return []
+        # A few chunks per process to even out their run times
+        num_chunks = min(len(requests), self.processes * 4)
+        chunks = [(requests[idx::num_chunks], reservations.t_start, static_obstacles, engine,
+                   window, max_steps, t_start) for idx in range(num_chunks)]
+        try:
+            results = self.pool.map_async(_plan_chunk, chunks).get(timeout)
+        except multiprocessing.TimeoutError:
+            # Drop the stale batch rather than queue the next one behind it
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = self._start_workers()
+            return [None] * len(requests)
+        paths: list[Path] = [[] for _ in requests]
+        for idx, chunk_paths in enumerate(results):
+            paths[idx::num_chunks] = chunk_paths
+        return paths
+
+    def path_conflicts(self, path: Path, t_start: int, reservations: ReservationTable) -> bool:
+        """True if path, planned against the last snapshot, runs into any cell reserved since
+        then, other than its start and end which paths may always use."""
+        return snapshot_conflicts(path, t_start, reservations, self.snapshot,
+                                  self.snapshot_t_start)
+
+    def close(self):
+        """Stop the workers and free the shared memory."""
+        self.pool.terminate()
+        self.pool.join()
+        for memory in [self.grid_memory, self.distances_memory, self.table_memory]:
+            memory.close()
+            memory.unlink()
+
+    def __enter__(self) -> 'PlanningPool':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,189 @@
+"""Reservation table of grid cells over time, replacing sets of (row, col, t) obstacles."""
+from typing import Optional
+import numpy as np
+
+Position = tuple[int, int]  # (row, col)
+PositionST = tuple[int, int, int]  # (row, col, time)
+
+MAX_RESERVATIONS = np.iinfo(np.uint8).max
+
+
+class ReservationTable:
+    """Dense (horizon, rows, cols) table of reserved cells as a ring buffer over time.
+
+    Time t is stored in slot t % horizon, and only times in the window
+    [t_start, t_start + horizon) are held, reservations outside it are dropped and
+    queries outside it are free. Each entry counts its reservations so overlapping
+    paths can be released independently. Memory is bounded by horizon x grid size.
+
+    Supports `in`, `add`, `discard` and `len` on (row, col, t) tuples so it can be
+    passed to st_astar in place of a set of dynamic obstacles.
+
+    Paths can be reserved for an owner (ex. a robot id), which lets them be released
+    later with release_owner even after the window has moved on.
+    """
+
+    def __init__(self, grid_shape: tuple[int, int], horizon: int, t_start: int = 0,
+                 table: Optional[np.ndarray] = None) -> None:
+        self.rows, self.cols = grid_shape
+        self.size = self.rows * self.cols
+        self.horizon = horizon
+        self.t_start = t_start
+        if table is None:
+            table = np.zeros((horizon, self.rows, self.cols), dtype=np.uint8)
+        elif table.shape != (horizon, self.rows, self.cols) or table.dtype != np.uint8:
+            raise ValueError(f'Expected uint8 table of shape {(horizon, self.rows, self.cols)}, '
+                             f'got {table.dtype} {table.shape}')
+        # Existing tables (ex. in shared memory) are used as is, without their owners
+        self.table = table
+        # (horizon, cells) view of the same memory for flat cell indexing
+        self.flat_table = self.table.reshape(horizon, self.size)
+        self.count = int(table.sum(dtype=np.int64))  # Total number of reservations held
+        # owner -> (path, t_start, buffer, t_end of window when reserved)
+        self.owners: dict = {}
+
+    @property
+    def t_end(self) -> int:
+        """First time past the end of the window."""
+        return self.t_start + self.horizon
+
+    def in_window(self, t: int) -> bool:
+        """True if time t is held in the table."""
+        return self.t_start <= t < self.t_start + self.horizon
+
+    def reserve(self, row: int, col: int, t: int) -> bool:
+        """Reserve cell at time t, returns False if t is outside the window."""
+        if not self.in_window(t):
+            return False
+        slot = t % self.horizon
+        if self.table[slot, row, col] < MAX_RESERVATIONS:
+            self.table[slot, row, col] += 1
+            self.count += 1
+        return True
+
+    def release(self, row: int, col: int, t: int) -> bool:
+        """Release one reservation of cell at time t, returns False if there was none."""
+        if not self.in_window(t):
+            return False
+        slot = t % self.horizon
+        if self.table[slot, row, col] == 0:
+            return False
+        self.table[slot, row, col] -= 1
+        self.count -= 1
+        return True
+
+    def is_reserved(self, row: int, col: int, t: int) -> bool:
+        """True if cell is reserved at time t."""
+        if not self.t_start <= t < self.t_start + self.horizon:
+            return False
+        return self.table[t % self.horizon, row, col] > 0
+
+    def cells_at(self, t: int) -> Optional[np.ndarray]:
+        """Flat view of reservation counts for all cells at time t, None if outside window."""
+        if not self.t_start <= t < self.t_start + self.horizon:
+            return None
+        return self.flat_table[t % self.horizon]
+
+    def reserved_times(self, row: int, col: int, t_from: int, t_to: int) -> list[int]:
+        """Sorted times in [t_from, t_to] that cell is reserved, within the window."""
+        t_from = max(t_from, self.t_start)
+        t_to = min(t_to, self.t_end - 1)
+        if t_from > t_to:
+            return []
+        times = np.arange(t_from, t_to + 1)
+        counts = self.table[times % self.horizon, row, col]
+        return times[counts > 0].tolist()
+
+    def __contains__(self, stpos: PositionST) -> bool:
+        return self.is_reserved(stpos[0], stpos[1], stpos[2])
+
+    def add(self, stpos: PositionST):
+        """Set-like alias of reserve for a (row, col, t) tuple."""
+        self.reserve(stpos[0], stpos[1], stpos[2])
+
+    def discard(self, stpos: PositionST):
+        """Set-like alias of release for a (row, col, t) tuple."""
+        self.release(stpos[0], stpos[1], stpos[2])
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _path_indices(self, path: list[Position], t_start: int, buffer: int,
+                      t_end: Optional[int] = None) -> np.ndarray:
+        """Flat table indices for path positions from t_start, each also held for +-buffer
+        time steps around it. Indices outside the window, or at or past t_end, are dropped."""
+        if not path:
+            return np.empty(0, dtype=np.int64)
+        cells = np.asarray(path, dtype=np.int64)
+        cells = cells[:, 0] * self.cols + cells[:, 1]
+        times = t_start + np.arange(len(path), dtype=np.int64)
+        offsets = np.arange(-buffer, buffer + 1, dtype=np.int64)
+        times = (times[:, None] + offsets[None, :]).ravel()
+        cells = np.repeat(cells, len(offsets))
+        t_end = self.t_end if t_end is None else min(t_end, self.t_end)
+        in_window = (times >= self.t_start) & (times < t_end)
+        return (times[in_window] % self.horizon) * self.size + cells[in_window]
+
+    def reserve_path(self, path: list[Position], t_start: int = 0, buffer: int = 0,
+                     owner=None, t_end: Optional[int] = None):
+        """Reserve each position of path at t_start + index, and +-buffer steps around it,
+        before t_end if given (ex. replaying the owners of another table).
+        If owner is given, any path already reserved for that owner is released first."""
+        t_end = self.t_end if t_end is None else min(t_end, self.t_end)
+        if owner is not None:
+            self.release_owner(owner)
+            # Copy the path, as callers may keep modifying theirs (ex. popping steps taken)
+            self.owners[owner] = (list(path), t_start, buffer, t_end)
+        self._add_counts(self._path_indices(path, t_start, buffer, t_end), 1)
+
+    def release_path(self, path: list[Position], t_start: int = 0, buffer: int = 0):
+        """Release a path reserved by reserve_path with the same arguments, while the window
+        has not moved since."""
+        self._add_counts(self._path_indices(path, t_start, buffer), -1)
+
+    def release_owner(self, owner) -> bool:
+        """Release the path reserved for owner, returns False if there was none."""
+        record = self.owners.pop(owner, None)
+        if record is None:
+            return False
+        path, t_start, buffer, t_end = record
+        # Only release times that fit in the window when the path was reserved
+        self._add_counts(self._path_indices(path, t_start, buffer, t_end), -1)
+        return True
+
+    def get_owner_path(self, owner) -> Optional[tuple[list[Position], int]]:
+        """Return (path, t_start) reserved for owner, or None."""
+        record = self.owners.get(owner)
+        if record is None:
+            return None
+        return record[0], record[1]
+
+    def _add_counts(self, indices: np.ndarray, sign: int):
+        """Add or remove one reservation per flat table index, clamped to the count range."""
+        indices, counts = np.unique(indices, return_counts=True)
+        table = self.table.reshape(-1)
+        old = table[indices].astype(np.int64)
+        new = np.clip(old + sign * counts, 0, MAX_RESERVATIONS)
+        table[indices] = new
+        self.count += int((new - old).sum())
+
+    def advance(self, steps: int = 1):
+        """Move the window forward in time, dropping reservations before the new start."""
+        if steps <= 0:
+            return
+        if steps >= self.horizon:
+            self.clear(self.t_start + steps)
+            return
+        for t in range(self.t_start, self.t_start + steps):
+            slot = self.flat_table[t % self.horizon]
+            self.count -= int(slot.sum())
+            slot.fill(0)
+        self.t_start += steps
+
+    def clear(self, t_start: Optional[int] = None):
+        """Remove all reservations, optionally moving the window to start at t_start."""
+        self.table.fill(0)
+        self.count = 0
+        self.owners.clear()
+        if t_start is not None:
+            self.t_start = t_start
@@ -0,0 +1,211 @@
+"""Safe Interval Path Planning (SIPP), a drop-in alternative to st_astar.
+
+Instead of searching every (cell, t) state, each cell's free time is split into safe
+intervals between the times it is reserved, and the search runs over (cell, interval)
+states keeping the earliest arrival time into each. Waiting through time collapses into
+a single step, so long waits and long paths expand far fewer nodes than st_astar.
+"""
+import heapq
+import math
+import time
+from collections import defaultdict
+from typing import Callable, Optional
+from .flat_grid import get_flat_grid
+from .pathfinding import (TIME_BUDGET_CHECK_CELLS, HeuristicFunction, Path, Position,
+                          get_euclidean_heuristic, get_last_reserved_time)
+from .reservation_table import ReservationTable
+
+Interval = tuple[int, int]  # (first, last) free time steps, inclusive
+
+
+def get_safe_intervals(reserved_times: list[int], t_from: int, t_to: int) -> list[Interval]:
+    """Split [t_from, t_to] into the intervals between sorted reserved times."""
+    intervals = []
+    t_free = t_from
+    for t in reserved_times:
+        if t > t_to:
+            break
+        if t > t_free:
+            intervals.append((t_free, t - 1))
+        t_free = max(t_free, t + 1)
+    if t_free <= t_to:
+        intervals.append((t_free, t_to))
+    return intervals
+
+
+def sipp(graph, pos_a: Position, pos_b: Position, dynamic_obstacles: set = set(),
+         static_obstacles: set = set(), max_time=20,
+         max_cells=10000, t_start=0, end_fast=False,
+         heuristic: Optional[HeuristicFunction] = None,
+         stats: dict = None,
+         validate_ends=True, time_budget: Optional[float] = None, partial=False) -> Path:
+    """Safe Interval Path Planning, same arguments and path format as st_astar.
+
+    Dynamic obstacles are vertex reservations as in st_astar, which is collision free as
+    long as paths are reserved with a buffer of a step around each position. Paths
+    arrive at pos_b as early as possible, and without end_fast wait there until
+    max_time + t_start.
+
+    Args:
+        graph (_type_): NxN int array, obstacles are non-zero
+        pos_a (Position): Start position
+        pos_b (Position): Finish position
+        dynamic_obstacles (set): set{(row,col,t), ...} of obstacles to avoid, or a
+            ReservationTable. Defaults to set().
+        static_obstacles (set): set{(row,col), ...} of obstacles to avoid. Defaults to set().
+        max_time (int, optional): max time to search up to. Defaults to 20.
+        max_cells (int, optional): max (cell, interval) states to expand. Defaults to 10000.
+        t_start (int, optional): offset start time if this path starts later in dynamic obstacles.
+        end_fast (bool, optional): end as soon as destination reached vs waiting till max_time.
+        heuristic (HeuristicFunction, optional): Heuristic (set for pos_b), Defaults to
+            euclidean_heuristic
+        stats (dict, optional): store run-time stats here if it exists. Defaults to None.
+        validate_ends (bool, optional): Check if start and end positions are valid.
+            Defaults to True.
+        time_budget (float, optional): seconds to search for before giving up. Defaults to None.
+        partial (bool, optional): If pos_b isn't reached, return the path to the searched
+            position closest to it by heuristic that nothing is reserved at afterwards, as
+            st_astar. Defaults to False.
+
+    Raises:
+        ValueError: If start/end positions are in walls
+
+    Returns:
+        path (Path): A list of positions along the found path (or empty list if fail)
+    """
+    if graph[pos_a[0], pos_a[1]] > 0 or graph[pos_b[0], pos_b[1]] > 0:
+        raise ValueError('Start/End locations in walls')
+    if validate_ends and (pos_a in static_obstacles or pos_b in static_obstacles):
+        return []  # Start/End in static obstacles
+
+    flat_grid = get_flat_grid(graph)
+    positions = flat_grid.positions
+    open_neighbors = flat_grid.open_neighbors
+    start_cell = flat_grid.cell(pos_a)
+    goal_cell = flat_grid.cell(pos_b)
+    t_last = max_time + t_start
+
+    # Default to euclidean heuristic if none was provided
+    if (heuristic is None):
+        heuristic = get_euclidean_heuristic(pos_b)
+    heuristic_cache: dict[int, float] = {}
+
+    reserved_times: Callable[[int], list[int]]
+    if isinstance(dynamic_obstacles, ReservationTable):
+        def reserved_times(cell: int) -> list[int]:
+            row, col = positions[cell]
+            return dynamic_obstacles.reserved_times(row, col, t_start, t_last)
+    else:
+        times_by_cell: dict[int, list[int]] = defaultdict(list)
+        for row, col, t in dynamic_obstacles:
+            if (t_start <= t <= t_last and
+                    0 <= row < flat_grid.rows and 0 <= col < flat_grid.cols):
+                times_by_cell[row * flat_grid.cols + col].append(t)
+
+        def reserved_times(cell: int) -> list[int]:
+            return sorted(times_by_cell.get(cell, []))
+
+    intervals_cache: dict[int, list[Interval]] = {}
+
+    def get_intervals(cell: int) -> list[Interval]:
+        intervals = intervals_cache.get(cell)
+        if intervals is None:
+            if not validate_ends and (cell == start_cell or cell == goal_cell):
+                # Start/end positions are considered valid at all times
+                intervals = [(t_start, t_last)]
+            elif positions[cell] in static_obstacles:
+                intervals = []
+            else:
+                times = reserved_times(cell)
+                if cell == start_cell:
+                    # Like st_astar, the start position itself is never checked
+                    times = [t for t in times if t != t_start]
+                intervals = get_safe_intervals(times, t_start, t_last)
+            intervals_cache[cell] = intervals
+        return intervals
+
+    # nodes[idx] = (cell, arrival time, parent node idx), the start is in its first interval
+    nodes: list[tuple[int, int, int]] = [(start_cell, t_start, -1)]
+    best_arrival: dict[tuple[int, int], int] = {(start_cell, 0): t_start}
+    # f-score, arrival time, node idx, interval idx
+    priority_queue: list[tuple[float, int, int, int]] = [
+        (t_start + heuristic(pos_a), t_start, 0, 0)]
+    goal_node = None
+
+    t_deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    timed_out = False
+    # Partial path end node, has to be closer to pos_b than pos_a, preferring earlier times
+    best_partial: Optional[int] = None
+    best_partial_score = (heuristic(pos_a), t_start)
+    last_reserved_time = get_last_reserved_time(dynamic_obstacles) if partial else None
+
+    cells_visited = 0
+    while (priority_queue and cells_visited < max_cells):
+        if (t_deadline is not None and cells_visited % TIME_BUDGET_CHECK_CELLS == 0 and
+                time.perf_counter() > t_deadline):
+            timed_out = True
+            break
+        _, t, node, interval_idx = heapq.heappop(priority_queue)
+        cell = nodes[node][0]
+        if best_arrival[(cell, interval_idx)] < t:
+            continue  # Already reached this interval earlier
+        cells_visited += 1
+        interval_end = get_intervals(cell)[interval_idx][1]
+        # End once destination reached, or if it can wait there till max_time
+        if cell == goal_cell and (end_fast or interval_end >= t_last):
+            goal_node = node
+            break
+        if last_reserved_time is not None and cell != start_cell:
+            partial_score = (heuristic_cache[cell], t)
+            if partial_score < best_partial_score and last_reserved_time(*positions[cell]) < t:
+                best_partial, best_partial_score = node, partial_score
+
+        # Leaving anytime in this interval lets us arrive at neighbors in this range
+        arrive_first = t + 1
+        arrive_last = min(interval_end + 1, t_last)
+        if arrive_first > arrive_last:
+            continue
+        for neighbor_cell in open_neighbors[cell]:
+            for neighbor_interval_idx, (first, last) in enumerate(get_intervals(neighbor_cell)):
+                if first > arrive_last:
+                    break
+                if last < arrive_first:
+                    continue
+                arrival = max(arrive_first, first)
+                key = (neighbor_cell, neighbor_interval_idx)
+                if arrival < best_arrival.get(key, math.inf):
+                    best_arrival[key] = arrival
+                    nodes.append((neighbor_cell, arrival, node))
+                    h_score = heuristic_cache.get(neighbor_cell)
+                    if h_score is None:
+                        h_score = heuristic(positions[neighbor_cell])
+                        heuristic_cache[neighbor_cell] = h_score
+                    heapq.heappush(priority_queue, (arrival + h_score, arrival,
+                                                    len(nodes) - 1, neighbor_interval_idx))
+
+    path: Path = []
+    end_node = goal_node if goal_node is not None else best_partial
+    if end_node is not None:
+        chain = []
+        node = end_node
+        while node != -1:
+            chain.append(nodes[node])
+            node = nodes[node][2]
+        chain.reverse()
+        # Wait in each cell until it's time to move into the next one
+        for (cell, arrival, _), (_, next_arrival, _) in zip(chain, chain[1:]):
+            path.extend([positions[cell]] * (next_arrival - arrival))
+        end_cell, end_arrival, _ = chain[-1]
+        path.append(positions[end_cell])
+        if goal_node is not None and not end_fast:
+            path.extend([positions[goal_cell]] * (t_last - end_arrival))
+
+    if stats is not None:
+        stats['cells_visited'] = cells_visited
+        stats['path_length'] = len(path)
+        if partial:
+            stats['partial'] = goal_node is None and bool(path)
+        if time_budget is not None:
+            stats['timed_out'] = timed_out
+
+    return path
@@ -0,0 +1,62 @@
+"""Unit tests for conflict-based search."""
+import unittest
+import numpy as np
+from . import batch_collisions, cbs, pathfinding
+from .multiagent import get_scenario
+
+
+class TestCbs(unittest.TestCase):
+    """Unit tests for cbs module"""
+
+    def test_mapf_cbs(self):
+        for scenario in ['scenario2', 'scenario3', 'scenario4', 'scenario5']:
+            grid, goals, starts = get_scenario(
+                f'multiagent_planner/scenarios/{scenario}.yaml')
+            stats = {}
+            paths = cbs.mapf_cbs(grid, starts, goals, stats=stats)
+            self.assertTrue(stats['solved'])
+            self.assertListEqual([path[0] for path in paths], starts)
+            self.assertListEqual([path[-1] for path in paths], goals)
+            self.assertEqual(pathfinding.find_all_collisions(paths), [])
+
+    def test_mapf_cbs_swap_in_corridor(self):
+        # Two robots swapping ends of a corridor, one has to duck into the side pocket
+        grid = np.array([
+            [1, 1, 1, 1, 1, 1, 1],
+            [1, 0, 0, 0, 0, 0, 1],
+            [1, 1, 1, 0, 1, 1, 1],
+            [1, 1, 1, 1, 1, 1, 1]])
+        starts = [(1, 1), (1, 5)]
+        goals = [(1, 5), (1, 1)]
+        stats = {}
+        paths = cbs.mapf_cbs(grid, starts, goals, stats=stats)
+        self.assertTrue(stats['solved'])
+        self.assertEqual(stats['cost'], 11)  # Optimal sum of costs
+        self.assertEqual(sum(len(path) - 1 for path in paths), 11)
+        self.assertEqual(pathfinding.find_all_collisions(paths), [])
+        # Out of budget returns the best paths so far, with conflicts left
+        stats = {}
+        paths = cbs.mapf_cbs(grid, starts, goals, max_nodes=0, stats=stats)
+        self.assertFalse(stats['solved'])
+        self.assertGreater(stats['conflicts'], 0)
+        self.assertEqual(len(paths), 2)
+
+    def test_mapf_ecbs(self):
+        for scenario in ['scenario2', 'scenario3', 'scenario4', 'scenario5']:
+            grid, goals, starts = get_scenario(
+                f'multiagent_planner/scenarios/{scenario}.yaml')
+            cbs_stats, stats = {}, {}
+            cbs.mapf_cbs(grid, starts, goals, stats=cbs_stats)
+            paths = cbs.mapf_ecbs(grid, starts, goals, w=1.5, stats=stats)
+            self.assertTrue(stats['solved'])
+            self.assertListEqual([path[-1] for path in paths], goals)
+            self.assertEqual(pathfinding.find_all_collisions(paths), [])
+            self.assertEqual(len(batch_collisions.find_batch_collisions(paths)), 0)
+            # Bounded suboptimal, within w of the lower bound and the optimal cost
+            self.assertLessEqual(stats['cost'], 1.5 * stats['lower_bound'])
+            self.assertLessEqual(stats['lower_bound'], cbs_stats['cost'])
+            self.assertLessEqual(stats['cost'], 1.5 * cbs_stats['cost'])
+
+
+if __name__ == '__main__':
+    unittest.main()
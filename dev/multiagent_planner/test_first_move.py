@@ -0,0 +1,59 @@
+"""Unit tests for first-move tables."""
+import unittest
+import numpy as np
+from .first_move import NO_MOVE, FirstMoveTable, build_first_move_tables, get_first_moves
+from .pathfinding_heuristic import get_distances
+
+
+class TestFirstMove(unittest.TestCase):
+    """Unit tests for FirstMoveTable"""
+
+    def setUp(self):
+        self.grid = np.zeros((6, 8))
+        self.grid[1:5, 3] = 1  # Wall down the middle
+        self.grid[5, 7] = 1
+        self.goal = (2, 6)
+        self.distances = get_distances(self.grid, self.goal)
+
+    def test_paths_shortest(self):
+        table = FirstMoveTable.build(self.goal, self.grid)
+        moves = get_first_moves(self.distances)
+        for row in range(self.grid.shape[0]):
+            for col in range(self.grid.shape[1]):
+                self.assertEqual(table.move((row, col)), moves[row, col])
+                if self.grid[row, col]:
+                    continue
+                path = table.path((row, col))
+                self.assertEqual(len(path) - 1, self.distances[row, col])
+                self.assertEqual(path[-1], self.goal)
+                for pos_a, pos_b in zip(path, path[1:]):
+                    self.assertEqual(self.distances[pos_b], self.distances[pos_a] - 1)
+        self.assertEqual(moves[self.goal], NO_MOVE)
+        # Rows mostly head the same way, so far fewer runs than cells
+        self.assertLess(len(table), self.grid.size // 2)
+        steps = self.distances[2, 0]
+        self.assertListEqual(table.path((2, 0), max_steps=steps - 1), [])
+        self.assertEqual(len(table.path((2, 0), max_steps=steps)), steps + 1)
+
+    def test_blocked(self):
+        blocked = np.zeros(self.grid.shape, dtype=bool)
+        blocked[[0, 2], 5] = True
+        table = FirstMoveTable.build(self.goal, self.grid, blocked)
+        # Goes around blocked cells, starting from one too
+        path = table.path((2, 4))
+        self.assertNotIn((2, 5), path)
+        self.assertEqual(len(path), 5)
+        self.assertListEqual(table.path((2, 5)), [(2, 5), (2, 6)])
+        # Cut off by blocked cells
+        blocked[5, 3] = True
+        blocked[0, 4] = True
+        table = FirstMoveTable.build(self.goal, self.grid, blocked)
+        self.assertListEqual(table.path((0, 0)), [])
+
+    def test_build_tables(self):
+        tables = build_first_move_tables(self.grid, [self.goal, (5, 0)], processes=1)
+        self.assertEqual(len(tables[self.goal].path((0, 0))) - 1, self.distances[0, 0])
+        self.assertEqual(tables[(5, 0)].path((0, 7))[-1], (5, 0))
+
+if __name__ == '__main__':
+    unittest.main()
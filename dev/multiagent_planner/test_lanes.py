@@ -0,0 +1,113 @@
+"""Unit tests for one-way lanes."""
+import glob
+import os
+import tempfile
+import unittest
+import numpy as np
+from .flat_grid import FlatGrid
+from .lanes import (DOWN, LEFT, NO_LANE, RIGHT, UP, Lanes, format_lanes, generate_lanes,
+                    parse_lanes, transpose_lanes)
+from .pathfinding_heuristic import get_distances_batch
+from .traffic_map import MOVES
+from warehouses.warehouse_loader import WorldInfo
+
+
+class TestLanes(unittest.TestCase):
+    """Unit tests for Lanes"""
+
+    def test_parse_and_format(self):
+        layer = ['.>>.',
+                 '^..v',
+                 '.<<.']
+        directions = parse_lanes(layer, (3, 4))
+        self.assertEqual(directions[0].tolist(), [NO_LANE, RIGHT, RIGHT, NO_LANE])
+        self.assertEqual(directions[1, 0], UP)
+        self.assertEqual(directions[1, 3], DOWN)
+        self.assertEqual(directions[2, 1], LEFT)
+        self.assertEqual(format_lanes(directions), layer)
+        # In x,y the lanes turn with the grid
+        self.assertEqual(format_lanes(transpose_lanes(directions)),
+                         ['.<.', 'v.^', 'v.^', '.>.'])
+        with self.assertRaises(ValueError):
+            parse_lanes(layer, (3, 5))
+        with self.assertRaises(ValueError):
+            parse_lanes(['.x..', '....', '....'], (3, 4))
+
+    def test_moves_against_lanes(self):
+        grid = np.zeros((2, 3))
+        directions = parse_lanes(['.>.', '...'], grid.shape)
+        lanes = Lanes(directions, cost=0)
+        self.assertTrue(lanes.hard)
+        self.assertIs(lanes.blocked_moves, lanes.against)
+        # Only moving left out of the lane cell is against it, crossing it is fine
+        costs = lanes.get_move_costs((0, 1))
+        self.assertEqual(costs[MOVES.index((0, -1))], np.inf)
+        self.assertEqual([cost for cost in costs if cost != np.inf], [0, 0, 0, 0])
+        self.assertEqual(lanes.get_move_costs((0, 2)), [0] * len(MOVES))
+        self.assertEqual(lanes.count_against([(0, 2), (0, 1), (0, 1), (0, 0), (1, 0)]), 1)
+        self.assertEqual(lanes.count_against([(0, 0), (0, 1), (1, 1), (1, 0)]), 0)
+        flat_grid = FlatGrid(grid)
+        successors = lanes.get_successors(flat_grid)
+        self.assertIs(lanes.get_successors(flat_grid), successors)
+        lane_cell, left_cell = flat_grid.cell((0, 1)), flat_grid.cell((0, 0))
+        self.assertEqual(successors[lane_cell],
+                         [cell for cell in flat_grid.successors[lane_cell] if cell != left_cell])
+        self.assertIsNone(lanes.get_successor_costs(flat_grid))
+        # Lane costs keep every move, costing the ones against lanes
+        lanes = Lanes(directions, cost=2.5)
+        self.assertFalse(lanes.hard)
+        self.assertIsNone(lanes.blocked_moves)
+        self.assertEqual(lanes.get_successors(flat_grid), flat_grid.successors)
+        successor_costs = lanes.get_successor_costs(flat_grid)
+        self.assertEqual(successor_costs[lane_cell],
+                         {cell: 2.5 if cell == left_cell else 0
+                          for cell in flat_grid.successors[lane_cell]})
+
+    def test_generate_lanes(self):
+        grid = np.array([[1, 1, 1, 1, 1, 0],
+                         [0, 0, 0, 0, 0, 0],
+                         [0, 0, 0, 0, 0, 0],
+                         [1, 1, 0, 0, 1, 1],
+                         [1, 1, 0, 0, 1, 1],
+                         [1, 1, 0, 0, 1, 1]])
+        # A zone counts as a wall, so the aisle is two wide below it too
+        self.assertEqual(format_lanes(generate_lanes(grid, zones=[(0, 5)])),
+                         ['......',
+                          '<<..<<',
+                          '>>..>>',
+                          '..v^..',
+                          '..v^..',
+                          '..v^..'])
+
+    def test_generated_lanes_keep_cells_reachable(self):
+        for filename in sorted(glob.glob('warehouses/*.yaml')):
+            world_info = WorldInfo.from_yaml(filename)
+            grid = world_info.world_grid
+            lanes = Lanes.from_world_info(world_info)
+            self.assertTrue((lanes.directions != NO_LANE).any(), filename)
+            zones = world_info.get_all_zones()[:16]
+            np.testing.assert_array_equal(
+                get_distances_batch(grid, zones, blocked_moves=lanes.blocked_moves) >= 0,
+                get_distances_batch(grid, zones) >= 0, filename)
+
+    def test_load_lanes_layer(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'warehouse.yaml')
+            with open(filename, 'w', encoding='utf8') as file:
+                file.write('grid:\n'
+                           '- [2, 0, 0, 3]\n'
+                           '- [1, 0, 0, 4]\n'
+                           'lanes:\n'
+                           '- ".>>."\n'
+                           '- "..^."\n')
+            world_info = WorldInfo.from_yaml(filename)
+            # In x,y like the grid
+            self.assertEqual(world_info.lanes.shape, world_info.world_grid.shape)
+            self.assertEqual(format_lanes(world_info.lanes), ['..', 'v.', 'v<', '..'])
+            np.testing.assert_array_equal(Lanes.from_world_info(world_info).directions,
+                                          world_info.lanes)
+        self.assertIsNone(WorldInfo.from_yaml('warehouses/warehouse_small.yaml').lanes)
+
+
+if __name__ == '__main__':
+    unittest.main()
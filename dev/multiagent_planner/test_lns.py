@@ -0,0 +1,82 @@
+"""Unit tests for the LNS path optimizer."""
+import time
+import unittest
+import numpy as np
+from .lns import LNSOptimizer, get_delay, get_intersections
+from .pathfinding import find_all_collisions
+from .pathfinding_heuristic import HeuristicStore
+from .reservation_table import ReservationTable
+
+
+class TestLNS(unittest.TestCase):
+    """Unit tests for LNSOptimizer"""
+
+    def setUp(self):
+        self.grid = np.zeros((5, 7))
+        self.heuristic = HeuristicStore.build(self.grid, [(2, 6), (0, 4), (4, 6)],
+                                              processes=1)
+        self.reservations = ReservationTable(self.grid.shape, horizon=30)
+        # A long detour along the bottom, a short path along the top, and a robot that
+        # isn't optimized crossing the middle
+        self.paths = {
+            0: [(2, 0), (3, 0), (4, 0), (4, 1), (4, 2), (4, 3), (4, 4), (4, 5), (4, 6), (3, 6),
+                (2, 6)],
+            1: [(0, 2), (0, 3), (0, 4)],
+        }
+        self.other_path = [(1, 3), (2, 3), (3, 3), (3, 2)]
+        for owner, path in self.paths.items():
+            self.reservations.reserve_path(path, 0, buffer=1, owner=owner)
+        self.reservations.reserve_path(self.other_path, 0, buffer=1, owner='other')
+
+    def test_optimize(self):
+        optimizer = LNSOptimizer(neighborhood_size=2, max_steps=20, seed=0)
+        paths = optimizer.optimize(self.grid, self.heuristic, self.reservations, self.paths,
+                                   set(), t_start=0, time_budget=1.0, max_iterations=20)
+        self.assertEqual(list(paths), [0])
+        path = paths[0]
+        self.assertEqual(path[0], (2, 0))
+        self.assertEqual(path[-1], (2, 6))
+        self.assertLess(len(path), len(self.paths[0]))
+        self.assertEqual(get_delay(path, self.heuristic[(2, 6)]), len(path) - 7)
+        self.assertEqual(find_all_collisions([path, self.paths[1], self.other_path]), [])
+        # Kept paths are reserved for their owner
+        self.assertEqual(self.reservations.get_owner_path(0), (path, 0))
+        self.assertEqual(self.reservations.get_owner_path(1), (self.paths[1], 0))
+        self.assertGreater(optimizer.stats()['cost_saved'], 0)
+        # Nothing left to shorten, stops without iterating
+        self.assertEqual(optimizer.optimize(
+            self.grid, self.heuristic, self.reservations, {0: path, 1: self.paths[1]}, set(),
+            t_start=0, time_budget=1.0), {})
+
+    def test_replan_restores_reservations(self):
+        optimizer = LNSOptimizer(max_steps=20, seed=0)
+        table = self.reservations.table.copy()
+        owners = dict(self.reservations.owners)
+        # Out of time, the searches give up and the old paths are put back
+        new_paths = optimizer.replan(self.grid, self.heuristic, self.reservations, self.paths,
+                                     [1, 0], set(), 0, time.perf_counter())
+        self.assertIsNone(new_paths)
+        self.assertEqual(optimizer.failed, 1)
+        np.testing.assert_array_equal(self.reservations.table, table)
+        self.assertEqual(self.reservations.owners, owners)
+
+    def test_neighborhoods(self):
+        optimizer = LNSOptimizer(neighborhood_size=2, seed=0)
+        visits = {pos: {0: None} for pos in self.paths[0]}
+        for pos in self.paths[1]:
+            visits.setdefault(pos, {})[1] = None
+        delays = {0: 4, 1: 0}
+        intersections = get_intersections(self.grid)
+        self.assertFalse(intersections[0, 0])
+        self.assertTrue(intersections[0, 3])
+        neighborhood = optimizer.get_neighborhood('agent', self.paths, visits, delays,
+                                                  self.heuristic, intersections)
+        self.assertEqual(neighborhood[0], 0)
+        self.assertEqual(sorted(neighborhood), [0, 1])
+        for name in ('random', 'intersection'):
+            self.assertEqual(sorted(optimizer.get_neighborhood(
+                name, self.paths, visits, delays, self.heuristic, intersections)), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Unit tests for the path cache."""
+import unittest
+import numpy as np
+from .path_cache import PathCache
+from .pathfinding import st_astar_flat
+from .pathfinding_heuristic import HeuristicStore
+from .reservation_table import ReservationTable
+
+
+class TestPathCache(unittest.TestCase):
+    """Unit tests for PathCache"""
+
+    def setUp(self):
+        self.grid = np.zeros((5, 7))
+        self.heuristic = HeuristicStore.build(self.grid, [(2, 6), (0, 6), (4, 6)],
+                                              processes=1)
+
+    def assertPathValid(self, path, reservations, t_start=0):
+        # pylint: disable=invalid-name
+        for t, pos in enumerate(path[1:-1], t_start + 1):
+            self.assertNotIn((pos[0], pos[1], t), reservations)
+        for pos_a, pos_b in zip(path, path[1:]):
+            self.assertLessEqual(abs(pos_a[0] - pos_b[0]) + abs(pos_a[1] - pos_b[1]), 1)
+
+    def test_plan_repairs_conflicts(self):
+        cache = PathCache(self.grid)
+        reservations = ReservationTable(self.grid.shape, horizon=30, t_start=5)
+        stats = {}
+        path = cache.plan((2, 0), (2, 6), reservations, set(), self.heuristic[(2, 6)],
+                          max_steps=20, t_start=5, stats=stats)
+        self.assertEqual(len(path), 7)
+        self.assertFalse(stats['path_cache_hit'])
+        self.assertEqual(stats['path_repairs'], 0)
+        # A robot crossing the cached path, only that stretch is searched again
+        reservations.reserve_path([(1, 3), (2, 3), (3, 3)], t_start=7, buffer=1, owner=0)
+        path = cache.plan((2, 0), (2, 6), reservations, set(), self.heuristic[(2, 6)],
+                          max_steps=20, t_start=5, stats=stats)
+        self.assertTrue(stats['path_cache_hit'])
+        self.assertEqual(stats['path_repairs'], 1)
+        self.assertEqual(path[0], (2, 0))
+        self.assertEqual(path[-1], (2, 6))
+        self.assertPathValid(path, reservations, t_start=5)
+        # As short as a full search
+        self.assertEqual(len(path), len(st_astar_flat(
+            self.grid, (2, 0), (2, 6), reservations, max_time=20, t_start=5, end_fast=True,
+            validate_ends=False)))
+        # Static obstacles on the path are repaired around too
+        path = cache.plan((2, 0), (2, 6), set(), {(2, 2)}, self.heuristic[(2, 6)],
+                          max_steps=20)
+        self.assertNotIn((2, 2), path)
+        self.assertEqual(path[-1], (2, 6))
+        self.assertEqual(cache.stats(), {'cached': 1, 'hits': 2, 'misses': 1, 'evictions': 0,
+                                         'repaired': 2, 'repairs': 2, 'failed': 0})
+
+    def test_plan_fails(self):
+        cache = PathCache(self.grid, max_repairs=2)
+        # Column 3 taken past max_steps, no way through
+        dynamic_obstacles = {(row, 3, t) for row in range(5) for t in range(30)}
+        path = cache.plan((2, 0), (2, 6), dynamic_obstacles, set(), self.heuristic[(2, 6)],
+                          max_steps=20)
+        self.assertListEqual(path, [])
+        self.assertEqual(cache.stats()['failed'], 1)
+        # The free-space path is kept for when the way clears
+        self.assertEqual(len(cache.paths[((2, 0), (2, 6))]), 7)
+
+    def test_lru_and_set_cells(self):
+        cache = PathCache(self.grid, fixed_obstacles={(1, 6)}, max_size=2)
+        for goal in [(2, 6), (0, 6), (4, 6)]:
+            cache.get_free_path((2, 0), goal, self.heuristic[goal])
+        self.assertEqual(list(cache.paths), [((2, 0), (0, 6)), ((2, 0), (4, 6))])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        # Fixed obstacles are avoided
+        self.assertNotIn((1, 6), cache.paths[((2, 0), (0, 6))])
+        # Paths through blocked cells are dropped, all of them when cells are unblocked
+        blocked_cell = cache.paths[((2, 0), (4, 6))][3]
+        grid = self.grid.copy()
+        grid[blocked_cell] = 1
+        self.assertEqual(cache.set_cells(grid, [blocked_cell]), 1)
+        self.assertEqual(list(cache.paths), [((2, 0), (0, 6))])
+        self.assertIs(cache.grid, grid)
+        self.assertEqual(cache.set_cells(self.grid, [blocked_cell], blocked=False), 1)
+        self.assertEqual(cache.paths, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
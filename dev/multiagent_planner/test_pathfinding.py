@@ -1,11 +1,22 @@
 """Unit tests for pathfinding."""
+from collections import deque
+import os
+import random
+import tempfile
 import unittest
+from unittest import mock
 import numpy as np
 from .pathfinding import Position
 # from .pathfinding_heuristic import timeit
-from . import pathfinding
+from .flat_grid import DIRECTIONS
+from .lanes import Lanes, parse_lanes
+from .open_list import OPEN_LISTS, make_open_list
+from .reservation_table import ReservationTable
+from .traffic_map import TrafficMap
+from . import batch_collisions, pathfinding
 from . import pathfinding_heuristic as pfh
 from .multiagent import get_scenario
+from warehouses.warehouse_loader import WorldInfo
 # python -m unittest
 
 
@@ -19,12 +30,76 @@ class TestPathfinding(unittest.TestCase):
         collisions = pathfinding.find_collisions(path1, path2)
         self.assertEqual(collisions, [(1, 0, 1, 2)])
 
+    def test_collision_index(self):
+        # Path 1 swaps with path 0 at t=1, path 2 passes through path 0's goal after it ended
+        paths = [[(0, 0), (0, 1)], [(0, 1), (0, 0), (1, 0)], [(1, 1), (1, 1), (0, 1), (0, 2)]]
+        copied_paths = [list(path) for path in paths]
+        pairwise = [collision for i, path in enumerate(paths) for j in range(i + 1, len(paths))
+                    for collision in pathfinding.find_collisions(path, paths[j], label=j)]
+        self.assertEqual(pairwise, [(1, 0, 0, 1), (2, 0, 1, 2)])
+        self.assertEqual(pathfinding.find_all_collisions(paths), pairwise)
+        self.assertEqual(pathfinding.find_given_collisions(paths, [2]), [(0, 0, 1, 2)])
+        self.assertEqual(paths, copied_paths)  # Not padded
+
+        # Replacing and removing single paths
+        collision_index = pathfinding.CollisionIndex(paths)
+        collision_index.set_path(2, [(1, 1), (1, 2)])
+        self.assertEqual(collision_index.find_collisions(), [(1, 0, 0, 1)])
+        collision_index.remove_path(1)
+        self.assertEqual(collision_index.find_collisions(), [])
+        self.assertEqual(collision_index.visits[(0, 0)], {0: {0}})
+
+    def test_collision_index_matches_pairwise(self):
+        random.seed(0)
+        moves = [(0, 0), (0, 1), (1, 0), (0, -1), (-1, 0)]
+        for _ in range(200):
+            paths = []
+            for _ in range(random.randint(1, 6)):
+                pos = (random.randint(0, 2), random.randint(0, 2))
+                path = [pos]
+                for _ in range(random.randint(0, 8)):
+                    d_row, d_col = random.choice(moves)
+                    pos = (min(2, max(0, pos[0] + d_row)), min(2, max(0, pos[1] + d_col)))
+                    path.append(pos)
+                paths.append(path)
+            pairwise = [collision for i, path in enumerate(paths)
+                        for j in range(i + 1, len(paths))
+                        for collision in pathfinding.find_collisions(path, paths[j], label=j)]
+            self.assertEqual(pathfinding.find_all_collisions(paths), pairwise)
+
+            # Batch checker finds the same vertex collisions and swaps, but not both robots waiting
+            collision_index = pathfinding.CollisionIndex(paths)
+            expected = sorted(
+                (t, kind, i, j) for i in range(len(paths))
+                for j, t, kind, pos in collision_index.path_collisions(i)
+                if i < j and (kind == pathfinding.VERTEX_CONFLICT or
+                              paths[j][min(t - 1, len(paths[j]) - 1)] != pos))
+            self.assertEqual(batch_collisions.find_batch_collisions(paths).tolist(),
+                             [list(collision) for collision in expected])
+
+    def test_find_batch_collisions(self):
+        paths = [[(0, 0), (0, 1)], [(0, 1), (0, 0), (1, 0)], [(1, 1), (1, 1), (0, 1), (0, 2)], []]
+        packed, lengths = batch_collisions.pack_paths(paths)
+        self.assertEqual(packed.shape, (4, 4, 2))
+        self.assertEqual(packed[0].tolist(), [[0, 0], [0, 1], [0, 1], [0, 1]])  # Held at goal
+        self.assertEqual(packed[3].tolist(), [[-1, -1]] * 4)
+        self.assertEqual(lengths.tolist(), [2, 3, 4, 0])
+        # Robots 0 and 1 swap at t=1, robot 2 passes through robot 0's goal at t=2
+        self.assertEqual(batch_collisions.find_batch_collisions(paths).tolist(),
+                         [[1, pathfinding.EDGE_CONFLICT, 0, 1],
+                          [2, pathfinding.VERTEX_CONFLICT, 0, 2]])
+        self.assertEqual(batch_collisions.find_batch_collisions([]).shape, (0, 4))
+
     def test_mapf0(self):
         grid, goals, starts = get_scenario(
             'multiagent_planner/scenarios/scenario2.yaml')
         paths = pathfinding.mapf0(grid, starts, goals)
         collisions = pathfinding.find_all_collisions(paths)
-        self.assertEqual(collisions, [(2, 2, 5, 6)])
+        # Independent shortest paths (with JPS) collide
+        self.assertEqual(collisions, [(1, 4, 5, 7)])
+        self.assertListEqual([len(path) for path in paths],
+                             [len(pathfinding.astar(grid, start, goal))
+                              for start, goal in zip(starts, goals)])
 
     def test_mapf1(self):
         grid, goals, starts = get_scenario(
@@ -41,6 +116,95 @@ class TestPathfinding(unittest.TestCase):
                          (3, 1), (4, 1), (4, 2), (4, 3), (3, 3), (3, 4)]
         self.assertEqual(path, expected_path)
 
+    def test_jps(self):
+        grid, goals, starts = get_scenario(
+            'multiagent_planner/scenarios/scenario1.yaml')
+        self.assertEqual(len(pathfinding.jps(grid, starts[0], goals[0])),
+                         len(pathfinding.astar(grid, starts[0], goals[0])))
+        # Shortest paths between any two open cells of random grids, as long as astar's when
+        # there is one, with fewer cells expanded on open grids
+        rng = np.random.default_rng(0)
+        for wall_ratio in [0, 0.2, 0.4]:
+            grid = (rng.random((12, 15)) < wall_ratio).astype(np.int32)
+            open_cells = [(int(row), int(col)) for row, col in np.argwhere(grid == 0)]
+            for _ in range(50):
+                pos_a, pos_b = (open_cells[idx] for idx in rng.choice(len(open_cells), 2))
+                [distances] = pfh.get_distances_batch(grid, [pos_b])
+                heuristic = pathfinding.get_manhattan_heuristic(pos_b)
+                stats = {}
+                jps_path = pathfinding.jps(grid, pos_a, pos_b, heuristic=heuristic, stats=stats)
+                if distances[pos_a] < 0:
+                    self.assertEqual(jps_path, [])
+                    continue
+                self.assertEqual(len(jps_path), distances[pos_a] + 1)
+                self.assertEqual(len(jps_path),
+                                 len(pathfinding.astar(grid, pos_a, pos_b, heuristic=heuristic)))
+                self.assertEqual(jps_path[0], pos_a)
+                self.assertEqual(jps_path[-1], pos_b)
+                for (row_a, col_a), (row_b, col_b) in zip(jps_path, jps_path[1:]):
+                    self.assertEqual(abs(row_b - row_a) + abs(col_b - col_a), 1)
+                    self.assertEqual(grid[row_b, col_b], 0)
+                if wall_ratio == 0:
+                    self.assertLessEqual(stats['cells_visited'], 4)
+        # Walled off goal, and goal on a wall
+        grid = np.array([[0, 0, 1, 0],
+                         [0, 0, 1, 0]])
+        self.assertEqual(pathfinding.jps(grid, (0, 0), (1, 3)), [])
+        with self.assertRaises(ValueError):
+            pathfinding.jps(grid, (0, 0), (0, 2))
+
+    def test_st_astar_traffic(self):
+        grid = np.zeros((3, 7))
+        traffic = TrafficMap(grid.shape, weight=0.1)
+        for _ in range(10):
+            traffic.add_path([(1, col) for col in range(7)])
+        heuristic = pathfinding.get_manhattan_heuristic((1, 6))
+        # Straight along the busy middle row until the costs see the traffic
+        for engine in (pathfinding.st_astar, pathfinding.st_astar_flat):
+            path = engine(grid, (1, 0), (1, 6), max_time=20, end_fast=True,
+                          heuristic=heuristic, traffic=traffic)
+            self.assertEqual(len(path), 7)
+        traffic.advance()
+        paths = [engine(grid, (1, 0), (1, 6), max_time=20, end_fast=True, heuristic=heuristic,
+                        traffic=traffic)
+                 for engine in (pathfinding.st_astar, pathfinding.st_astar_flat)]
+        for path in paths:
+            # Around it, two steps longer
+            self.assertEqual(len(path), 9)
+            self.assertEqual([pos for pos in path[1:-1] if pos[0] == 1], [])
+
+    def test_st_astar_lanes(self):
+        grid = np.zeros((3, 7))
+        directions = parse_lanes(['.......', '.<<<<<.', '.......'], grid.shape)
+        heuristic = pathfinding.get_manhattan_heuristic((1, 6))
+        for engine in (pathfinding.st_astar, pathfinding.st_astar_flat):
+            # Around the middle row, against its lane
+            lanes = Lanes(directions, cost=0)
+            path = engine(grid, (1, 0), (1, 6), max_time=20, end_fast=True,
+                          heuristic=heuristic, lanes=lanes)
+            self.assertEqual(len(path), 9)
+            self.assertEqual(lanes.count_against(path), 0)
+            # Against it if that costs less than going around
+            path = engine(grid, (1, 0), (1, 6), max_time=20, end_fast=True,
+                          heuristic=heuristic, lanes=Lanes(directions, cost=0.1))
+            self.assertEqual(len(path), 7)
+            path = engine(grid, (1, 0), (1, 6), max_time=20, end_fast=True,
+                          heuristic=heuristic, lanes=Lanes(directions, cost=0.5))
+            self.assertEqual(len(path), 9)
+            # Along it is never blocked
+            path = engine(grid, (1, 6), (1, 0), max_time=20, end_fast=True,
+                          heuristic=pathfinding.get_manhattan_heuristic((1, 0)), lanes=lanes)
+            self.assertEqual(len(path), 7)
+        # Distances along the lanes guide the search straight around
+        field = pfh.get_distances_batch(grid, [(1, 6)], blocked_moves=lanes.blocked_moves)[0]
+        self.assertEqual(field[1, 0], 8)
+        stats = {}
+        path = pathfinding.st_astar_flat(grid, (1, 0), (1, 6), max_time=20, end_fast=True,
+                                         heuristic=lambda pos: field[pos], lanes=lanes,
+                                         stats=stats)
+        self.assertEqual(len(path), 9)
+        self.assertEqual(stats['cells_visited'], 8)
+
     def test_st_astar_no_obstacles(self):
         grid, goals, starts = get_scenario(
             'multiagent_planner/scenarios/scenario1.yaml')
@@ -108,6 +272,326 @@ class TestPathfinding(unittest.TestCase):
             (1, 8), (1, 9), (2, 9), (3, 9), (4, 9), (4, 8), (5, 8)]
         self.assertEqual(path_static, expected_path_static)
     
+    def test_st_astar_flat_matches_st_astar(self):
+        grid, goals, starts = get_scenario(
+            'multiagent_planner/scenarios/scenario3.yaml')
+        dynamic_obstacles = set([(1, 3, 2), (2, 5, 5), (2, 6, 6), (4, 8, 10)])
+        static_obstacles = set([(2, 8)])
+        for kwargs in [dict(end_fast=True), dict(max_time=30), dict(end_fast=True, t_start=5),
+                       dict(end_fast=True, validate_ends=False), dict(end_fast=True, max_cells=20)]:
+            stats, stats_flat = {}, {}
+            path = pathfinding.st_astar(
+                grid, starts[0], goals[0], dynamic_obstacles, static_obstacles,
+                stats=stats, **kwargs)
+            path_flat = pathfinding.st_astar_flat(
+                grid, starts[0], goals[0], dynamic_obstacles, static_obstacles,
+                stats=stats_flat, **kwargs)
+            self.assertListEqual(path, path_flat)
+            self.assertDictEqual(stats, stats_flat)
+
+    def test_st_astar_partial(self):
+        grid = np.zeros((3, 5))
+        # Column 3 is always taken, so (0, 4) can't be reached
+        wall = set((row, 3, t) for row in range(3) for t in range(30))
+        heuristic = pathfinding.get_manhattan_heuristic((0, 4))
+        for search in [pathfinding.st_astar, pathfinding.st_astar_flat]:
+            stats = {}
+            self.assertListEqual(search(grid, (0, 0), (0, 4), wall, end_fast=True,
+                                        heuristic=heuristic), [])
+            path = search(grid, (0, 0), (0, 4), wall, end_fast=True, heuristic=heuristic,
+                          partial=True, stats=stats)
+            self.assertListEqual(path, [(0, 0), (0, 1), (0, 2)])
+            self.assertTrue(stats['partial'])
+            # Partial paths only end where nothing is reserved later, earliest on ties
+            path = search(grid, (0, 0), (0, 4), wall | {(0, 2, 25)}, end_fast=True,
+                          heuristic=heuristic, partial=True)
+            self.assertListEqual(path, [(0, 0), (0, 1)])
+            path = search(grid, (0, 0), (0, 4), wall | {(0, 2, 5)}, end_fast=True,
+                          heuristic=heuristic, partial=True)
+            self.assertListEqual(path, [(0, 0)] + [(0, 1)] * 5 + [(0, 2)])
+            table = ReservationTable(grid.shape, horizon=40)
+            table.reserve_path([(0, 2)] * 30)
+            for row in range(3):
+                table.reserve_path([(row, 3)] * 30)
+            self.assertListEqual(search(grid, (0, 0), (0, 4), table, end_fast=True,
+                                        heuristic=heuristic, partial=True), [(0, 0), (0, 1)])
+            # Out of time before expanding anything
+            stats = {}
+            self.assertListEqual(search(grid, (0, 0), (0, 4), end_fast=True, time_budget=0,
+                                        partial=True, stats=stats), [])
+            self.assertTrue(stats['timed_out'])
+            self.assertEqual(stats['cells_visited'], 0)
+
+    def test_open_lists(self):
+        for open_list in OPEN_LISTS:
+            queue = make_open_list(open_list)
+            for f_score, g_score, item in [(5, 1, 'a'), (4.9, 0.9, 'b'), (5, 3, 'c'), (6, 0, 'd'),
+                                           (5, 2, 'e')]:
+                queue.push(f_score, g_score, item)
+            self.assertEqual(len(queue), 5)
+            # Lowest f first, ties to the larger g
+            self.assertListEqual([queue.pop() for _ in range(5)], ['b', 'c', 'e', 'a', 'd'])
+            self.assertFalse(queue)
+        with self.assertRaises(ValueError):
+            make_open_list('fibonacci')
+
+        # Bucket open list finds paths just as short in every search
+        grid, goals, starts = get_scenario(
+            'multiagent_planner/scenarios/scenario3.yaml')
+        dynamic_obstacles = set([(1, 3, 2), (2, 5, 5), (2, 6, 6), (4, 8, 10)])
+        for search in [pathfinding.st_astar, pathfinding.st_astar_flat,
+                       pathfinding.windowed_st_astar]:
+            path = search(grid, starts[0], goals[0], dynamic_obstacles)
+            path_bucket = search(grid, starts[0], goals[0], dynamic_obstacles,
+                                 open_list='bucket')
+            self.assertEqual(len(path_bucket), len(path))
+        path = pathfinding.astar(grid, starts[0], goals[0],
+                                 heuristic=pathfinding.get_manhattan_heuristic(goals[0]))
+        path_bucket = pathfinding.astar(grid, starts[0], goals[0], open_list='bucket',
+                                        heuristic=pathfinding.get_manhattan_heuristic(goals[0]))
+        self.assertEqual(len(path_bucket), len(path))
+
+    def test_windowed_st_astar(self):
+        grid = np.zeros([5, 30])
+        pos_a, pos_b = (2, 0), (2, 29)
+        true_dists = pfh.build_true_heuristic(grid, [pos_b])[pos_b]
+        def true_heuristic(pos: Position) -> float:
+            return float(true_dists[pos])
+        # A wall of robots crossing column 20 well after the window
+        dynamic_obstacles = set((row, 20, t) for row in range(5) for t in range(15, 25))
+        stats, stats_windowed = {}, {}
+        path = pathfinding.st_astar_flat(grid, pos_a, pos_b, dynamic_obstacles, end_fast=True,
+                                         max_time=100, heuristic=true_heuristic, stats=stats)
+        path_windowed = pathfinding.windowed_st_astar(
+            grid, pos_a, pos_b, dynamic_obstacles, window=10, heuristic=true_heuristic,
+            stats=stats_windowed)
+        # Past the window the wall is ignored, going straight there
+        self.assertListEqual(path_windowed, [(2, col) for col in range(30)])
+        self.assertGreater(len(path), len(path_windowed))
+        self.assertLess(stats_windowed['cells_visited'], stats['cells_visited'])
+
+        # Inside the window obstacles are avoided
+        dynamic_obstacles = set([(2, 3, 3), (2, 4, 4)])
+        path_windowed = pathfinding.windowed_st_astar(
+            grid, pos_a, pos_b, dynamic_obstacles, window=10, heuristic=true_heuristic)
+        self.assertEqual(path_windowed[-1], pos_b)
+        for t, pos in enumerate(path_windowed):
+            self.assertNotIn((pos[0], pos[1], t), dynamic_obstacles)
+        for pos, next_pos in zip(path_windowed, path_windowed[1:]):
+            self.assertLessEqual(abs(pos[0] - next_pos[0]) + abs(pos[1] - next_pos[1]), 1)
+
+    def test_get_distances_batch(self):
+        grid, goals, starts = get_scenario('multiagent_planner/scenarios/scenario3.yaml')
+        grid = grid.copy()
+        grid[1, 1:4] = 1  # Wall off a corner so some cells are unreachable
+        positions = goals + starts + [(1, 1)]  # Including a start in a wall
+        distances = pfh.get_distances_batch(grid, positions)
+        for pos, field in zip(positions, distances):
+            np.testing.assert_array_equal(field, pfh.get_distances(grid, pos))
+        # Split in batches over processes is the same
+        batches = list(pfh.map_distance_batches(grid, positions, processes=2, batch_size=3))
+        self.assertEqual(len(batches), (len(positions) + 2) // 3)
+        np.testing.assert_array_equal(np.concatenate(batches), distances)
+        heuristic_dict = pfh.build_true_heuristic(grid, positions)
+        for pos, field in zip(positions, distances):
+            np.testing.assert_array_equal(heuristic_dict[pos], field)
+        store = pfh.HeuristicStore.build(grid, positions, processes=2)
+        for pos, field in zip(positions, distances):
+            np.testing.assert_array_equal(store[pos].to_array(), field)
+
+    def test_get_distances_batch_lanes(self):
+        grid, goals, starts = get_scenario('multiagent_planner/scenarios/scenario3.yaml')
+        rng = np.random.default_rng(0)
+        lanes = Lanes(rng.integers(-1, len(DIRECTIONS), size=grid.shape), cost=0)
+        positions = list(dict.fromkeys(goals + starts))
+        distances = pfh.get_distances_batch(grid, positions, blocked_moves=lanes.blocked_moves)
+        rows, cols = grid.shape
+        for goal, field in zip(positions, distances):
+            # BFS back from the goal over the moves lanes allow
+            expected = np.full(grid.shape, -1)
+            expected[goal] = 0
+            queue = deque([goal])
+            while queue:
+                row, col = queue.popleft()
+                for direction, (d_row, d_col) in enumerate(DIRECTIONS):
+                    prev = (row - d_row, col - d_col)
+                    if (0 <= prev[0] < rows and 0 <= prev[1] < cols and grid[prev] == 0 and
+                            expected[prev] < 0 and not lanes.against[direction][prev]):
+                        expected[prev] = expected[row, col] + 1
+                        queue.append(prev)
+            np.testing.assert_array_equal(field, expected)
+        self.assertTrue((distances > pfh.get_distances_batch(grid, positions)).any())
+
+    def test_heuristic_store_lanes(self):
+        grid, goals, starts = get_scenario('multiagent_planner/scenarios/scenario3.yaml')
+        positions = list(dict.fromkeys(goals + starts))
+        blocked_moves = Lanes(np.random.default_rng(0).integers(-1, len(DIRECTIONS),
+                                                                size=grid.shape)).against
+        store = pfh.HeuristicStore.build(grid, positions, blocked_moves=blocked_moves)
+        self.assertNotEqual(pfh.heuristic_fingerprint(grid, positions, blocked_moves),
+                            pfh.heuristic_fingerprint(grid, positions))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'scenario3_heuristic.npy')
+            store.save(filename)
+            loaded = pfh.HeuristicStore.load(filename)
+            np.testing.assert_array_equal(loaded.blocked_moves, blocked_moves)
+            np.testing.assert_array_equal(loaded.distances, store.distances)
+            del loaded
+        # Grid changes rebuild every field along the lanes
+        heuristic = pfh.LazyHeuristic(grid, store, blocked_moves=blocked_moves)
+        other_goal = next(pos for pos in map(tuple, np.argwhere(grid == 0).tolist())
+                          if pos not in positions)
+        self.assertIsNotNone(heuristic[other_goal])
+        self.assertIn(other_goal, heuristic.cache)  # Cached
+        cells = [tuple(np.argwhere(grid == 0)[5])]
+        self.assertEqual(heuristic.set_cells(cells), len(positions) + 1)
+        expected = pfh.get_distances_batch(heuristic.grid, positions + [other_goal],
+                                           dtype=np.uint16, unreachable=pfh.UNREACHABLE,
+                                           blocked_moves=blocked_moves)
+        np.testing.assert_array_equal(store.distances, expected[:-1])
+        np.testing.assert_array_equal(heuristic[other_goal].distances, expected[-1])
+        rebuilt, built_count = store.rebuild(grid, positions, blocked_moves=blocked_moves)
+        self.assertEqual(built_count, len(positions))
+        np.testing.assert_array_equal(
+            rebuilt.distances,
+            pfh.HeuristicStore.build(grid, positions, blocked_moves=blocked_moves).distances)
+
+    def test_heuristic_store(self):
+        grid, goals, starts = get_scenario('multiagent_planner/scenarios/scenario3.yaml')
+        grid = grid.copy()
+        grid[1, 1:4] = 1  # Wall off a corner so some cells are unreachable
+        heuristic_dict = pfh.build_true_heuristic(grid, goals + starts)
+        store = pfh.HeuristicStore.build(grid, goals + starts)
+        self.assertEqual(store.distances.dtype, np.uint16)
+        self.assertEqual(store.distances.shape, (len(heuristic_dict), *grid.shape))
+        for goal, field in heuristic_dict.items():
+            self.assertIn(goal, store)
+            np.testing.assert_array_equal(store[goal].to_array(), field)
+            self.assertEqual(store[goal][starts[0]], field[starts[0]])
+        self.assertIsNone(store.get((0, 0)))
+        packed = pfh.HeuristicStore.from_heuristic_dict(heuristic_dict)
+        np.testing.assert_array_equal(packed.distances, store.distances)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'scenario3_heuristic.npy')
+            store.save(filename)
+            loaded = pfh.HeuristicStore.load(filename)
+            self.assertIsInstance(loaded.distances, np.memmap)
+            self.assertListEqual(loaded.goals, store.goals)
+            for goal, field in heuristic_dict.items():
+                np.testing.assert_array_equal(loaded[goal].to_array(), field)
+            del loaded  # Release the memory map before the file is removed
+
+    def test_heuristic_store_rebuild(self):
+        grid, goals, starts = get_scenario('multiagent_planner/scenarios/scenario3.yaml')
+        positions = list(dict.fromkeys(goals + starts))
+        store = pfh.HeuristicStore.build(grid, positions)
+        # Block an open cell, and open a wall cell
+        new_grid = grid.copy()
+        new_grid[tuple(np.argwhere(grid == 0)[5])] = 1
+        new_grid[tuple(np.argwhere(grid > 0)[-1])] = 0
+        expected = pfh.HeuristicStore.build(new_grid, positions)
+        stale = pfh.get_stale_goals(store.distances, grid, new_grid)
+        self.assertTrue(0 < stale.sum() < len(positions))
+        # Fields that aren't stale only need the changed cells patched
+        patched = store.distances[~stale]
+        pfh.patch_fields(patched, grid, new_grid)
+        np.testing.assert_array_equal(patched, expected.distances[~stale])
+        rebuilt, built_count = store.rebuild(new_grid, positions)
+        self.assertEqual(built_count, stale.sum())
+        np.testing.assert_array_equal(rebuilt.distances, expected.distances)
+        # New goals are built, removed ones dropped
+        new_goal = next(pos for pos in map(tuple, np.argwhere(grid == 0).tolist())
+                        if pos not in positions)
+        rebuilt, built_count = store.rebuild(grid, positions[1:] + [new_goal])
+        self.assertEqual(built_count, 1)
+        self.assertListEqual(rebuilt.goals, positions[1:] + [new_goal])
+
+    def test_heuristic_store_set_cells(self):
+        grid, goals, starts = get_scenario('multiagent_planner/scenarios/scenario3.yaml')
+        positions = list(dict.fromkeys(goals + starts))
+        store = pfh.HeuristicStore.build(grid, positions)
+        heuristic = pfh.LazyHeuristic(grid, pfh.HeuristicStore.build(grid, goals))
+        free_cells = [tuple(pos) for pos in np.argwhere(grid == 0).tolist()]
+        walls = [tuple(pos) for pos in np.argwhere(grid > 0).tolist()]
+        other_goal = next(pos for pos in free_cells if pos not in goals)
+        self.assertIsNotNone(heuristic[other_goal])
+        self.assertIn(other_goal, heuristic.cache)  # Cached
+        random.seed(0)
+        for step in range(10):
+            blocked = step % 2 == 0
+            cells = random.sample(free_cells if blocked else walls, 2)
+            store.set_cells(cells, blocked)
+            heuristic.set_cells(cells, blocked)
+            expected = pfh.HeuristicStore.build(store.grid, positions)
+            np.testing.assert_array_equal(store.distances, expected.distances)
+            np.testing.assert_array_equal(heuristic.grid != 0, store.grid)
+            for goal in goals:
+                np.testing.assert_array_equal(heuristic[goal].to_array(), expected[goal].to_array())
+            if other_goal in heuristic.cache:
+                np.testing.assert_array_equal(heuristic[other_goal].to_array(),
+                                              pfh.get_distances(heuristic.grid, other_goal))
+
+        # A blocked goal isn't repaired, its field is rebuilt instead
+        field = np.array(store.distances[0])
+        old_grid = store.grid.copy()
+        new_grid = old_grid.copy()
+        new_grid[positions[0]] = True
+        self.assertFalse(pfh.repair_field(field, positions[0], old_grid, new_grid))
+
+    def test_load_heuristic_fingerprint(self):
+        grid, goals, starts = get_scenario('multiagent_planner/scenarios/scenario3.yaml')
+        world_info = WorldInfo(grid.copy(), starts, goals, [])
+        logger = mock.Mock()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            warehouse_yaml = os.path.join(tmp_dir, 'warehouse.yaml')
+            store = pfh.load_heuristic(warehouse_yaml, world_info, logger)
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'warehouse_heuristic.npy')))
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'warehouse_heuristic.json')))
+            with mock.patch.object(pfh.HeuristicStore, 'build') as mock_build:
+                # Same layout loads as is
+                loaded = pfh.load_heuristic(warehouse_yaml, world_info, logger)
+                mock_build.assert_not_called()
+            np.testing.assert_array_equal(loaded.distances, store.distances)
+            np.testing.assert_array_equal(loaded.grid, grid != 0)
+            del loaded
+
+            # After a layout edit only the goals reaching the changed cell are built
+            world_info.world_grid[tuple(np.argwhere(grid == 0)[5])] = 1
+            loaded = pfh.load_heuristic(warehouse_yaml, world_info, logger)
+            expected = pfh.HeuristicStore.build(world_info.world_grid, world_info.get_all_zones())
+            np.testing.assert_array_equal(loaded.distances, expected.distances)
+            self.assertIn('Rebuilt', logger.info.call_args_list[-3][0][0])
+            del loaded
+
+    def test_lazy_heuristic(self):
+        grid, goals, starts = get_scenario('multiagent_planner/scenarios/scenario3.yaml')
+        store = pfh.HeuristicStore.build(grid, goals)
+        heuristic = pfh.LazyHeuristic(grid, store, max_size=2)
+        # Preloaded goals come from the store without touching the cache
+        self.assertIs(heuristic[goals[0]].distances.base, store.distances)
+        self.assertDictEqual(heuristic.stats(),
+                             {'cached': 0, 'hits': 0, 'misses': 0, 'evictions': 0})
+        # Any other open cell is built on first use
+        other_goals = [pos for pos in starts if pos not in goals][:3]
+        true_dists = pfh.build_true_heuristic(grid, other_goals)
+        for goal in other_goals:
+            np.testing.assert_array_equal(heuristic[goal].to_array(), true_dists[goal])
+        self.assertDictEqual(heuristic.stats(),
+                             {'cached': 2, 'hits': 0, 'misses': 3, 'evictions': 1})
+        # Least recently used is evicted first
+        for goal in (other_goals[1], other_goals[0]):
+            np.testing.assert_array_equal(heuristic[goal].to_array(), true_dists[goal])
+        self.assertDictEqual(heuristic.stats(),
+                             {'cached': 2, 'hits': 1, 'misses': 4, 'evictions': 2})
+        self.assertListEqual(list(heuristic.cache), [other_goals[1], other_goals[0]])
+        # Walls and cells outside the grid aren't goals
+        wall = tuple(int(x) for x in np.argwhere(grid > 0)[0])
+        self.assertNotIn(wall, heuristic)
+        self.assertIsNone(heuristic.get((-1, 0)))
+        with self.assertRaises(KeyError):
+            _ = heuristic[wall]
+
     def test_true_heuristic_astar(self):
         grid = np.array([
             [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
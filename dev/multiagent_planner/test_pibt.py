@@ -0,0 +1,68 @@
+"""Unit tests for PIBT."""
+import random
+import unittest
+import numpy as np
+from .multiagent import get_scenario
+from .pathfinding_heuristic import build_true_heuristic
+from .pibt import pibt_step
+
+
+class TestPibt(unittest.TestCase):
+    """Unit tests for pibt module"""
+
+    def assert_valid_step(self, grid, positions, next_positions):
+        self.assertEqual(len(set(next_positions)), len(next_positions))  # No vertex collisions
+        for agent, (pos, next_pos) in enumerate(zip(positions, next_positions)):
+            self.assertLessEqual(abs(pos[0] - next_pos[0]) + abs(pos[1] - next_pos[1]), 1)
+            self.assertEqual(grid[next_pos], 0)
+            # No swapping places
+            if next_pos in positions:
+                other = positions.index(next_pos)
+                if other != agent:
+                    self.assertNotEqual(next_positions[other], pos)
+
+    def run_pibt(self, grid, starts, goals, steps, blocked=set()):
+        true_dists = build_true_heuristic(grid, list(set(goals)))
+        distances = [lambda pos, goal=goal: true_dists[goal][pos] for goal in goals]
+        priorities = [1.0 / (2 + agent) for agent in range(len(starts))]
+        positions = list(starts)
+        for _ in range(steps):
+            next_positions = pibt_step(grid, positions, distances, priorities, blocked, goals)
+            self.assert_valid_step(grid, positions, next_positions)
+            positions = next_positions
+            priorities = [priority + 1 if pos != goal else priority % 1
+                          for priority, pos, goal in zip(priorities, positions, goals)]
+        return positions
+
+    def test_pibt_push_out_of_corridor(self):
+        # Agent 1 waits at its goal in the way of agent 0, so gets pushed aside and comes back
+        grid = np.array([
+            [1, 1, 1, 1, 1, 1, 1],
+            [1, 0, 0, 0, 0, 0, 1],
+            [1, 1, 1, 0, 1, 1, 1],
+            [1, 1, 1, 1, 1, 1, 1]])
+        starts = [(1, 1), (1, 3)]
+        goals = [(1, 5), (1, 3)]
+        self.assertListEqual(self.run_pibt(grid, starts, goals, steps=10), goals)
+
+    def test_pibt_scenarios(self):
+        grid, goals, starts = get_scenario(
+            'multiagent_planner/scenarios/scenario5.yaml')
+        self.assertListEqual(self.run_pibt(grid, starts, goals, steps=60), goals)
+
+    def test_pibt_dense_blocked(self):
+        grid, _, _ = get_scenario('multiagent_planner/scenarios/scenario4.yaml')
+        random.seed(0)
+        free_cells = [(int(row), int(col)) for row, col in np.argwhere(grid == 0)]
+        starts = random.sample(free_cells, 40)
+        goals = random.sample(free_cells, 40)
+        # Cells no agent may enter unless it's their goal
+        blocked = set(random.sample(sorted(set(free_cells) - set(starts)), 5))
+        blocked -= set(goals)
+        positions = self.run_pibt(grid, starts, goals, steps=30, blocked=blocked)
+        for pos, goal in zip(positions, goals):
+            self.assertTrue(pos not in blocked or pos == goal)
+
+
+if __name__ == '__main__':
+    unittest.main()
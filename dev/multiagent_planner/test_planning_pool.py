@@ -0,0 +1,93 @@
+"""Unit tests for the planning pool."""
+import unittest
+import numpy as np
+from .lanes import Lanes, parse_lanes
+from .multiagent import get_scenario
+from .pathfinding_heuristic import HeuristicStore
+from .planning_pool import PlanningPool, plan_path
+from .reservation_table import ReservationTable
+from .traffic_map import TrafficMap
+
+
+class TestPlanningPool(unittest.TestCase):
+    """Unit tests for PlanningPool"""
+
+    def test_plan_paths_match_serial(self):
+        grid, goals, starts = get_scenario('multiagent_planner/scenarios/scenario3.yaml')
+        heuristic = HeuristicStore.build(grid, goals, processes=1)
+        reservations = ReservationTable(grid.shape, horizon=30, t_start=1)
+        reservations.reserve_path([starts[0], goals[0]], t_start=2, buffer=1, owner=0)
+        # Goals outside the heuristic are built by the workers
+        requests = list(zip(starts, goals)) + [(goals[0], starts[0])]
+        with PlanningPool(grid, heuristic, reservations.horizon, processes=2) as pool:
+            paths = pool.plan_paths(requests, reservations, set(), max_steps=20, t_start=2)
+        self.assertEqual(len(paths), len(requests))
+        self.assertTrue(all(paths))
+        for (pos_a, pos_b), path in zip(requests, paths):
+            dists = heuristic[pos_b] if pos_b in heuristic else HeuristicStore.build(
+                grid, [pos_b], processes=1)[pos_b]
+            self.assertListEqual(path, plan_path(grid, pos_a, pos_b, reservations, set(),
+                                                 dists, max_steps=20, t_start=2))
+
+    def test_path_conflicts(self):
+        grid = np.zeros((5, 5))
+        heuristic = HeuristicStore.build(grid, [(0, 4)], processes=1)
+        reservations = ReservationTable(grid.shape, horizon=10, t_start=0)
+        with PlanningPool(grid, heuristic, reservations.horizon, processes=1) as pool:
+            [path] = pool.plan_paths([((0, 0), (0, 4))], reservations, set(), t_start=1)
+            self.assertEqual(len(path), 5)
+            self.assertFalse(pool.path_conflicts(path, 1, reservations))
+            # Reservations of the ends don't matter
+            reservations.reserve_path([(0, 0), (0, 4)], t_start=1, owner=0)
+            self.assertFalse(pool.path_conflicts(path, 1, reservations))
+            # Committing a path crossing it does
+            reservations.reserve_path([(1, 2), (0, 2), (0, 2)], t_start=2, owner=1)
+            self.assertTrue(pool.path_conflicts(path, 1, reservations))
+            # As does moving the reservation window
+            reservations.release_owner(1)
+            self.assertFalse(pool.path_conflicts(path, 1, reservations))
+            reservations.advance()
+            self.assertTrue(pool.path_conflicts(path, 1, reservations))
+
+    def test_plan_paths_timeout(self):
+        grid, goals, starts = get_scenario('multiagent_planner/scenarios/scenario3.yaml')
+        heuristic = HeuristicStore.build(grid, goals, processes=1)
+        reservations = ReservationTable(grid.shape, horizon=30, t_start=1)
+        requests = list(zip(starts, goals))
+        with PlanningPool(grid, heuristic, reservations.horizon, processes=1) as pool:
+            workers = pool.pool
+            paths = pool.plan_paths(requests, reservations, set(), max_steps=20, timeout=0)
+            self.assertListEqual(paths, [None] * len(requests))
+            # Workers are restarted, so the next batch doesn't wait for the stale one
+            self.assertIsNot(pool.pool, workers)
+            paths = pool.plan_paths(requests, reservations, set(), max_steps=20)
+            self.assertTrue(all(paths))
+
+    def test_plan_path_traffic(self):
+        grid = np.zeros((3, 7))
+        heuristic = HeuristicStore.build(grid, [(1, 6)], processes=1)
+        traffic = TrafficMap(grid.shape, weight=0.1)
+        for _ in range(10):
+            traffic.add_path([(1, col) for col in range(7)])
+        traffic.advance()
+        path = plan_path(grid, (1, 0), (1, 6), set(), set(), heuristic[(1, 6)], traffic=traffic)
+        self.assertEqual(len(path), 9)  # Around the busy middle row
+        with self.assertRaises(ValueError):
+            plan_path(grid, (1, 0), (1, 6), set(), set(), heuristic[(1, 6)], engine='sipp',
+                      traffic=traffic)
+
+    def test_plan_path_lanes(self):
+        grid = np.zeros((3, 7))
+        lanes = Lanes(parse_lanes(['.......', '.<<<<<.', '.......'], grid.shape), cost=0)
+        heuristic = HeuristicStore.build(grid, [(1, 6)], processes=1,
+                                         blocked_moves=lanes.blocked_moves)
+        path = plan_path(grid, (1, 0), (1, 6), set(), set(), heuristic[(1, 6)], lanes=lanes)
+        self.assertEqual(len(path), 9)  # Around the middle row's lane
+        self.assertEqual(lanes.count_against(path), 0)
+        with self.assertRaises(ValueError):
+            plan_path(grid, (1, 0), (1, 6), set(), set(), heuristic[(1, 6)], engine='sipp',
+                      lanes=lanes)
+
+
+if __name__ == '__main__':
+    unittest.main()
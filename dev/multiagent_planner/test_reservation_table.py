@@ -0,0 +1,101 @@
+"""Unit tests for reservation table."""
+import unittest
+from . import pathfinding
+from .multiagent import get_scenario
+from .reservation_table import ReservationTable
+
+
+class TestReservationTable(unittest.TestCase):
+    """Unit tests for ReservationTable"""
+
+    def test_reserve_release(self):
+        table = ReservationTable((5, 5), horizon=10)
+        self.assertTrue(table.reserve(1, 2, 3))
+        self.assertTrue(table.reserve(1, 2, 3))
+        self.assertIn((1, 2, 3), table)
+        self.assertNotIn((1, 2, 4), table)
+        self.assertEqual(len(table), 2)
+        # Overlapping reservations are counted, so one release keeps the cell reserved
+        self.assertTrue(table.release(1, 2, 3))
+        self.assertIn((1, 2, 3), table)
+        self.assertTrue(table.release(1, 2, 3))
+        self.assertNotIn((1, 2, 3), table)
+        self.assertFalse(table.release(1, 2, 3))
+        self.assertEqual(len(table), 0)
+
+    def test_window(self):
+        table = ReservationTable((5, 5), horizon=4, t_start=-1)
+        self.assertFalse(table.reserve(0, 0, 3))  # Past end of window
+        self.assertTrue(table.reserve(0, 0, -1))
+        table.add((0, 1, 2))
+        self.assertIn((0, 0, -1), table)
+        # Advancing drops the times before the new start, and frees up slots for later times
+        table.advance(1)
+        self.assertNotIn((0, 0, -1), table)
+        self.assertIn((0, 1, 2), table)
+        self.assertNotIn((0, 0, 3), table)
+        self.assertTrue(table.reserve(0, 0, 3))
+        self.assertEqual(len(table), 2)
+        table.advance(10)
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.t_start, 10)
+
+    def test_reserve_path(self):
+        table = ReservationTable((5, 5), horizon=10, t_start=-1)
+        path = [(0, 0), (0, 1), (0, 1), (1, 1)]
+        table.reserve_path(path, t_start=0, buffer=1)
+        expected = set()
+        for t_step, pos in enumerate(path):
+            for t_offset in (-1, 0, 1):
+                expected.add((pos[0], pos[1], t_step + t_offset))
+        for row in range(5):
+            for col in range(5):
+                for t in range(-1, 9):
+                    self.assertEqual((row, col, t) in table, (row, col, t) in expected)
+        other_path = [(0, 1), (0, 2)]
+        table.reserve_path(other_path, t_start=1)
+        table.release_path(path, t_start=0, buffer=1)
+        self.assertEqual(len(table), 2)
+        self.assertIn((0, 1, 1), table)
+        self.assertIn((0, 2, 2), table)
+
+    def test_reserve_path_owner(self):
+        table = ReservationTable((5, 5), horizon=4, t_start=0)
+        table.reserve_path([(0, 0), (0, 1), (0, 2), (0, 3), (0, 4)], owner='a')
+        self.assertEqual(len(table), 4)  # Last step is past the window
+        self.assertEqual(table.get_owner_path('a')[1], 0)
+        # Reserving again for the same owner replaces its path
+        table.reserve_path([(1, 0), (1, 1), (1, 1), (1, 1)], t_start=1, owner='a')
+        self.assertEqual(len(table), 3)
+        self.assertNotIn((0, 1, 1), table)
+        # Releasing after the window moved only releases what was reserved
+        table.advance(2)
+        self.assertTrue(table.reserve(1, 1, 4))
+        self.assertTrue(table.release_owner('a'))
+        self.assertFalse(table.release_owner('a'))
+        self.assertIsNone(table.get_owner_path('a'))
+        self.assertIn((1, 1, 4), table)
+        self.assertEqual(len(table), 1)
+        # Replaying a path reserved by another table up to its window end
+        table.reserve_path([(2, 0), (2, 1), (2, 2)], t_start=2, owner='b', t_end=4)
+        self.assertEqual(len(table), 3)
+        self.assertNotIn((2, 2, 4), table)
+        self.assertEqual(table.owners['b'][3], 4)
+
+    def test_st_astar_with_reservation_table(self):
+        grid, goals, starts = get_scenario(
+            'multiagent_planner/scenarios/scenario3.yaml')
+        dynamic_obstacles = set([(1, 3, 2), (2, 5, 5), (2, 6, 6), (4, 8, 10)])
+        table = ReservationTable(grid.shape, horizon=40)
+        for obstacle in dynamic_obstacles:
+            table.add(obstacle)
+        expected_path = pathfinding.st_astar(
+            grid, starts[0], goals[0], dynamic_obstacles, end_fast=True)
+        self.assertListEqual(pathfinding.st_astar(
+            grid, starts[0], goals[0], table, end_fast=True), expected_path)
+        self.assertListEqual(pathfinding.st_astar_flat(
+            grid, starts[0], goals[0], table, end_fast=True), expected_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""Unit tests for safe interval path planning."""
+import random
+import unittest
+import numpy as np
+from . import pathfinding
+from .multiagent import get_scenario
+from .reservation_table import ReservationTable
+from .sipp import get_safe_intervals, sipp
+
+
+class TestSipp(unittest.TestCase):
+    """Unit tests for sipp module"""
+
+    def assert_valid_path(self, path, pos_a, pos_b, dynamic_obstacles, t_start=0):
+        self.assertEqual(path[0], pos_a)
+        self.assertEqual(path[-1], pos_b)
+        for t_step, (pos, next_pos) in enumerate(zip(path, path[1:])):
+            self.assertLessEqual(abs(pos[0] - next_pos[0]) + abs(pos[1] - next_pos[1]), 1)
+            self.assertNotIn((next_pos[0], next_pos[1], t_start + t_step + 1), dynamic_obstacles)
+
+    def test_get_safe_intervals(self):
+        self.assertListEqual(get_safe_intervals([], 0, 10), [(0, 10)])
+        self.assertListEqual(get_safe_intervals([0, 3, 4, 7, 12], 0, 10),
+                             [(1, 2), (5, 6), (8, 10)])
+        self.assertListEqual(get_safe_intervals([2, 10], 2, 10), [(3, 9)])
+
+    def test_sipp_no_obstacles(self):
+        grid, goals, starts = get_scenario(
+            'multiagent_planner/scenarios/scenario1.yaml')
+        expected_path = [(1, 4), (1, 3), (1, 2), (1, 1), (2, 1),
+                         (3, 1), (4, 1), (4, 2), (4, 3), (3, 3), (3, 4)]
+        self.assertEqual(sipp(grid, starts[0], goals[0], end_fast=True), expected_path)
+        # Without end_fast wait at the goal till max_time
+        self.assertEqual(sipp(grid, starts[0], goals[0], max_time=12),
+                         expected_path + [(3, 4), (3, 4)])
+        self.assertEqual(sipp(grid, starts[0], goals[0], t_start=123, end_fast=True),
+                         expected_path)
+
+    def test_sipp_matches_st_astar_validity(self):
+        grid, _, _ = get_scenario(
+            'multiagent_planner/scenarios/scenario3.yaml')
+        random.seed(0)
+        free_cells = [(int(row), int(col)) for row, col in np.argwhere(grid == 0)]
+        cells_visited, cells_visited_sipp = 0, 0
+        for _ in range(30):
+            table = ReservationTable(grid.shape, horizon=40, t_start=-1)
+            # Other robots crossing the grid, reserved with a step of buffer like the allocator
+            for _ in range(3):
+                other_a, other_b = random.sample(free_cells, 2)
+                table.reserve_path(pathfinding.st_astar(
+                    grid, other_a, other_b, table, end_fast=True, max_time=35),
+                    t_start=0, buffer=1)
+            pos_a, pos_b = random.sample(free_cells, 2)
+            for kwargs in [dict(end_fast=True, validate_ends=False), dict(max_time=30)]:
+                stats, stats_sipp = {}, {}
+                path = pathfinding.st_astar(
+                    grid, pos_a, pos_b, table, max_cells=100000, stats=stats, **kwargs)
+                path_sipp = sipp(grid, pos_a, pos_b, table, max_cells=100000,
+                                 stats=stats_sipp, **kwargs)
+                self.assertEqual(bool(path), bool(path_sipp))
+                if not path:
+                    continue
+                # Arrives no later than st_astar, without running into any reservations
+                self.assertLessEqual(len(path_sipp), len(path))
+                if kwargs.get('validate_ends', True):
+                    self.assert_valid_path(path_sipp, pos_a, pos_b, table)
+                cells_visited += stats['cells_visited']
+                cells_visited_sipp += stats_sipp['cells_visited']
+        self.assertLess(cells_visited_sipp, cells_visited)
+
+    def test_sipp_long_wait(self):
+        # Corridor where the exit is held for a long time, st_astar searches every time layer
+        grid = np.ones([3, 12])
+        grid[1, 1:11] = 0
+        pos_a, pos_b = (1, 1), (1, 10)
+        dynamic_obstacles = set((1, 9, t) for t in range(150))
+        stats, stats_sipp = {}, {}
+        path = pathfinding.st_astar(grid, pos_a, pos_b, dynamic_obstacles, max_time=200,
+                                    end_fast=True, max_cells=100000, stats=stats)
+        path_sipp = sipp(grid, pos_a, pos_b, dynamic_obstacles, max_time=200,
+                         end_fast=True, stats=stats_sipp)
+        self.assertEqual(len(path_sipp), len(path))
+        self.assert_valid_path(path_sipp, pos_a, pos_b, dynamic_obstacles)
+        self.assertLess(stats_sipp['cells_visited'] * 50, stats['cells_visited'])
+
+
+    def test_sipp_partial(self):
+        grid = np.zeros((3, 5))
+        # Column 3 is always taken, so (0, 4) can't be reached
+        wall = set((row, 3, t) for row in range(3) for t in range(30))
+        heuristic = pathfinding.get_manhattan_heuristic((0, 4))
+        stats = {}
+        self.assertListEqual(sipp(grid, (0, 0), (0, 4), wall, end_fast=True,
+                                  heuristic=heuristic), [])
+        path = sipp(grid, (0, 0), (0, 4), wall | {(0, 2, 5)}, end_fast=True,
+                    heuristic=heuristic, partial=True, stats=stats)
+        self.assertTrue(stats['partial'])
+        # Ends in the same place as st_astar, only once nothing is reserved there later
+        self.assertEqual(len(path), len(pathfinding.st_astar(
+            grid, (0, 0), (0, 4), wall | {(0, 2, 5)}, end_fast=True, heuristic=heuristic,
+            partial=True)))
+        self.assertEqual(path[-1], (0, 2))
+        self.assertListEqual(sipp(grid, (0, 0), (0, 4), wall | {(0, 2, 25)}, end_fast=True,
+                                  heuristic=heuristic, partial=True), [(0, 0), (0, 1)])
+        stats = {}
+        self.assertListEqual(sipp(grid, (0, 0), (0, 4), end_fast=True, time_budget=0,
+                                  partial=True, stats=stats), [])
+        self.assertTrue(stats['timed_out'])
+
+if __name__ == '__main__':
+    unittest.main()
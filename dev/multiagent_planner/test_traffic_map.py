@@ -0,0 +1,56 @@
+"""Unit tests for the traffic map."""
+import unittest
+import numpy as np
+from .flat_grid import FlatGrid
+from .traffic_map import MOVES, TrafficMap
+
+
+class TestTrafficMap(unittest.TestCase):
+    """Unit tests for TrafficMap"""
+
+    def test_add_path_and_advance(self):
+        traffic = TrafficMap((3, 4), decay=0.5, weight=2.0)
+        # Right twice with a wait in between
+        traffic.add_path([(1, 0), (1, 1), (1, 1), (1, 2)])
+        self.assertEqual(traffic.occupancy[1].tolist(), [1, 2, 1, 0])
+        right = MOVES.index((0, 1)) - 1
+        self.assertEqual(traffic.flow[right, 1].tolist(), [1, 1, 0, 0])
+        self.assertEqual(traffic.flow.sum(), 2)
+        # Costs only change on advance
+        self.assertEqual(traffic.costs.sum(), 0)
+        traffic.advance(0)
+        costs = traffic.get_move_costs((1, 1))
+        self.assertEqual(costs[MOVES.index((0, 0))], 2.0 * 2)  # Waiting in a busy cell
+        self.assertEqual(costs[MOVES.index((0, 1))], 2.0 * 1)  # Into (1, 2)
+        # Back into (1, 0) against the traffic that left it this way
+        self.assertEqual(costs[MOVES.index((0, -1))], 2.0 * (1 + 1))
+        self.assertEqual(costs[MOVES.index((-1, 0))], 0)
+        traffic.advance(2)
+        self.assertEqual(traffic.t, 2)
+        self.assertEqual(traffic.total(), 4 * 0.25)
+        self.assertEqual(traffic.get_move_costs((1, 1))[0], 2.0 * 2 * 0.25)
+
+    def test_successor_costs(self):
+        grid = np.zeros((3, 4))
+        grid[0, 1] = 1
+        flat_grid = FlatGrid(grid)
+        traffic = TrafficMap(grid.shape, weight=1.0)
+        traffic.add_path([(1, 0), (1, 1), (2, 1), (2, 2)])
+        traffic.advance()
+        successor_costs = traffic.get_successor_costs(flat_grid)
+        self.assertIs(traffic.get_successor_costs(flat_grid), successor_costs)
+        for cell, successors in enumerate(flat_grid.successors):
+            self.assertEqual(list(successor_costs[cell]), successors)
+            pos = flat_grid.positions[cell]
+            costs = traffic.get_move_costs(pos)
+            for successor in successors:
+                next_pos = flat_grid.positions[successor]
+                move = MOVES.index((next_pos[0] - pos[0], next_pos[1] - pos[1]))
+                self.assertEqual(successor_costs[cell][successor], costs[move])
+        # Rebuilt after the next advance
+        traffic.advance()
+        self.assertIsNot(traffic.get_successor_costs(flat_grid), successor_costs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""Congestion-aware traffic costs, spreading paths across aisles.
+
+Every move costs the same to the space-time searches, so every robot takes the same shortest
+aisles and the reservations turn them into queues. A TrafficMap keeps a rolling count of the
+steps committed paths recently spent in each cell, and how often they took each edge in each
+direction, decaying every world step. The searches add it to their g-cost: entering a cell
+costs weight times its occupancy plus weight times the traffic that took the same edge the
+other way (head on in an aisle), and waiting costs weight times the occupancy of the cell.
+Costs are never negative, so true distances stay an admissible heuristic.
+"""
+import os
+import numpy as np
+from .flat_grid import DIRECTIONS, FlatGrid
+
+# Fraction of the traffic kept each world step
+TRAFFIC_DECAY = float(os.getenv("TRAFFIC_DECAY", default="0.95"))
+# Extra cost per unit of occupancy of a cell, or of the same edge the other way, in steps
+TRAFFIC_WEIGHT = float(os.getenv("TRAFFIC_WEIGHT", default="0.1"))
+
+# Moves in st_astar successor order, waiting in place first then DIRECTIONS
+MOVES = [(0, 0)] + DIRECTIONS
+# Index in DIRECTIONS of each (d_row + 1) * 3 + (d_col + 1) step
+_DIRECTION_INDEX = np.full(9, -1, dtype=np.intp)
+for _direction, (_d_row, _d_col) in enumerate(DIRECTIONS):
+    _DIRECTION_INDEX[(_d_row + 1) * 3 + _d_col + 1] = _direction
+
+
+class TrafficMap:
+    """Decaying per-cell occupancy and per-edge flow of committed paths, as extra move costs
+    for st_astar and st_astar_flat.
+
+    Paths added count towards the costs searches see from the next advance, so costs stay
+    the same within a world step and are only rebuilt once per step."""
+
+    def __init__(self, grid_shape: tuple[int, int], decay: float = TRAFFIC_DECAY,
+                 weight: float = TRAFFIC_WEIGHT, t_start: int = 0) -> None:
+        self.rows, self.cols = grid_shape
+        self.decay = decay
+        self.weight = weight
+        self.t = t_start
+        # occupancy[row, col] steps paths spent in the cell, and flow[d, row, col] moves out of
+        # it in direction d, both decayed each step
+        self.occupancy = np.zeros(grid_shape)
+        self.flow = np.zeros((len(DIRECTIONS),) + tuple(grid_shape))
+        # costs[m, row, col] extra cost of move m of MOVES from the cell, as of the last
+        # advance, and per flat grid the same costs as dicts by successor cell
+        self.costs = np.zeros((len(MOVES),) + tuple(grid_shape))
+        self._successor_costs: dict[int, tuple[FlatGrid, list[dict[int, float]]]] = {}
+
+    def add_path(self, path: list[tuple[int, int]]):
+        """Count the steps and moves of a committed path."""
+        if not path:
+            return
+        cells = np.asarray(path, dtype=np.intp)
+        np.add.at(self.occupancy, (cells[:, 0], cells[:, 1]), 1)
+        steps = cells[1:] - cells[:-1]
+        moves = np.abs(steps).sum(axis=1) == 1  # Not waits
+        directions = _DIRECTION_INDEX[(steps[moves, 0] + 1) * 3 + steps[moves, 1] + 1]
+        np.add.at(self.flow, (directions, cells[:-1][moves, 0], cells[:-1][moves, 1]), 1)
+
+    def advance(self, steps: int = 1):
+        """Decay the traffic by the world steps since the last advance, and rebuild the costs
+        with the paths added since."""
+        if steps > 0:
+            self.occupancy *= self.decay ** steps
+            self.flow *= self.decay ** steps
+            self.t += steps
+        # Padded so moves off the grid read zeros, they're never taken
+        occupancy = np.pad(self.occupancy, 1)
+        flow = np.pad(self.flow, ((0, 0), (1, 1), (1, 1)))
+        self.costs[0] = self.occupancy
+        for direction, (d_row, d_col) in enumerate(DIRECTIONS):
+            rows = slice(1 + d_row, 1 + d_row + self.rows)
+            cols = slice(1 + d_col, 1 + d_col + self.cols)
+            # Entering the neighbor, against what left it back towards this cell
+            opposite = DIRECTIONS.index((-d_row, -d_col))
+            self.costs[1 + direction] = occupancy[rows, cols] + flow[opposite, rows, cols]
+        self.costs *= self.weight
+        self._successor_costs.clear()
+
+    def get_move_costs(self, pos: tuple[int, int]) -> list[float]:
+        """Extra costs of the moves from pos, in MOVES order."""
+        return self.costs[:, pos[0], pos[1]].tolist()
+
+    def get_successor_costs(self, flat_grid: FlatGrid) -> list[dict[int, float]]:
+        """Extra cost of each move in flat_grid.successors, by successor cell, built once per
+        advance and flat grid."""
+        cached = self._successor_costs.get(id(flat_grid))
+        if cached is not None and cached[0] is flat_grid:
+            return cached[1]
+        costs = self.costs.reshape(len(MOVES), -1).tolist()
+        successor_costs = []
+        for cell, neighbors in enumerate(flat_grid.neighbors):
+            cell_costs = {cell: costs[0][cell]}
+            for direction, neighbor in enumerate(neighbors):
+                if neighbor >= 0:
+                    cell_costs[neighbor] = costs[1 + direction][cell]
+            successor_costs.append(cell_costs)
+        self._successor_costs[id(flat_grid)] = (flat_grid, successor_costs)
+        return successor_costs
+
+    def total(self) -> float:
+        """Total occupancy, steps of recent paths after decay."""
+        return float(self.occupancy.sum())
+
@@ -0,0 +1,631 @@
+"""Contains the Path Planner the Robot Allocator plans robot paths with
+
+Path Planner:
+ - Keep the future paths of all robots reserved as dynamic obstacles, advancing with world time
+ - Generate paths for robots around each other, with the path engine and its helpers (planning
+   pool or service, path cache, first-move tables, traffic costs and lanes)
+ - Replan paths in windowed mode, step robots in pibt mode and shorten paths with LNS
+ - Block and unblock grid cells at runtime
+"""
+import os
+import time
+from typing import Optional, Union
+import numpy as np
+import redis
+import multiagent_planner.pathfinding as pf
+from multiagent_planner.pathfinding import Position, Path
+from multiagent_planner.pathfinding_heuristic import HeuristicDict, build_true_heuristic
+from multiagent_planner.first_move import FirstMoveTable
+from multiagent_planner.lanes import Lanes
+from multiagent_planner.lns import LNSOptimizer
+from multiagent_planner.path_cache import PathCache
+from multiagent_planner.reservation_table import ReservationTable
+from multiagent_planner.pibt import pibt_step
+from multiagent_planner.planning_pool import (LANE_ENGINES, PATH_ENGINES, TRAFFIC_ENGINES,
+                                              PlanningPool, PlanRequest, plan_path)
+from multiagent_planner.traffic_map import TrafficMap
+from planning_service import PlanningServiceClient
+from robot import Robot, RobotId
+from warehouses.warehouse_loader import WorldInfo
+
+# Max number of steps to search with A*, should be ~worst case distance in grid
+MAX_PATH_STEPS = int(os.getenv("MAX_PATH_STEPS", default="500"))
+# Space-time search engine used by generate_path, one of PATH_ENGINES
+PATH_ENGINE = os.getenv("PATH_ENGINE", default="st_astar_flat")
+# Processes planning job paths in parallel each update, 0 plans them one at a time in the
+# allocator process. Not used in pibt mode.
+PLANNING_PROCESSES = int(os.getenv("PLANNING_PROCESSES", default="0"))
+# Plan job paths with the planning_service workers over redis instead, overrides
+# PLANNING_PROCESSES. Not used in pibt mode.
+PLANNING_SERVICE = bool(int(os.getenv("PLANNING_SERVICE", default="0")))
+# Keep free-space paths between zones (up to PATH_CACHE_SIZE), repairing them around other
+# robots before a full search. Not used in windowed or pibt mode.
+PATH_CACHE = bool(int(os.getenv("PATH_CACHE", default="0")))
+# Follow first-move tables built from the heuristic to zones, searching only when that path
+# runs into another robot. Not used in windowed or pibt mode.
+FIRST_MOVE_TABLES = bool(int(os.getenv("FIRST_MOVE_TABLES", default="0")))
+# Shorten committed paths with Large Neighborhood Search at the end of each update, for up to
+# LNS_TIME_SEC and half the time left. Not used in windowed or pibt mode.
+LNS = bool(int(os.getenv("LNS", default="0")))
+LNS_TIME_SEC = float(os.getenv("LNS_TIME_SEC", default="0.050"))
+# Add congestion costs from the recent traffic of committed paths to path searches (see
+# TrafficMap for TRAFFIC_DECAY and TRAFFIC_WEIGHT), with the TRAFFIC_ENGINES. Not used in
+# windowed or pibt mode, nor by the planning pool or service.
+TRAFFIC = bool(int(os.getenv("TRAFFIC", default="0")))
+# Keep path searches to one-way lanes (see Lanes for LANE_COST, 0 forbids moves against
+# them), from the warehouse yaml's lanes layer or generated along its two-wide aisles, with the
+# LANE_ENGINES. The heuristic is built along the lanes too. Only in paths mode, and not with the
+# path cache, first-move tables, LNS, nor the planning pool or service.
+LANES = bool(int(os.getenv("LANES", default="0")))
+# How robots are moved, 'paths' plans a full path per job leg with the path engine,
+# 'windowed' plans full paths but only avoids and reserves other robots for the next
+# WINDOW_STEPS, replanning every REPLAN_STEPS, and 'pibt' plans one step for every robot
+# each update with PIBT towards its job goal
+PLANNER_MODE = os.getenv("PLANNER_MODE", default="paths")
+PLANNER_MODES = ('paths', 'windowed', 'pibt')
+# Steps of each path checked and reserved against other robots in windowed mode
+WINDOW_STEPS = int(os.getenv("WINDOW_STEPS", default="20"))
+# Steps between replanning robot paths in windowed mode, at most half of WINDOW_STEPS so
+# every step a robot takes was checked against the other robots' windows
+REPLAN_STEPS = int(os.getenv("REPLAN_STEPS", default="5"))
+
+
+class PathPlanner:
+    """Path Planner, plans and reserves the paths of robots, the robot allocator builds on it"""
+
+    def __init__(self, logger, redis_con: redis.Redis, robots: list[Robot],
+                 world_sim_t: Optional[int],
+                 world_info: WorldInfo,
+                 heuristic_dict: HeuristicDict,
+                 path_engine: str = PATH_ENGINE,
+                 planner_mode: str = PLANNER_MODE,
+                 window_steps: int = WINDOW_STEPS,
+                 replan_steps: int = REPLAN_STEPS,
+                 planning_processes: int = PLANNING_PROCESSES,
+                 planning_service: bool = PLANNING_SERVICE,
+                 path_cache: bool = PATH_CACHE,
+                 first_move_tables: bool = FIRST_MOVE_TABLES,
+                 lns: bool = LNS,
+                 lns_time_sec: float = LNS_TIME_SEC,
+                 traffic: bool = TRAFFIC,
+                 lanes: bool = LANES,
+                 world_grid: Optional[np.ndarray] = None) -> None:
+        self.logger = logger
+
+        # Redis connection, for the planning service
+        self.redis_db = redis_con
+
+        # Robots and the world time step they were last updated at, None if not seen yet
+        self.robots = robots
+        self.world_sim_t = world_sim_t
+
+        # Load grid positions all in x,y coordinates
+        self.base_world_grid = world_info.world_grid  # As loaded, before any grid changes
+        # The grid with changes already applied if given, ex. carried over a restart along with
+        # the heuristic repaired for them
+        self.world_grid = world_info.world_grid if world_grid is None else world_grid
+        self.robot_home_zones = world_info.robot_home_zones
+        self.item_load_zones = world_info.item_load_zones
+        self.station_zones = world_info.station_zones
+
+        self.heuristic_dict = heuristic_dict
+
+        self.max_steps = MAX_PATH_STEPS  # hard-coded search tile limit for pathing
+        if path_engine not in PATH_ENGINES:
+            raise ValueError(
+                f'Unknown path engine {path_engine}, expected one of {list(PATH_ENGINES)}')
+        self.path_engine = path_engine
+        if planner_mode not in PLANNER_MODES:
+            raise ValueError(
+                f'Unknown planner mode {planner_mode}, expected one of {PLANNER_MODES}')
+        self.planner_mode = planner_mode
+        # In windowed mode, how many steps of each path are reserved, None for all of them
+        self.window: Optional[int] = None
+        self.replan_steps = replan_steps
+        if planner_mode == 'windowed':
+            if not 1 <= replan_steps <= window_steps // 2:
+                raise ValueError(f'Replan steps {replan_steps} must be between 1 and half '
+                                 f'the window steps {window_steps}')
+            self.window = window_steps
+        # In pibt mode, where each robot is headed and its priority, which grows every update
+        # it is away from its goal. Robots without a goal stay where they were first seen.
+        self.robot_goals: dict[RobotId, Position] = {}
+        self.robot_priorities: dict[RobotId, float] = {}
+
+        # Using world info set up static dynamic obstacles
+        self.static_obstacles = self.get_all_static_obstacles()
+        # Free-space paths between zones, repaired around other robots by generate_path
+        self.path_cache: Optional[PathCache] = None
+        if path_cache and planner_mode == 'paths':
+            self.path_cache = PathCache(self.world_grid, self.static_obstacles)
+        # First-move tables to zones, built on first use, giving free-space paths there
+        # without search. Other zones are walls in them, as they are static obstacles.
+        self.first_moves: Optional[dict[Position, FirstMoveTable]] = None
+        if first_move_tables and planner_mode == 'paths':
+            self.first_moves = {}
+        # Replans neighborhoods of committed paths in spare time, keeping shorter ones
+        self.lns: Optional[LNSOptimizer] = None
+        self.lns_time_sec = lns_time_sec
+        if lns and planner_mode == 'paths':
+            self.lns = LNSOptimizer(engine=path_engine, max_steps=self.max_steps)
+        # Paths the last optimize_paths replaced by robot, put back if the update is reverted
+        self.lns_replaced_paths: dict[RobotId, Path] = {}
+        # One-way lanes generate_path searches follow. Paths from anything else don't know of
+        # them, so lanes can't be used with it.
+        self.lanes: Optional[Lanes] = None
+        if lanes and planner_mode == 'paths':
+            if path_engine not in LANE_ENGINES:
+                raise ValueError(f'Path engine {path_engine} does not follow lanes, expected '
+                                 f'one of {LANE_ENGINES}')
+            if path_cache or first_move_tables or lns or planning_service or planning_processes:
+                raise ValueError('Lanes are only followed by path searches, not by the path '
+                                 'cache, first-move tables, LNS or planning processes')
+            self.lanes = Lanes.from_world_info(world_info)
+
+        # Latest dynamic obstacles, synced on update(), updated with every new path in that cycle
+        self.latest_dynamic_obstacles: Optional[ReservationTable] = None
+        # Reservation table reused for dynamic obstacles across updates, in world time with the
+        # window starting at the current world time, and each robot's future path reserved
+        # under its robot id. Covers the longest path (max_steps), or just the window in
+        # windowed mode, plus a step of spacing.
+        self.reservations = ReservationTable(
+            self.world_grid.shape, horizon=(self.window or self.max_steps) + 3,
+            t_start=self.get_world_t())
+        # Recent traffic of committed paths, as congestion costs for generate_path
+        self.traffic: Optional[TrafficMap] = None
+        if traffic and planner_mode == 'paths':
+            if path_engine not in TRAFFIC_ENGINES:
+                raise ValueError(f'Path engine {path_engine} has no traffic costs, expected '
+                                 f'one of {TRAFFIC_ENGINES}')
+            self.traffic = TrafficMap(self.world_grid.shape, t_start=self.get_world_t())
+        # Plans the paths jobs will need each update in parallel, against a snapshot of the
+        # reservations, planned_paths holds them by (pos_a, pos_b) until generate_path
+        # checks them against the paths set since and uses or replans them.
+        self.planning_processes = planning_processes
+        self.planning_service = planning_service
+        self.plan_in_parallel = planner_mode != 'pibt' and (
+            planning_service or planning_processes > 0)
+        self.planning_pool: Optional[Union[PlanningPool, PlanningServiceClient]] = None
+        self.start_planning_pool()
+        self.planned_paths: dict[PlanRequest, Path] = {}
+        # Planned paths used as is, or replanned as they ran into paths set since, this update
+        self.planning_stats = {'used': 0, 'replanned': 0}
+        # While update processes jobs, the time their path searches have to give up by, and
+        # the best partial paths of searches that didn't make it by (pos_a, pos_b)
+        self.jobs_deadline: Optional[float] = None
+        self.partial_paths: dict[PlanRequest, Path] = {}
+
+    def set_cells_blocked(self, cells: list[Position], blocked: bool = True) -> list[Robot]:
+        """Block or unblock grid cells at runtime, repairing the heuristic in place and
+        stopping robots before any newly blocked cell on their path, so their jobs replan.
+
+        Zones and cells a robot is on are never blocked, as searches from or to a wall fail,
+        those cells are skipped with a warning.
+
+        Returns:
+            list[Robot]: robots whose future path was cut short
+        """
+        cells = [Position((int(row), int(col))) for row, col in cells]
+        if blocked:
+            occupied = self.static_obstacles.union(tuple(robot.pos) for robot in self.robots)
+            skipped = [cell for cell in cells if cell in occupied]
+            if skipped:
+                self.logger.warning(f'Not blocking zones or robot cells {skipped}')
+                cells = [cell for cell in cells if cell not in occupied]
+        if not cells:
+            return []
+        t_start = time.perf_counter()
+        # New grid so searches don't reuse flat grids or heuristics of the old one
+        self.world_grid = self.world_grid.copy()
+        for cell in cells:
+            self.world_grid[cell] = 1 if blocked else 0
+        if hasattr(self.heuristic_dict, 'set_cells'):
+            repaired = self.heuristic_dict.set_cells(cells, blocked)
+        else:
+            # Plain heuristic dict, rebuilt for the new grid
+            self.heuristic_dict = build_true_heuristic(
+                self.world_grid, list(self.heuristic_dict),
+                blocked_moves=self.lanes.blocked_moves if self.lanes is not None else None)
+            repaired = len(self.heuristic_dict)
+        if self.path_cache is not None:
+            self.path_cache.set_cells(self.world_grid, cells, blocked)
+        if self.first_moves is not None:
+            self.first_moves.clear()
+
+        stopped_robots = []
+        if blocked:
+            blocked_cells = set(cells)
+            for robot in self.robots:
+                for idx, pos in enumerate(robot.future_path):
+                    if tuple(pos) in blocked_cells:
+                        robot.set_path(robot.future_path[:idx])
+                        if self.planner_mode != 'pibt':
+                            self.add_path_as_obstacle(self.reservations, robot)
+                        stopped_robots.append(robot)
+                        break
+        # Pool workers and the service client use the old grid, restarted when next used
+        self.close()
+        self.logger.info(f'{"Blocked" if blocked else "Unblocked"} {len(cells)} cells, '
+                         f'repaired {repaired} heuristic fields in '
+                         f'{(time.perf_counter() - t_start)*1000:.3f} ms, '
+                         f'stopped {len(stopped_robots)} robots')
+        return stopped_robots
+
+    def get_first_move_table(self, goal: Position) -> FirstMoveTable:
+        """First-move table to a zone, built on first use with the other zones as walls."""
+        table = self.first_moves.get(goal)
+        if table is None:
+            zones = np.zeros(self.world_grid.shape, dtype=bool)
+            zones[tuple(np.array(list(self.static_obstacles)).T)] = True
+            table = self.first_moves[goal] = FirstMoveTable.build(goal, self.world_grid, zones)
+        return table
+
+    def start_planning_pool(self):
+        """Start the planning pool or planning service client for the current grid and
+        heuristic, if used."""
+        if self.planning_pool is not None or not self.plan_in_parallel:
+            return
+        if self.planning_service:
+            self.planning_pool = PlanningServiceClient(
+                self.redis_db, self.base_world_grid, self.world_grid, self.reservations.horizon)
+        else:
+            self.planning_pool = PlanningPool(self.world_grid, self.heuristic_dict,
+                                              self.reservations.horizon,
+                                              self.planning_processes)
+
+    def close(self):
+        """Stop the planning pool workers, if any."""
+        if self.planning_pool:
+            self.planning_pool.close()
+            self.planning_pool = None
+
+    def get_all_static_obstacles(self):
+        """Get all static obstacles"""
+        static_obstacles: set[tuple[int, int]] = set()  # set{(row,col), ...}
+        # Maeke all zones static obstacles (lifted later for individual robots)
+        static_obstacles.update(self.robot_home_zones)
+        static_obstacles.update(self.item_load_zones)
+        static_obstacles.update(self.station_zones)
+        return static_obstacles
+
+    def get_world_t(self) -> int:
+        """Return the current world time step, or -1 if no world state was seen yet."""
+        return self.world_sim_t if self.world_sim_t is not None else -1
+
+    def get_all_current_dynamic_obstacles(self) -> ReservationTable:
+        """Rebuild dynamic obstacles from all existing robot future paths
+
+        Returns:
+            ReservationTable: table of (row, col, t) dynamic obstacles with current t=world time
+
+        """
+        dynamic_obstacles = self.reservations
+        dynamic_obstacles.clear(t_start=self.get_world_t())
+
+        for robot in self.robots:
+            self.add_path_as_obstacle(dynamic_obstacles, robot)
+
+        return dynamic_obstacles
+
+    def update_dynamic_obstacles(self) -> ReservationTable:
+        """Advance dynamic obstacles to the current world time, re-reserving only the robots
+        whose future path no longer matches the one reserved for them.
+
+        Between world steps every robot path just loses its head, which advancing the table
+        window already accounts for, so only changed paths cost anything here.
+
+        Returns:
+            ReservationTable: table of (row, col, t) dynamic obstacles with current t=world time
+        """
+        dynamic_obstacles = self.reservations
+        t_now = self.get_world_t()
+        if t_now < dynamic_obstacles.t_start:
+            # World time went back, nothing reserved can be trusted
+            return self.get_all_current_dynamic_obstacles()
+        dynamic_obstacles.advance(t_now - dynamic_obstacles.t_start)
+
+        for robot in self.robots:
+            if not self.reserved_path_matches(dynamic_obstacles, robot):
+                self.add_path_as_obstacle(dynamic_obstacles, robot)
+
+        return dynamic_obstacles
+
+    def reserved_path_matches(self, dynamic_obstacles: ReservationTable, robot: Robot) -> bool:
+        """True if the path reserved for robot, moved forward to the current world time,
+        matches its future path step for step. Paths with the same length and ends can still
+        take other cells (ex. a reservation kept from a reverted update), so every step is
+        compared, which only costs as much as the path."""
+        reserved = dynamic_obstacles.get_owner_path(robot.robot_id)
+        if reserved is None:
+            return False
+        path, path_t_start = reserved
+        # Steps of the reserved path not taken yet
+        remaining = path[max(self.get_world_t() + 1 - path_t_start, 0):]
+        if len(robot.future_path) != len(remaining):
+            # In windowed mode only the start of a longer path was reserved
+            if self.window:
+                if not (remaining and len(robot.future_path) > len(remaining) and
+                        len(path) == self.window):
+                    return False
+            # A path ending outside a zone has its end reserved on past it, to the end of the
+            # window, re-reserved once the window moved past it
+            elif not (robot.future_path and len(remaining) > len(robot.future_path) and
+                      path_t_start + len(path) >= dynamic_obstacles.t_end and
+                      all(tuple(pos) == tuple(robot.future_path[-1])
+                          for pos in remaining[len(robot.future_path):])):
+                return False
+        return all(tuple(pos) == tuple(reserved_pos)
+                   for pos, reserved_pos in zip(robot.future_path, remaining))
+
+    def add_path_as_obstacle(self, dynamic_obstacles: ReservationTable, robot: Robot,
+                             robot_future_path: Optional[Path] = None):
+        """Add dynamic obstacles for a robots future path, replacing the one reserved for it.
+        Uses the robot's current future path unless another path is given.
+
+        A path ending outside a zone (ex. a partial path) leaves the robot parked in the way,
+        so its end stays reserved to the end of the window, not just until it arrives."""
+        if robot_future_path is None:
+            robot_future_path = robot.future_path
+        t_start = self.get_world_t() + 1
+        if self.window:
+            robot_future_path = robot_future_path[:self.window]
+        elif robot_future_path and tuple(robot_future_path[-1]) not in self.static_obstacles:
+            robot_future_path = list(robot_future_path) + [robot_future_path[-1]] * (
+                dynamic_obstacles.t_end - t_start - len(robot_future_path))
+        # Reserve each step at t_step, along with t_step-1 to have other robots avoid entering
+        # the cell this robot just left (stops edge collisions), and t_step+1 to add a bit
+        # more space between robots to avoid rubbing shoulders.
+        dynamic_obstacles.reserve_path(
+            robot_future_path, t_start=t_start, buffer=1, owner=robot.robot_id)
+
+    def get_current_static_obstacles(self) -> set[Position]:
+        """Return static obstacles with stationary robots too
+
+        Returns a set[Position]: set of (row, col) static obstacles
+        """
+        # Add stationary robots to static obstacles
+        static_obstacles = self.static_obstacles.copy()
+        static_obstacles.update(
+            robot.pos for robot in self.robots if not robot.future_path)
+        return static_obstacles
+
+    def get_robot(self, robot_id: RobotId) -> Robot:
+        """Get robot by id from stored list of robots"""
+        # TODO : Replace this with dict[robot_id] -> robot
+        for robot in self.robots:
+            if robot.robot_id == robot_id:
+                return robot
+        raise ValueError(f'get_robot called with invalid robot id {robot_id}')
+
+    def generate_path(self, pos_a: Position, pos_b: Position,
+                      dynamic_obstacles, static_obstacles, engine: Optional[str] = None,
+                      partial: bool = False) -> Path:
+        """Generate a path from a to b avoiding existing robots, using the allocator's
+        path engine unless another one from PATH_ENGINES is given.
+
+        With first-move tables, the free-space shortest path to a zone is used as is if it runs
+        into no other robot. With the path cache, paths between zones are first tried by
+        repairing the cached free-space path (see PathCache), unless an engine is given.
+
+        With traffic costs, searches add the congestion of recent paths to each move (see
+        TrafficMap), unless an engine is given. Likewise with lanes, searches don't move
+        against them, or pay extra to with lane costs (see Lanes).
+
+        While update processes jobs, searches give up at jobs_deadline. With partial, a search
+        that doesn't reach b still returns no path, leaving the best path towards it to stop at
+        (see st_astar) in partial_paths.
+
+        In windowed mode paths only avoid dynamic obstacles for the window steps, with
+        windowed_st_astar, and replan_windowed_paths keeps them up to date.
+
+        In pibt mode robots are moved a step at a time by step_robots_pibt instead, so this
+        only checks pos_b is reachable and returns [pos_a, pos_b] for set_robot_path to take
+        the goal from."""
+        if self.planner_mode == 'pibt':
+            return [pos_a, pos_b] if self.heuristic_dict[pos_b][pos_a] >= 0 else []
+        t_start = time.perf_counter()
+        stats = {
+            'pos_a': pos_a,
+            'pos_b': pos_b,
+            'count_dynamic_obstacles': len(dynamic_obstacles),
+            'count_static_obstacles': len(static_obstacles)
+        }
+        path = self.planned_paths.pop((pos_a, pos_b), None)
+        # A planned search that found nothing had no deadline or partial path, search again
+        if path is not None and (not path or dynamic_obstacles is not self.reservations or
+                                 self.planning_pool.path_conflicts(
+                                     path, self.get_world_t() + 1, dynamic_obstacles)):
+            self.planning_stats['replanned'] += 1
+            path = None
+        if path is not None:
+            self.planning_stats['used'] += 1
+            stats['planned_by_pool'] = True
+        elif (self.first_moves is not None and engine is None and
+              pos_b in self.static_obstacles):
+            # Free-space shortest path without search, used as is if it runs into no robot
+            path = self.get_first_move_table(pos_b).path(pos_a, self.max_steps)
+            if not path or pf.find_path_conflict(path, dynamic_obstacles, static_obstacles,
+                                                 self.get_world_t() + 1) is not None:
+                path = None
+            stats['first_move_path'] = path is not None
+        if (path is None and self.path_cache is not None and engine is None and
+              {pos_a, pos_b} <= self.static_obstacles):
+            # Between zones, try repairing the cached free-space path first
+            path = self.path_cache.plan(
+                pos_a, pos_b, dynamic_obstacles, static_obstacles, self.heuristic_dict[pos_b],
+                max_steps=self.max_steps, t_start=self.get_world_t() + 1, stats=stats) or None
+        if path is None:
+            time_budget = None
+            if self.jobs_deadline is not None:
+                time_budget = max(self.jobs_deadline - time.perf_counter(), 0)
+            path = plan_path(
+                self.world_grid, pos_a, pos_b, dynamic_obstacles, static_obstacles,
+                self.heuristic_dict[pos_b], engine=engine or self.path_engine,
+                window=self.window, max_steps=self.max_steps, t_start=self.get_world_t() + 1,
+                stats=stats, time_budget=time_budget, partial=partial,
+                traffic=self.traffic if engine is None else None,
+                lanes=self.lanes if engine is None else None)
+            if stats.get('partial'):
+                self.partial_paths[(pos_a, pos_b)] = path
+                path = []
+        self.logger.info(
+            f'generate_path took {(time.perf_counter() - t_start)*1000:.3f} ms - {stats}')
+        return path
+
+    def generate_robot_path(self, robot: Robot, pos_b: Position, partial: bool = False) -> Path:
+        """Generate a path for robot from its position to b, as generate_path. A robot still
+        following a path (ex. a partial one) is planned without its own reservation, which is
+        restored after for set_robot_path to replace."""
+        own_path_released = (self.planner_mode != 'pibt' and bool(robot.future_path) and
+                             self.reservations.release_owner(robot.robot_id))
+        path = self.generate_path(robot.pos, pos_b, self.latest_dynamic_obstacles,
+                                  self.get_current_static_obstacles(), partial=partial)
+        if own_path_released:
+            self.add_path_as_obstacle(self.reservations, robot)
+        return path
+
+    def set_robot_path(self, robot: Robot, path: Path):
+        """Sets robot path, and also swaps its old path for this in the dynamic obstacles.
+        In pibt mode the end of the path becomes the robot's goal instead."""
+        if self.planner_mode == 'pibt':
+            self.robot_goals[robot.robot_id] = path[-1]
+            return
+        robot.set_path(path)
+        self.add_path_as_obstacle(self.reservations, robot, path)
+        if self.traffic is not None:
+            self.traffic.add_path(path)
+
+    def optimize_paths(self, time_budget: float) -> list[Robot]:
+        """Shorten the paths of robots headed to a zone with LNS (see LNSOptimizer) for up to
+        time_budget seconds. Each is replanned from its next step to the same end.
+
+        Only paths that changed are set, others LNS moved out of the way and back keep
+        their own reservation.
+
+        Returns:
+            list[Robot]: robots whose future path changed
+        """
+        self.lns_replaced_paths = {}
+        if time_budget <= 0:
+            return []
+        # Only paths ending in a zone, which no other robot passes through, so a robot arriving
+        # earlier than before can't be in anyone's way
+        robots = {robot.robot_id: robot for robot in self.robots
+                  if robot.future_path and tuple(robot.future_path[-1]) in self.static_obstacles
+                  and self.reserved_path_matches(self.reservations, robot)}
+        paths = {robot_id: [tuple(pos) for pos in robot.future_path]
+                 for robot_id, robot in robots.items()}
+        t_start = time.perf_counter()
+        new_paths = self.lns.optimize(
+            self.world_grid, self.heuristic_dict, self.reservations, paths,
+            self.get_current_static_obstacles(), self.get_world_t() + 1, time_budget)
+        changed_robots = []
+        for robot_id, path in new_paths.items():
+            robot = robots[robot_id]
+            if path == paths[robot_id]:
+                # Rerouted and back, reserved as before rather than as optimize left it
+                self.add_path_as_obstacle(self.reservations, robot)
+                continue
+            self.lns_replaced_paths[robot_id] = paths[robot_id]
+            self.set_robot_path(robot, path)
+            changed_robots.append(robot)
+        if changed_robots:
+            self.logger.info(f'LNS shortened {len(changed_robots)} paths in '
+                             f'{(time.perf_counter() - t_start)*1000:.3f} ms')
+        return changed_robots
+
+    def restore_lns_paths(self):
+        """Put back the paths and reservations the last optimize_paths replaced."""
+        for robot_id, path in self.lns_replaced_paths.items():
+            robot = self.get_robot(robot_id)
+            robot.set_path(path)
+            self.add_path_as_obstacle(self.reservations, robot)
+        self.lns_replaced_paths = {}
+
+    def replan_windowed_paths(self, deadline: Optional[float] = None) -> list[Robot]:
+        """Replan the paths of robots that moved replan_steps since they were last planned,
+        towards the end of their current path, reserving the next window of steps.
+
+        If a robot has no new path it keeps only the steps still reserved for it, so it
+        stops rather than leave its window.
+
+        Robots planned longest ago go first. Once past deadline the rest keep their
+        reservations as they are, so they are still due and go first next update.
+
+        Returns:
+            list[Robot]: robots whose future path changed
+        """
+        dynamic_obstacles = self.reservations
+        t_next = self.get_world_t() + 1
+        static_obstacles = self.get_current_static_obstacles()
+        due_robots = []
+        for robot in self.robots:
+            reserved = dynamic_obstacles.get_owner_path(robot.robot_id)
+            if not robot.future_path or reserved is None:
+                continue
+            reserved_path, path_t_start = reserved
+            if t_next - path_t_start < self.replan_steps or len(reserved_path) < self.window:
+                continue  # Not due yet, or its whole path was already checked
+            due_robots.append((path_t_start, robot, reserved_path))
+        due_robots.sort(key=lambda due: due[0])
+        changed_robots = []
+        for path_t_start, robot, reserved_path in due_robots:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            # Don't plan around its own reservation
+            dynamic_obstacles.release_owner(robot.robot_id)
+            path = self.generate_path(robot.pos, robot.future_path[-1], dynamic_obstacles,
+                                      static_obstacles)
+            if not path and deadline is not None and time.perf_counter() > deadline:
+                # Out of time rather than out of paths, replanned next update
+                dynamic_obstacles.reserve_path(reserved_path, t_start=path_t_start, buffer=1,
+                                               owner=robot.robot_id)
+                break
+            if not path:
+                self.logger.warning(f'Robot {robot.robot_id} no windowed replan, stopping')
+                path = reserved_path[t_next - path_t_start:]
+            if path != robot.future_path:
+                changed_robots.append(robot)
+            self.set_robot_path(robot, path)
+        return changed_robots
+
+    def robot_has_route(self, robot: Robot) -> bool:
+        """True if robot is still on its way somewhere, following a path or in pibt mode
+        heading to its goal."""
+        if robot.future_path:
+            return True
+        return (self.planner_mode == 'pibt' and
+                self.robot_goals.get(robot.robot_id, robot.pos) != robot.pos)
+
+    def step_robots_pibt(self) -> list[Robot]:
+        """Set the next step of every robot towards its goal with PIBT.
+
+        Returns:
+            list[Robot]: robots whose future path changed
+        """
+        positions = [robot.pos for robot in self.robots]
+        goals, distances, priorities = [], [], []
+        for robot in self.robots:
+            goal = self.robot_goals.setdefault(robot.robot_id, robot.pos)
+            goals.append(goal)
+            true_dists = self.heuristic_dict.get(goal)
+            if true_dists is None:
+                # Not a zone, only robots staying where they were first seen
+                distances.append(pf.get_manhattan_heuristic(goal))
+            else:
+                distances.append(lambda pos, true_dists=true_dists: true_dists[pos])
+            # Priority grows while away from goal, its fraction breaks ties between robots
+            priority = self.robot_priorities.get(robot.robot_id, 1.0 / (2 + robot.robot_id))
+            priority = priority + 1 if robot.pos != goal else priority % 1
+            self.robot_priorities[robot.robot_id] = priority
+            priorities.append(priority)
+
+        next_positions = pibt_step(self.world_grid, positions, distances, priorities,
+                                   self.static_obstacles, goals)
+        changed_robots = []
+        for robot, next_pos in zip(self.robots, next_positions):
+            path = [next_pos] if next_pos != robot.pos else []
+            if path != robot.future_path:
+                robot.set_path(path)
+                changed_robots.append(robot)
+        return changed_robots
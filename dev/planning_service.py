@@ -0,0 +1,323 @@
+"""Path planning service, plans robot allocator paths in worker processes over redis streams.
+
+The robot allocator (with PLANNING_SERVICE=1) stores a snapshot of its reservations under a new
+version, then adds a request per path (start, goal, snapshot version) to the planning:requests
+stream. Planner workers, any number of replicas of `python -m planning_service`, read requests
+as one consumer group so each is planned once, and add the found paths to the planning:replies
+stream. Like the planning pool, paths in a batch don't avoid each other, the allocator commits
+them in order and replans any that conflict with a path committed since the snapshot.
+"""
+import json
+import os
+import socket
+import time
+from typing import Optional
+import numpy as np
+import redis
+from multiagent_planner.pathfinding import Path, Position
+from multiagent_planner.pathfinding_heuristic import (
+    HeuristicDict, LazyHeuristic, build_true_heuristic, load_heuristic)
+from multiagent_planner.planning_pool import PlanRequest, plan_path, snapshot_conflicts
+from multiagent_planner.reservation_table import ReservationTable
+from path_encoder import PathEncoder
+from warehouse_logger import create_warehouse_logger
+from warehouses.warehouse_loader import WorldInfo
+# pylint: disable=redefined-outer-name
+
+REQUESTS_STREAM = 'planning:requests'
+REPLIES_STREAM = 'planning:replies'
+PLANNERS_GROUP = 'planners'
+SNAPSHOT_VERSION_KEY = 'planning:snapshot_version'
+# Max entries kept in the request and reply streams
+PLANNING_STREAM_MAXLEN = int(os.getenv("PLANNING_STREAM_MAXLEN", default="10000"))
+# Seconds a reservations snapshot is kept, requests of expired snapshots aren't planned
+PLANNING_SNAPSHOT_TTL_SEC = int(os.getenv("PLANNING_SNAPSHOT_TTL_SEC", default="30"))
+# Max requests a worker reads from the stream at a time
+PLANNING_WORKER_BATCH = int(os.getenv("PLANNING_WORKER_BATCH", default="10"))
+# Seconds since a planner last read the request stream before it's taken for gone, workers
+# read at least every second while running
+PLANNER_IDLE_SEC = float(os.getenv("PLANNER_IDLE_SEC", default="10"))
+
+
+def get_snapshot_key(version: int) -> str:
+    return f'planning:snapshot:{version}'
+
+
+def encode_path(path: Path) -> str:
+    """Encode path as its start and PathEncoder directions, ex. '2,3:UUL', '' if empty."""
+    if not path:
+        return ''
+    return f'{path[0][0]},{path[0][1]}:' + PathEncoder.encode_path(path[0], path[1:])
+
+
+def decode_path(encoded_path: str) -> Path:
+    if not encoded_path:
+        return []
+    start, directions = encoded_path.split(':')
+    start_pos = Position(tuple(int(value) for value in start.split(',')))
+    return [start_pos] + PathEncoder.decode_path(start_pos, directions)
+
+
+def encode_snapshot(reservations: ReservationTable, static_obstacles: set[Position],
+                    grid_changes: list[tuple[int, int, int]], options: dict) -> str:
+    """JSON of everything a worker needs to plan paths like the allocator: the paths reserved
+    in the table, static obstacles, grid cells changed from the warehouse yaml grid as
+    (row, col, value) and plan_path options."""
+    paths = [[encode_path(path), t_start, buffer, t_end]
+             for path, t_start, buffer, t_end in reservations.owners.values()]
+    return json.dumps({
+        't_start': reservations.t_start,
+        'horizon': reservations.horizon,
+        'paths': paths,
+        'static_obstacles': sorted(static_obstacles),
+        'grid_changes': grid_changes,
+        'options': options,
+    })
+
+
+class PlanningServiceClient:
+    """Sends path requests to the planner workers and collects their replies, used by the
+    robot allocator like a PlanningPool.
+
+    The grid changes relative to the warehouse yaml grid are sent with every snapshot, so the
+    client has to be recreated if the grid changes. Without running planners no requests are
+    sent and no paths come back, so the allocator plans them itself rather than wait.
+    """
+
+    def __init__(self, redis_con: redis.Redis, base_grid, grid, horizon: int) -> None:
+        self.redis_db = redis_con
+        self.grid_changes = [(int(row), int(col), int(grid[row, col]))
+                             for row, col in np.argwhere(np.asarray(grid) != base_grid)]
+        self.snapshot = np.zeros((horizon, *np.shape(grid)), dtype=np.uint8)
+        self.snapshot_t_start: Optional[int] = None
+        self.snapshot_version: Optional[int] = None
+        # Only replies added after this id are read
+        last_reply = self.redis_db.xrevrange(REPLIES_STREAM, count=1)
+        self.reply_id = last_reply[0][0] if last_reply else '0-0'
+
+    def send_requests(self, requests: list[PlanRequest], reservations: ReservationTable,
+                      static_obstacles: set[Position], **options) -> int:
+        """Store a snapshot of reservations and add a planning request per (pos_a, pos_b) to
+        the request stream, options are passed on to plan_path.
+
+        Returns:
+            int: the snapshot version replies are for
+        """
+        if reservations.table.shape != self.snapshot.shape:
+            raise ValueError(f'Reservation table {reservations.table.shape} does not match '
+                             f'the snapshot {self.snapshot.shape}')
+        self.snapshot[...] = reservations.table
+        self.snapshot_t_start = reservations.t_start
+        version = int(self.redis_db.incr(SNAPSHOT_VERSION_KEY))
+        self.snapshot_version = version
+        pipeline = self.redis_db.pipeline()
+        pipeline.set(get_snapshot_key(version),
+                     encode_snapshot(reservations, static_obstacles, self.grid_changes, options),
+                     ex=PLANNING_SNAPSHOT_TTL_SEC)
+        for idx, (pos_a, pos_b) in enumerate(requests):
+            pipeline.xadd(REQUESTS_STREAM, {
+                'version': version,
+                'idx': idx,
+                'pos_a': json.dumps(pos_a),
+                'pos_b': json.dumps(pos_b),
+            }, maxlen=PLANNING_STREAM_MAXLEN, approximate=True)
+        pipeline.execute()
+        return version
+
+    def receive_paths(self, version: int, count: int,
+                      timeout: Optional[float] = None) -> list[Optional[Path]]:
+        """Read replies for version until all count paths arrived or timeout seconds.
+
+        Returns:
+            list[Optional[Path]]: path per request (empty if none was found), None if it
+                wasn't planned in time
+        """
+        paths: list[Optional[Path]] = [None] * count
+        received = 0
+        t_end = time.perf_counter() + timeout if timeout is not None else None
+        while received < count:
+            block_ms = 0
+            if t_end is not None:
+                block_ms = int((t_end - time.perf_counter()) * 1000)
+                if block_ms <= 0:
+                    break
+            response = self.redis_db.xread({REPLIES_STREAM: self.reply_id}, block=block_ms)
+            if not response:
+                continue
+            for reply_id, data in response[0][1]:
+                self.reply_id = reply_id
+                if int(data['version']) != version or 'error' in data:
+                    continue
+                idx = int(data['idx'])
+                if paths[idx] is None:
+                    received += 1
+                paths[idx] = decode_path(data['path'])
+        return paths
+
+    def has_planners(self) -> bool:
+        """True if any planner worker read the request stream in the last PLANNER_IDLE_SEC."""
+        try:
+            consumers = self.redis_db.xinfo_consumers(REQUESTS_STREAM, PLANNERS_GROUP)
+        except redis.ResponseError:
+            return False  # No worker created the group yet
+        return any(consumer['idle'] < PLANNER_IDLE_SEC * 1000 for consumer in consumers)
+
+    def plan_paths(self, requests: list[PlanRequest], reservations: ReservationTable,
+                   static_obstacles: set[Position], engine: str = 'st_astar_flat',
+                   window: Optional[int] = None, max_steps: int = 500, t_start: int = 0,
+                   timeout: Optional[float] = None) -> list[Optional[Path]]:
+        """Plan a path for every request with the planner workers, all against a snapshot of
+        the current reservations, as PlanningPool.plan_paths."""
+        if not requests:
+            return []
+        if not self.has_planners():
+            return [None] * len(requests)
+        version = self.send_requests(requests, reservations, static_obstacles, engine=engine,
+                                     window=window, max_steps=max_steps, t_start=t_start)
+        return self.receive_paths(version, len(requests), timeout)
+
+    def path_conflicts(self, path: Path, t_start: int, reservations: ReservationTable) -> bool:
+        """True if path, planned against the last snapshot, runs into any cell reserved since
+        then, other than its start and end which paths may always use."""
+        return snapshot_conflicts(path, t_start, reservations, self.snapshot,
+                                  self.snapshot_t_start)
+
+    def close(self):
+        """Nothing to release, requests still queued for old snapshots are skipped."""
+
+
+class PlanningWorker:
+    """Plans the paths of requests read from the request stream as part of the planners
+    consumer group, against the reservations snapshot they name."""
+
+    def __init__(self, logger, redis_con: redis.Redis, world_info: WorldInfo,
+                 heuristic_dict: HeuristicDict, name: Optional[str] = None) -> None:
+        self.logger = logger
+        self.redis_db = redis_con
+        self.name = name or f'{socket.gethostname()}-{os.getpid()}'
+        self.base_grid = world_info.world_grid
+        self.world_grid = world_info.world_grid
+        self.heuristic_dict = heuristic_dict
+        # Latest snapshot loaded: (version, reservations, static obstacles, plan_path options)
+        self.snapshot: Optional[tuple[int, ReservationTable, set[Position], dict]] = None
+        try:
+            self.redis_db.xgroup_create(REQUESTS_STREAM, PLANNERS_GROUP, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise  # Group already exists otherwise
+
+    def set_grid_changes(self, grid_changes: list[tuple[int, int, int]]):
+        """Change the grid to the warehouse yaml grid with grid_changes, repairing the
+        heuristic for cells that differ from the current grid."""
+        grid = self.base_grid.copy()
+        for row, col, value in grid_changes:
+            grid[row, col] = value
+        changed = np.argwhere((grid != 0) != (self.world_grid != 0))
+        if not len(changed):
+            return
+        for blocked in (True, False):
+            cells = [Position((int(row), int(col))) for row, col in changed
+                     if bool(grid[row, col]) == blocked]
+            if cells and hasattr(self.heuristic_dict, 'set_cells'):
+                self.heuristic_dict.set_cells(cells, blocked)
+        if not hasattr(self.heuristic_dict, 'set_cells'):
+            # Plain heuristic dict, rebuilt for the new grid
+            self.heuristic_dict = build_true_heuristic(grid, list(self.heuristic_dict))
+        self.world_grid = grid
+        self.logger.info(f'Grid changed on {len(changed)} cells')
+
+    def load_snapshot(self, version: int) -> bool:
+        """Load the reservations snapshot of version, False if it expired."""
+        if self.snapshot and self.snapshot[0] == version:
+            return True
+        data = self.redis_db.get(get_snapshot_key(version))
+        if not data:
+            return False
+        data = json.loads(data)
+        self.set_grid_changes(data['grid_changes'])
+        reservations = ReservationTable(self.world_grid.shape, data['horizon'],
+                                        t_start=data['t_start'])
+        for owner, (encoded_path, t_start, buffer, t_end) in enumerate(data['paths']):
+            reservations.reserve_path(decode_path(encoded_path), t_start, buffer, owner=owner,
+                                      t_end=t_end)
+        static_obstacles = set(Position(tuple(pos)) for pos in data['static_obstacles'])
+        self.snapshot = (version, reservations, static_obstacles, data['options'])
+        return True
+
+    def plan_request(self, data: dict) -> dict:
+        """Plan the path of a request, returning the reply fields."""
+        version = int(data['version'])
+        reply = {'version': version, 'idx': data['idx'], 'worker': self.name}
+        if not self.load_snapshot(version):
+            reply['error'] = 'snapshot expired'
+            return reply
+        _, reservations, static_obstacles, options = self.snapshot
+        pos_a = Position(tuple(json.loads(data['pos_a'])))
+        pos_b = Position(tuple(json.loads(data['pos_b'])))
+        path = plan_path(self.world_grid, pos_a, pos_b, reservations, static_obstacles,
+                         self.heuristic_dict[pos_b], **options)
+        reply['path'] = encode_path(path)
+        return reply
+
+    def step(self, block_ms: int = 1000) -> int:
+        """Plan requests from the stream, skipping those of snapshots older than the latest.
+
+        Returns:
+            int: how many requests were read
+        """
+        response = self.redis_db.xreadgroup(PLANNERS_GROUP, self.name, {REQUESTS_STREAM: '>'},
+                                            count=PLANNING_WORKER_BATCH, block=block_ms)
+        if not response:
+            return 0
+        entries = response[0][1]
+        latest_version = int(self.redis_db.get(SNAPSHOT_VERSION_KEY) or 0)
+        t_start = time.perf_counter()
+        pipeline = self.redis_db.pipeline()
+        for _, data in entries:
+            if int(data['version']) < latest_version:
+                continue  # Allocator moved on, no one is waiting for it
+            pipeline.xadd(REPLIES_STREAM, self.plan_request(data),
+                          maxlen=PLANNING_STREAM_MAXLEN, approximate=True)
+        pipeline.xack(REQUESTS_STREAM, PLANNERS_GROUP, *[entry_id for entry_id, _ in entries])
+        pipeline.execute()
+        self.logger.info(f'Planned {len(entries)} requests in '
+                         f'{(time.perf_counter() - t_start)*1000:.3f} ms')
+        return len(entries)
+
+
+def wait_for_redis_connection(redis_con):
+    """Wait until a redis ping succeeds, try every 2 seconds."""
+    while True:
+        try:
+            if redis_con.ping():
+                break
+            logger.warning('Ping failed for redis server %s:%d, waiting', REDIS_HOST, REDIS_PORT)
+        except redis.ConnectionError:
+            logger.error('Redis unable to connect %s:%d, waiting', REDIS_HOST, REDIS_PORT)
+        time.sleep(2)
+
+
+if __name__ == '__main__':
+    logger = create_warehouse_logger('planning_service')
+
+    warehouse_yaml = os.getenv('WAREHOUSE_YAML', 'warehouses/main_warehouse.yaml')
+    world_info = WorldInfo.from_yaml(warehouse_yaml)
+    # Load or build true heuristic for all zones, other goals are built as needed
+    true_heuristic_dict = LazyHeuristic(
+        world_info.world_grid,
+        load_heuristic(warehouse_yaml=warehouse_yaml, world_info=world_info, logger=logger))
+
+    # Set up redis
+    REDIS_HOST = os.getenv("REDIS_HOST", default="localhost")
+    REDIS_PORT = int(os.getenv("REDIS_PORT", default="6379"))
+    redis_con = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    wait_for_redis_connection(redis_con)
+
+    worker = PlanningWorker(logger, redis_con, world_info, true_heuristic_dict)
+    logger.info(f'Planning worker {worker.name} started, waiting for {REQUESTS_STREAM}')
+    while True:
+        try:
+            worker.step()
+        except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+            logger.warning('Redis connection error, waiting and trying again.')
+            time.sleep(1)
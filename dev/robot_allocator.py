@@ -19,43 +19,63 @@ import redis
 from inventory_management_system.Item import ItemId
 from inventory_management_system.TaskKeyParser import parse_task_key_to_ids
 from job import Job, JobId, JobState
-import multiagent_planner.pathfinding as pf
-from multiagent_planner.pathfinding import Position, Path
-from multiagent_planner.pathfinding_heuristic import load_heuristic
+from multiagent_planner.pathfinding import Position
+from multiagent_planner.pathfinding_heuristic import HeuristicDict, LazyHeuristic, load_heuristic
+from multiagent_planner.lanes import Lanes
+from multiagent_planner.planning_pool import PlanRequest
+from path_planner import LANES, PLANNER_MODE, PathPlanner
 from robot import Robot, RobotId, RobotStatus
 from world_db import WorldDatabaseManager
 from warehouse_logger import create_warehouse_logger
 from warehouses.warehouse_loader import WorldInfo
 # pylint: disable=redefined-outer-name
 
-# Max number of steps to search with A*, should be ~worst case distance in grid
-MAX_PATH_STEPS = int(os.getenv("MAX_PATH_STEPS", default="500"))
 # How much time robot allocator should leave before end of its update and world sim next step
 SAFETY_FACTOR_SEC = float(
     os.getenv("SAFETY_FACTOR_SEC", default="0.200"))
+# Fraction of the time allotted for jobs the planning pool or service may take, the rest is
+# left for committing paths and planning the jobs it didn't get to locally
+PLANNING_TIME_FRACTION = float(os.getenv("PLANNING_TIME_FRACTION", default="0.5"))
+# Max grid changes ({"cells": [[row, col], ...], "blocked": bool} json messages pushed to the
+# world:grid_changes list, ex. aisles closed for maintenance) applied each step
+MAX_GRID_CHANGES_PER_STEP = int(os.getenv("MAX_GRID_CHANGES_PER_STEP", default="10"))
 
-class RobotAllocator:
+
+class RobotAllocator(PathPlanner):
     """Robot Allocator, manages robots, assigning them jobs from tasks, 
     updating stations and tasks states as needed"""
 
     def __init__(self, logger, redis_con: redis.Redis, wdb: WorldDatabaseManager,
                  world_info: WorldInfo,
-                 heuristic_dict: dict[Position, 'np.ndarray']) -> None:
-        self.logger = logger
-
+                 heuristic_dict: HeuristicDict,
+                 **planner_options) -> None:
+        """Set up the allocator, planner_options are passed on to PathPlanner."""
         # Connect to redis database
         self.wdb = wdb
 
-        # Tracks Order / Task, notifies item adds etc.
-        self.redis_db = redis_con
+        # Get delta time step used by world sim
+        self.dt_sec = self.wdb.get_dt_sec()
+        world_sim_t = None
 
-        # Load grid positions all in x,y coordinates
-        self.world_grid = world_info.world_grid
-        self.robot_home_zones = world_info.robot_home_zones
-        self.item_load_zones = world_info.item_load_zones
-        self.station_zones = world_info.station_zones
+        # Try and wait for world state update to get data and reset robots
+        response = redis_con.xread(
+            {'world:state': '$'}, block=1000, count=1)
+        if response:
+            #  Parse robot data from update message
+            timestamp, data = response[0][1][0]
+            world_sim_t = int(data['t'])
+            robots = [Robot.from_json(json_data) for json_data in json.loads(data['robots'])]
+            logger.info('RA restart Step start T=%d timestamp=%s %s',
+                        world_sim_t, timestamp, '-'*100)
+        else:
+            # Get all robots regardless of state
+            # assume no robots will be added or removed for duration of this instance
+            robots = self.wdb.get_robots()
 
-        self.heuristic_dict = heuristic_dict
+        # Sets up logger, redis_db (tracks Order / Task, notifies item adds etc.), robots, the
+        # grid and zones, and the planning of robot paths reserved from the current world time
+        super().__init__(logger, redis_con, robots, world_sim_t, world_info, heuristic_dict,
+                         **planner_options)
 
         # locks for zones
         self.item_locks: dict[Position, Optional[JobId]] = {
@@ -63,46 +83,17 @@ class RobotAllocator:
         self.station_locks: dict[Position, Optional[JobId]] = {
             pos: None for pos in self.station_zones}
 
-        self.max_steps = MAX_PATH_STEPS  # hard-coded search tile limit for pathing
-
         # Keep track of all jobs, even completed
         self.job_id_counter: JobId = JobId(0)
         self.jobs: dict[JobId, Job] = {}
 
-        # Get delta time step used by world sim
-        self.dt_sec = self.wdb.get_dt_sec()
-        self.world_sim_t = None
-
         # Ratio of an update alloted time to spend on jobs vs assigning robots
         self.job_assign_time_ratio = 0.8
 
-        # Using world info set up static dynamic obstacles
-        self.static_obstacles = self.get_all_static_obstacles()
-
-        # Try and wait for world state update to get data and reset robots
-        response = self.redis_db.xread(
-            {'world:state': '$'}, block=1000, count=1)
-        if response:
-            #  Parse robot data from update message
-            timestamp, data = response[0][1][0]
-            self.world_sim_t = int(data['t'])
-            self.robots = [Robot.from_json(json_data)
-                           for json_data in json.loads(data['robots'])]
-            self.logger.info(
-                'RA restart Step start T=%d timestamp=%s %s',
-                self.world_sim_t, timestamp, '-'*100)
-        else:
-            # Get all robots regardless of state
-            # assume no robots will be added or removed for duration of this instance
-            self.robots = self.wdb.get_robots()
-
         # Track robot allocations as allocations[robot_id] = job_id
         self.allocations: dict[RobotId, Optional[JobId]] = {
             robot.robot_id: None for robot in self.robots}
 
-        # Latest dynamic obstacles, reset on update(), updated with every new path in that cycle
-        self.latest_dynamic_obstacles = None
-
         # Try to find paths for robots to go home, since robots no longer are pathing, no
         # issue with this taking more than one time step.
         for idx, robot in enumerate(self.robots):
@@ -123,6 +114,7 @@ class RobotAllocator:
             self.jobs[job.job_id] = job
             self.allocations[robot.robot_id] = job.job_id
         self.wdb.update_robots(self.robots)  # Update new robot state
+        self.latest_dynamic_obstacles = self.get_all_current_dynamic_obstacles()
 
         # Move all in progress tasks back to head of new
         task_keys = self.redis_db.smembers('tasks:inprogress')
@@ -132,14 +124,21 @@ class RobotAllocator:
         pipeline.delete('tasks:inprogress')
         pipeline.execute()
 
-    def get_all_static_obstacles(self):
-        """Get all static obstacles"""
-        static_obstacles: set[tuple[int, int]] = set()  # set{(row,col), ...}
-        # Maeke all zones static obstacles (lifted later for individual robots)
-        static_obstacles.update(self.robot_home_zones)
-        static_obstacles.update(self.item_load_zones)
-        static_obstacles.update(self.station_zones)
-        return static_obstacles
+    def apply_grid_changes(self):
+        """Apply grid changes pushed to the world:grid_changes list since last step, updating
+        robots stopped by them."""
+        changes = self.redis_db.lpop('world:grid_changes', MAX_GRID_CHANGES_PER_STEP)
+        stopped_robots: dict[RobotId, Robot] = {}
+        for change in changes or []:
+            try:
+                change = json.loads(change)
+                for robot in self.set_cells_blocked(change['cells'],
+                                                    bool(change.get('blocked', True))):
+                    stopped_robots[robot.robot_id] = robot
+            except (ValueError, KeyError, TypeError, IndexError) as e:
+                self.logger.error(f'Invalid grid change {change}: {e}')
+        if stopped_robots:
+            self.wdb.update_robots(list(stopped_robots.values()))
 
     def make_job(self, task_key: str, robot: Robot) -> Job:
         """Create a job for a given robot and task"""
@@ -213,50 +212,6 @@ class RobotAllocator:
                 self.item_locks[end_pos] = job_id
         return job
 
-    def get_all_current_dynamic_obstacles(self) -> set[tuple[int, int, int]]:
-        """Return existing robot future paths as dynamic obstacles
-
-        Returns:
-            set[tuple[int, int, int]]: set of (row, col, t) dynamic obstacles with current t=-1
-
-        """
-        # For dynamic obstacles, assume current moment is t=-1, next moment is t=0
-        dynamic_obstacles: set[tuple[int, int, int]
-                               ] = set()  # set{(row,col,t), ...}
-
-        for robot in self.robots:
-            self.add_path_as_obstacle(dynamic_obstacles, robot.future_path)
-
-        return dynamic_obstacles
-
-    def add_path_as_obstacle(self, dynamic_obstacles, robot_future_path):
-        """Add dynamic obstacles for a given robots future path."""
-        for t_step, pos in enumerate(robot_future_path):
-            dynamic_obstacles.add((pos[0], pos[1], t_step))
-            # Have other robots avoid entering cell this robot just left. Stops edge collisions.
-            dynamic_obstacles.add((pos[0], pos[1], t_step-1))
-            # Add a bit more space between robots to avoid rubbing shoulders
-            dynamic_obstacles.add((pos[0], pos[1], t_step+1))
-
-    def get_current_static_obstacles(self) -> set[Position]:
-        """Return static obstacles with stationary robots too
-
-        Returns a set[Position]: set of (row, col) static obstacles
-        """
-        # Add stationary robots to static obstacles
-        static_obstacles = self.static_obstacles.copy()
-        static_obstacles.update(
-            robot.pos for robot in self.robots if not robot.future_path)
-        return static_obstacles
-
-    def get_robot(self, robot_id: RobotId) -> Robot:
-        """Get robot by id from stored list of robots"""
-        # TODO : Replace this with dict[robot_id] -> robot
-        for robot in self.robots:
-            if robot.robot_id == robot_id:
-                return robot
-        raise ValueError(f'get_robot called with invalid robot id {robot_id}')
-
     def robot_pick_item(self, robot_id: RobotId,
                         item_id: ItemId) -> Tuple[bool, Optional[ItemId]]:
         """Robot by id pick the given item if possible, return held item."""
@@ -362,9 +317,24 @@ class RobotAllocator:
         # TODO : Replace this with round-robin
         shuffled_job_keys = random.sample(job_keys, len(job_keys))
 
-        # Get the dynamic obstacles for this timestep
-        self.latest_dynamic_obstacles = self.get_all_current_dynamic_obstacles()
-        # Only process jobs for up to time_allotted_for_jobs locally and time_left total
+        # Get the dynamic obstacles for this timestep, pibt mode plans without them
+        if self.planner_mode != 'pibt':
+            self.latest_dynamic_obstacles = self.update_dynamic_obstacles()
+        if self.traffic is not None:
+            self.traffic.advance(self.get_world_t() - self.traffic.t)
+        # Only process jobs for up to time_allotted_for_jobs locally and time_left total, with
+        # path searches (windowed replans included) giving up at the same time
+        self.jobs_deadline = t_start + time_allotted_for_jobs
+        # In windowed mode first replan paths about to leave their window
+        if self.planner_mode == 'windowed':
+            for robot in self.replan_windowed_paths(self.jobs_deadline):
+                robot_was_modified[robot.robot_id] = True
+        # Plan the paths jobs need in parallel, each job then commits its path in job order,
+        # replanning it if it runs into a path committed before it
+        if self.plan_in_parallel:
+            self.plan_job_paths(
+                [self.jobs[job_key] for job_key in shuffled_job_keys],
+                PLANNING_TIME_FRACTION * (self.jobs_deadline - time.perf_counter()))
         jobs_processed = 0
         processed_jobs: list[Job] = []
         for job_key in shuffled_job_keys:
@@ -376,6 +346,9 @@ class RobotAllocator:
             jobs_processed += 1
             processed_jobs.append(job)
             robot_was_modified[job.robot_id] = True
+        self.planned_paths.clear()
+        self.partial_paths.clear()
+        self.jobs_deadline = None
         t_update_jobs = (time.perf_counter() - t_update_jobs)*1000
 
         # 3 - Now check for any available robots and tasks for
@@ -411,6 +384,17 @@ class RobotAllocator:
             robot_was_modified[new_job.robot_id] = True
         t_assign = (time.perf_counter() - t_assign)*1000
 
+        # In pibt mode move every robot a step towards its goal
+        if self.planner_mode == 'pibt':
+            for robot in self.step_robots_pibt():
+                robot_was_modified[robot.robot_id] = True
+
+        # Shorten committed paths with some of the time left, leaving the rest for redis
+        if self.lns is not None:
+            time_spare = time_left - (time.perf_counter() - t_start)
+            for robot in self.optimize_paths(min(self.lns_time_sec, time_spare / 2)):
+                robot_was_modified[robot.robot_id] = True
+
         # Revert changes if at this point update took too long
         # Expectation: No redis writes were done up to this point.
         if update_too_long():
@@ -421,6 +405,8 @@ class RobotAllocator:
                 f'reverting processed {jobs_processed}/{len(shuffled_job_keys)} jobs, '
                 f'reverting assigned {robots_assigned}/{available_robots_count} available robots '
                 f'to {new_tasks_count}/{all_new_tasks_count} available tasks')
+            if self.lns is not None:
+                self.restore_lns_paths()
             return
 
         # 4 - Batch update robots, jobs, tasks now
@@ -471,42 +457,61 @@ class RobotAllocator:
             f'processed {jobs_processed}/{len(shuffled_job_keys)} jobs, '
             f'assigned {robots_assigned}/{available_robots_count} available robots '
             f'to {new_tasks_count}/{all_new_tasks_count} available tasks '
-            f'[{t_load_robots:.3f}, {t_update_jobs:.3f}, {t_assign:.3f}, {t_update_all:.3f}] ms')
+            f'[{t_load_robots:.3f}, {t_update_jobs:.3f}, {t_assign:.3f}, {t_update_all:.3f}] ms'
+            + (f', used {self.planning_stats["used"]} pool paths, replanned '
+               f'{self.planning_stats["replanned"]}' if self.plan_in_parallel else '')
+            + (f', path cache {self.path_cache.stats()}' if self.path_cache is not None else '')
+            + (f', lns {self.lns.stats()}' if self.lns is not None else '')
+            + (f', traffic {self.traffic.total():.1f}' if self.traffic is not None else ''))
 
     def sleep(self):
         """Sleep for dt_sec"""
         time.sleep(self.dt_sec)
 
-    def generate_path(self, pos_a: Position, pos_b: Position,
-                      dynamic_obstacles, static_obstacles) -> Path:
-        """Generate a path from a to b avoiding existing robots"""
-        t_start = time.perf_counter()
-        stats = {
-            'pos_a': pos_a,
-            'pos_b': pos_b,
-            'count_dynamic_obstacles': len(dynamic_obstacles),
-            'count_static_obstacles': len(static_obstacles)
-        }
-
-        true_dists = self.heuristic_dict[pos_b]
-
-        def true_heuristic(pos_a: Position) -> float:
-            """Returns A* shortest path between any two points based on world_grid"""
-            return true_dists[pos_a]
-        path = pf.st_astar(
-            self.world_grid, pos_a, pos_b, dynamic_obstacles, static_obstacles=static_obstacles,
-            end_fast=True, max_time=self.max_steps, heuristic=true_heuristic, stats=stats,
-            validate_ends=False)
-        self.logger.info(
-            f'generate_path took {(time.perf_counter() - t_start)*1000:.3f} ms - {stats}')
-        return path
-
-    def set_robot_path(self, robot: Robot, path: Path):
-        """Sets robot path, and also updates latest dynamic obstacles with this"""
-        robot.set_path(path)
-        if self.latest_dynamic_obstacles is not None:
-            self.add_path_as_obstacle(self.latest_dynamic_obstacles, path)
+    def get_job_path_request(self, job: Job) -> Optional[PlanRequest]:
+        """Return the (pos_a, pos_b) path processing job in its current state will first
+        generate, or None if it won't need one."""
+        robot = self.get_robot(job.robot_id)
+        if job.state == JobState.WAITING_TO_START:
+            if self.item_locks[job.item_zone] not in (None, job.job_id):
+                return None
+            return (robot.pos, job.item_zone)
+        if job.state == JobState.ITEM_PICKED:
+            if self.station_locks[job.station_zone] not in (None, job.job_id):
+                return None
+            return (robot.pos, job.station_zone)
+        if job.state in (JobState.ITEM_DROPPED, JobState.ERROR):
+            return (robot.pos, job.robot_home)
+        if job.state == JobState.RESTART_MGR_GO_HOME:
+            if self.robot_has_route(robot) or robot.pos == job.robot_home:
+                return None
+            return (robot.pos, job.robot_home)
+        return None
 
+    def plan_job_paths(self, jobs: list[Job], timeout: float):
+        """Plan the paths jobs need with the planning pool or service, all against the current
+        reservations, into planned_paths for generate_path to check and use."""
+        self.planned_paths.clear()
+        self.planning_stats = {'used': 0, 'replanned': 0}
+        requests = list(dict.fromkeys(
+            request for request in map(self.get_job_path_request, jobs) if request))
+        if not requests or timeout <= 0:
+            return
+        self.start_planning_pool()
+        t_start = time.perf_counter()
+        paths = self.planning_pool.plan_paths(
+            requests, self.reservations, self.get_current_static_obstacles(),
+            engine=self.path_engine, window=self.window, max_steps=self.max_steps,
+            t_start=self.get_world_t() + 1, timeout=timeout)
+        self.planned_paths = {request: path for request, path in zip(requests, paths)
+                              if path is not None}
+        if len(self.planned_paths) < len(requests):
+            self.logger.warning(f'Planning pool timed out on '
+                                f'{len(requests) - len(self.planned_paths)}/{len(requests)} '
+                                f'paths after {(time.perf_counter() - t_start)*1000:.3f} ms')
+        else:
+            self.logger.info(f'Planning pool planned {len(requests)} paths in '
+                             f'{(time.perf_counter() - t_start)*1000:.3f} ms')
 
     def job_start(self, job: Job) -> bool:
         """Start job, pathing robot to item zone, or home."""
@@ -519,9 +524,14 @@ class RobotAllocator:
         robot = self.get_robot(job.robot_id)
         current_pos = robot.pos
         # Try to generate new path for robot
+        job.path_robot_to_item = self.generate_robot_path(robot, job.item_zone, partial=True)
+        partial_path = self.partial_paths.pop((current_pos, job.item_zone), None)
+        if partial_path:
+            # Out of time or no way through yet, get as close as is safe and retry next update
+            self.set_robot_path(robot, partial_path)
+            robot.state_description = 'Pathing towards item zone'
+            return False
         static_obstacles = self.get_current_static_obstacles()
-        job.path_robot_to_item = self.generate_path(
-            current_pos, job.item_zone, self.latest_dynamic_obstacles, static_obstacles)
         if not job.path_robot_to_item:
             self.logger.warning(f'Robot {job.robot_id} no path to item zone')
 
@@ -548,7 +558,7 @@ class RobotAllocator:
         # Check that robot is at item zone or has a path
         robot = self.get_robot(job.robot_id)
         if robot.pos != job.item_zone:
-            if not robot.future_path:
+            if not self.robot_has_route(robot):
                 self.logger.error(
                     f'Robot {robot.robot_id} path diverged from job pick item, reset state')
                 job.started = False
@@ -584,9 +594,15 @@ class RobotAllocator:
         robot = self.get_robot(job.robot_id)
         current_pos = robot.pos
         # Try to generate new path for robot
+        job.path_item_to_station = self.generate_robot_path(robot, job.station_zone,
+                                                            partial=True)
+        partial_path = self.partial_paths.pop((current_pos, job.station_zone), None)
+        if partial_path:
+            # Out of time or no way through yet, get as close as is safe and retry next update
+            self.set_robot_path(robot, partial_path)
+            robot.state_description = 'Pathing towards station'
+            return False
         static_obstacles = self.get_current_static_obstacles()
-        job.path_item_to_station = self.generate_path(
-            current_pos, job.station_zone, self.latest_dynamic_obstacles, static_obstacles)
         if not job.path_item_to_station:
             self.logger.warning('No path to station for %s', job)
             # Try going home instead to leave space at station
@@ -613,7 +629,7 @@ class RobotAllocator:
         # Check that robot is at station zone
         robot = self.get_robot(job.robot_id)
         if robot.pos != job.station_zone:
-            if not robot.future_path:
+            if not self.robot_has_route(robot):
                 self.logger.error(
                     f'Robot {robot.robot_id} path diverged from job drop item, reset state')
                 job.state = JobState.ITEM_PICKED
@@ -668,7 +684,7 @@ class RobotAllocator:
         # Check that robot is at home zone
         robot = self.get_robot(job.robot_id)
         if robot.pos != job.robot_home:
-            if not robot.future_path:
+            if not self.robot_has_route(robot):
                 self.logger.error(
                     f'Robot {robot.robot_id} path diverged from job arrive home, reset state')
                 return False
@@ -724,7 +740,7 @@ class RobotAllocator:
         """Transition to restart manager return home state, wait for path and then path home."""
         robot = self.get_robot(job.robot_id)
         # Wait for existing path to finish
-        if robot.future_path:
+        if self.robot_has_route(robot):
             self.logger.warning(
                 f'{job} - Robot {job.robot_id} still finishing path')
             return False  # Did not generate path home yet since still have path
@@ -804,6 +820,8 @@ class RobotAllocator:
             f'Step start T={self.world_sim_t} timestamp={timestamp}, '
             f'{time_to_next_step_sec:.1f} sec till next {"-"*100}')
         safe_time_left = time_to_next_step_sec - SAFETY_FACTOR_SEC
+        self.robots = robots
+        self.apply_grid_changes()
         self.update(robots, time_read, safe_time_left)
         self.logger.debug('Step end')
 
@@ -831,9 +849,16 @@ if __name__ == '__main__':
 
     # Load world info from yaml
     world_info = WorldInfo.from_yaml(warehouse_yaml)
-    # Load or build true heuristic dict
-    true_heuristic_dict = load_heuristic(warehouse_yaml=warehouse_yaml,
-                                         world_info=world_info, logger=logger)
+    # With hard lanes the heuristic follows them, as the allocator's searches do
+    blocked_moves = None
+    if LANES and PLANNER_MODE == 'paths':
+        blocked_moves = Lanes.from_world_info(world_info).blocked_moves
+    # Load or build true heuristic for all zones, other goals are built as needed
+    true_heuristic_dict = LazyHeuristic(
+        world_info.world_grid,
+        load_heuristic(warehouse_yaml=warehouse_yaml, world_info=world_info, logger=logger,
+                       blocked_moves=blocked_moves),
+        blocked_moves=blocked_moves)
 
     # Set up redis
     REDIS_HOST = os.getenv("REDIS_HOST", default="localhost")
@@ -860,4 +885,7 @@ if __name__ == '__main__':
             time.sleep(1)
         except ValueError as e:
             logger.warning('Resetting robot allocator since world_sim restarted')
-            robot_mgr = RobotAllocator(logger, redis_con, wdb, world_info, true_heuristic_dict)
+            robot_mgr.close()
+            # Keep the grid changes applied so far, the shared heuristic was repaired for them
+            robot_mgr = RobotAllocator(logger, redis_con, wdb, world_info, true_heuristic_dict,
+                                       world_grid=robot_mgr.world_grid)
@@ -0,0 +1,217 @@
+"""Unit tests for the planning service."""
+import logging
+import os
+import time
+import unittest
+from unittest import mock
+import numpy as np
+import redis
+from multiagent_planner.pathfinding import Position
+from multiagent_planner.pathfinding_heuristic import HeuristicStore, LazyHeuristic
+from multiagent_planner.planning_pool import plan_path
+from multiagent_planner.reservation_table import ReservationTable
+import planning_service as ps
+from warehouses.warehouse_loader import WorldInfo
+
+logger = logging.getLogger()
+
+# Run against a redis-server at this host instead of the in-process stand-in
+# ex. `PLANNING_TEST_REDIS_HOST=localhost python -m pytest test_planning_service.py`
+PLANNING_TEST_REDIS_HOST = os.getenv("PLANNING_TEST_REDIS_HOST")
+
+default_grid = np.zeros([5, 5])
+default_world = WorldInfo(default_grid, [Position((2, 3)), Position((3, 4))],
+                          [Position((1, 0)), Position((1, 1))],
+                          [Position((0, 0)), Position((0, 1))])
+
+
+class LocalRedis:
+    """In-process stand-in for the redis commands the planning service uses, with
+    decode_responses strings. Blocking reads return immediately."""
+
+    class Pipeline:
+        def __init__(self, local_redis) -> None:
+            self.local_redis = local_redis
+            self.commands = []
+
+        def __getattr__(self, name):
+            def queue(*args, **kwargs):
+                self.commands.append((getattr(self.local_redis, name), args, kwargs))
+            return queue
+
+        def execute(self):
+            results = [command(*args, **kwargs) for command, args, kwargs in self.commands]
+            self.commands = []
+            return results
+
+    def __init__(self) -> None:
+        self.values = {}
+        self.streams: dict[str, list] = {}
+        self.groups: dict[tuple[str, str], int] = {}  # (stream, group) -> entries delivered
+        self.pending: dict[tuple[str, str], set] = {}
+        # (stream, group) -> {consumer: time of its last read}
+        self.consumers: dict[tuple[str, str], dict[str, float]] = {}
+        self.last_id = 0
+
+    def pipeline(self):
+        return LocalRedis.Pipeline(self)
+
+    def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1)
+        return int(self.values[key])
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):  # pylint: disable=unused-argument
+        self.values[key] = str(value)
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+            self.streams.pop(key, None)
+
+    def xadd(self, stream, fields, maxlen=None, approximate=True):
+        # pylint: disable=unused-argument
+        self.last_id += 1
+        entry_id = f'{self.last_id}-0'
+        self.streams.setdefault(stream, []).append(
+            (entry_id, {key: str(value) for key, value in fields.items()}))
+        return entry_id
+
+    def xrevrange(self, stream, count=None):
+        return list(reversed(self.streams.get(stream, [])))[:count]
+
+    def xread(self, streams, count=None, block=None):  # pylint: disable=unused-argument
+        response = []
+        for stream, last_id in streams.items():
+            last = int(last_id.split('-')[0])
+            entries = [entry for entry in self.streams.get(stream, [])
+                       if int(entry[0].split('-')[0]) > last][:count]
+            if entries:
+                response.append([stream, entries])
+        return response
+
+    def xgroup_create(self, stream, group, id='0', mkstream=False):
+        # pylint: disable=redefined-builtin,unused-argument
+        if (stream, group) in self.groups:
+            raise redis.ResponseError('BUSYGROUP Consumer Group name already exists')
+        self.streams.setdefault(stream, [])
+        self.groups[stream, group] = 0
+        self.pending[stream, group] = set()
+        self.consumers[stream, group] = {}
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        # pylint: disable=unused-argument
+        response = []
+        for stream in streams:
+            self.consumers[stream, group][consumer] = time.perf_counter()
+            delivered = self.groups[stream, group]
+            entries = self.streams[stream][delivered:][:count]
+            self.groups[stream, group] = delivered + len(entries)
+            self.pending[stream, group].update(entry_id for entry_id, _ in entries)
+            if entries:
+                response.append([stream, entries])
+        return response
+
+    def xinfo_consumers(self, stream, group):
+        if (stream, group) not in self.consumers:
+            raise redis.ResponseError('NOGROUP No such key or consumer group')
+        return [{'name': name, 'pending': 0, 'idle': int((time.perf_counter() - t_read) * 1000)}
+                for name, t_read in self.consumers[stream, group].items()]
+
+    def xack(self, stream, group, *ids):
+        pending = self.pending[stream, group]
+        acked = pending.intersection(ids)
+        pending.difference_update(ids)
+        return len(acked)
+
+
+class TestPlanningService(unittest.TestCase):
+    """Unit tests for the planning service client and worker."""
+
+    def setUp(self):
+        if PLANNING_TEST_REDIS_HOST:
+            self.redis_con = redis.Redis(host=PLANNING_TEST_REDIS_HOST, decode_responses=True)
+            self.redis_con.delete(ps.REQUESTS_STREAM, ps.REPLIES_STREAM, ps.SNAPSHOT_VERSION_KEY)
+        else:
+            self.redis_con = LocalRedis()
+        self.heuristic = LazyHeuristic(default_grid, HeuristicStore.build(
+            default_grid, default_world.get_all_zones(), processes=1))
+
+    def test_encode_path(self):
+        path = [(2, 3), (2, 2), (2, 2), (1, 2), (1, 1)]
+        self.assertEqual(ps.decode_path(ps.encode_path(path)), path)
+        self.assertEqual(ps.encode_path([]), '')
+        self.assertEqual(ps.decode_path(''), [])
+
+    def test_plan_paths(self):
+        workers = [ps.PlanningWorker(logger, self.redis_con, default_world, self.heuristic,
+                                     name=f'worker{idx}') for idx in range(2)]
+        client = ps.PlanningServiceClient(self.redis_con, default_grid, default_grid, 10)
+        reservations = ReservationTable(default_grid.shape, horizon=10, t_start=4)
+        reservations.reserve_path([(2, 2), (2, 1), (2, 0)], t_start=5, buffer=1, owner=0)
+        static_obstacles = {(2, 3), (1, 1)}
+        # Goals outside the preloaded heuristic are built by the workers
+        requests = [((2, 3), (1, 0)), ((3, 4), (1, 1)), ((1, 1), (4, 0))]
+        options = {'max_steps': 20, 't_start': 5}
+        version = client.send_requests(requests, reservations, static_obstacles, **options)
+        # Each request is read by one of the workers
+        with mock.patch.object(ps, 'PLANNING_WORKER_BATCH', 2):
+            self.assertEqual(workers[0].step(block_ms=10), 2)
+            self.assertEqual(workers[1].step(block_ms=10), 1)
+            self.assertEqual(workers[1].step(block_ms=10), 0)
+        paths = client.receive_paths(version, len(requests), timeout=1)
+        for (pos_a, pos_b), path in zip(requests, paths):
+            self.assertEqual(path[-1], pos_b)
+            self.assertListEqual(path, plan_path(
+                default_grid, pos_a, pos_b, reservations, static_obstacles,
+                self.heuristic[pos_b], **options))
+
+        # Requests of older snapshots are skipped, those of expired ones return no path
+        version = client.send_requests(requests[:1], reservations, static_obstacles, **options)
+        client.send_requests(requests[:1], reservations, static_obstacles, **options)
+        self.redis_con.delete(ps.get_snapshot_key(version + 1))
+        self.assertEqual(workers[0].step(block_ms=10), 2)
+        self.assertListEqual(client.receive_paths(version, 1, timeout=0.01), [None])
+        self.assertListEqual(client.receive_paths(version + 1, 1, timeout=0.01), [None])
+
+    def test_grid_changes(self):
+        worker = ps.PlanningWorker(logger, self.redis_con, default_world, self.heuristic)
+        grid = default_grid.copy()
+        grid[0:4, 2] = 1
+        client = ps.PlanningServiceClient(self.redis_con, default_grid, grid, 10)
+        reservations = ReservationTable(default_grid.shape, horizon=10)
+        worker.step(block_ms=10)
+        [path] = client.plan_paths([((3, 4), (1, 0))], reservations, set(), timeout=0)
+        self.assertIsNone(path)  # Worker didn't plan it yet
+        worker.step(block_ms=10)
+        [path] = client.receive_paths(client.snapshot_version, 1, timeout=1)
+        self.assertTrue(worker.world_grid[1, 2])
+        # Path goes around the blocked cells, through the gap at (4, 2)
+        self.assertEqual(path[-1], (1, 0))
+        self.assertIn((4, 2), path)
+        self.assertEqual(len(path), 9)
+
+    def test_no_planners(self):
+        client = ps.PlanningServiceClient(self.redis_con, default_grid, default_grid, 10)
+        reservations = ReservationTable(default_grid.shape, horizon=10)
+        requests = [((3, 4), (1, 0))]
+        # No group or consumers yet, fails right away without sending requests
+        t_start = time.perf_counter()
+        self.assertListEqual(client.plan_paths(requests, reservations, set(), timeout=1),
+                             [None])
+        self.assertLess(time.perf_counter() - t_start, 0.5)
+        self.assertFalse(self.redis_con.xrevrange(ps.REQUESTS_STREAM, count=1))
+        worker = ps.PlanningWorker(logger, self.redis_con, default_world, self.heuristic)
+        self.assertFalse(client.has_planners())
+        worker.step(block_ms=10)
+        self.assertTrue(client.has_planners())
+        # Workers idle too long are taken for gone
+        with mock.patch.object(ps, 'PLANNER_IDLE_SEC', 0):
+            self.assertFalse(client.has_planners())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,10 @@ from unittest.mock import Mock
 import numpy as np
 from robot_allocator import RobotAllocator
 from job import JobState
+from multiagent_planner.lanes import parse_lanes
+import multiagent_planner.pathfinding as pf
 from multiagent_planner.pathfinding import Position
+from multiagent_planner.pathfinding_heuristic import HeuristicStore, LazyHeuristic
 from robot import Robot, RobotId, Path
 from warehouses.warehouse_loader import WorldInfo
 from world_db import WorldDatabaseManager
@@ -62,6 +65,589 @@ class TestRobotAllocator(unittest.TestCase):
             logger, mock_redis, mock_wdb, default_world, mock_heuristic)
         self.assertListEqual(robot_mgr.get_available_robots(), robots)
 
+    def test_generate_path_engines_match(self):
+        mock_redis.smembers.return_value = set()
+        mock_wdb.get_robots.return_value = []
+        mock_redis.xread.return_value = None
+        # Open grid, so manhattan distance is the true distance
+        heuristic_dict = {
+            pos: np.abs(np.indices(default_grid.shape) - np.reshape(pos, (2, 1, 1))).sum(axis=0)
+            for pos in default_world.get_all_zones()}
+        robot_mgr = RobotAllocator(
+            logger, mock_redis, mock_wdb, default_world, heuristic_dict, path_engine='st_astar')
+        dynamic_obstacles = set([(2, 2, 1), (1, 2, 2)])
+        static_obstacles = robot_mgr.get_current_static_obstacles()
+        path = robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), dynamic_obstacles, static_obstacles)
+        path_flat = robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), dynamic_obstacles, static_obstacles,
+            engine='st_astar_flat')
+        self.assertEqual(path[-1], (1, 0))
+        self.assertListEqual(path, path_flat)
+        path_sipp = robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), dynamic_obstacles, static_obstacles,
+            engine='sipp')
+        self.assertEqual(path_sipp[-1], (1, 0))
+        self.assertLessEqual(len(path_sipp), len(path))
+
+    def test_generate_path_lazy_heuristic(self):
+        mock_redis.smembers.return_value = set()
+        mock_wdb.get_robots.return_value = []
+        mock_redis.xread.return_value = None
+        heuristic = LazyHeuristic(default_grid, HeuristicStore.build(
+            default_grid, default_world.get_all_zones()))
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic)
+        static_obstacles = robot_mgr.get_current_static_obstacles()
+        # Paths can go to cells that aren't zones too
+        path = robot_mgr.generate_path(
+            Position((2, 3)), Position((4, 0)), set(), static_obstacles)
+        self.assertEqual(path[-1], (4, 0))
+        self.assertEqual(len(path), 6)
+        path = robot_mgr.generate_path(
+            Position((4, 0)), Position((1, 0)), set(), static_obstacles)
+        self.assertEqual(path[-1], (1, 0))
+        self.assertEqual(heuristic.stats()['misses'], 1)
+
+    def test_set_cells_blocked(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        grid = default_grid.copy()
+        heuristic = LazyHeuristic(grid, HeuristicStore.build(grid, default_world.get_all_zones()))
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic)
+        robot_mgr.set_robot_path(robots[0], [(2, 3), (2, 2), (2, 1), (2, 0), (1, 0)])
+        robot_mgr.set_robot_path(robots[1], [(3, 4), (3, 3), (3, 2)])
+        # Wall across the middle of row 2 except the left edge
+        stopped_robots = robot_mgr.set_cells_blocked([(2, 1), (2, 2)])
+        self.assertListEqual(stopped_robots, [robots[0]])
+        self.assertListEqual(robots[0].future_path, [(2, 3)])
+        self.assertListEqual(robots[1].future_path, [(3, 4), (3, 3), (3, 2)])
+        self.assertEqual(robot_mgr.world_grid[2, 1], 1)
+        self.assertEqual(default_grid[2, 1], 0)
+        # Heuristic and paths go around the new wall
+        self.assertEqual(heuristic[(1, 0)][(3, 2)], 4)
+        path = robot_mgr.generate_path(Position((2, 3)), Position((1, 0)), set(),
+                                       robot_mgr.get_current_static_obstacles())
+        self.assertNotIn((2, 1), path)
+        self.assertNotIn((2, 2), path)
+        self.assertEqual(path[-1], (1, 0))
+
+        # Changes pushed to redis are applied, and the stopped robots updated
+        mock_redis.lpop.return_value = ['{"cells": [[2, 1]], "blocked": false}']
+        mock_wdb.update_robots.reset_mock()
+        robot_mgr.apply_grid_changes()
+        mock_redis.lpop.assert_called_with('world:grid_changes', mock.ANY)
+        self.assertEqual(robot_mgr.world_grid[2, 1], 0)
+        self.assertEqual(heuristic[(1, 0)][(2, 1)], 2)
+        mock_wdb.update_robots.assert_not_called()
+        mock_redis.lpop.return_value = None
+
+        # Zones and cells robots are on are skipped, so searches from and to them still work
+        world_grid = robot_mgr.world_grid
+        self.assertListEqual(robot_mgr.set_cells_blocked([(3, 4), (1, 0), (2, 3)]), [])
+        self.assertIs(robot_mgr.world_grid, world_grid)
+        robot_mgr.set_cells_blocked([(3, 4), (4, 4)])
+        self.assertEqual(robot_mgr.world_grid[3, 4], 0)
+        self.assertEqual(robot_mgr.world_grid[4, 4], 1)
+        path = robot_mgr.generate_path(Position((3, 4)), Position((1, 0)), set(),
+                                       robot_mgr.get_current_static_obstacles())
+        self.assertEqual(path[-1], (1, 0))
+
+    def test_restart_keeps_grid_changes(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        grid = default_grid.copy()
+        heuristic = LazyHeuristic(grid, HeuristicStore.build(grid, default_world.get_all_zones()))
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic)
+        robot_mgr.set_cells_blocked([(2, 1), (2, 2)])
+        # Reset as the main loop does when the world sim restarts, with the shared heuristic
+        robot_mgr.close()
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic,
+                                   world_grid=robot_mgr.world_grid)
+        self.assertEqual(robot_mgr.world_grid[2, 1], 1)
+        np.testing.assert_array_equal(robot_mgr.base_world_grid, default_grid)
+        expected = HeuristicStore.build(robot_mgr.world_grid, default_world.get_all_zones())
+        for zone in default_world.get_all_zones():
+            np.testing.assert_array_equal(heuristic[zone].to_array(), expected[zone].to_array())
+        path = robot_mgr.generate_path(Position((2, 3)), Position((1, 0)), set(),
+                                       robot_mgr.get_current_static_obstacles())
+        self.assertNotIn((2, 1), path)
+        self.assertEqual(path[-1], (1, 0))
+
+    def test_update_dynamic_obstacles(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        robot_mgr = RobotAllocator(
+            logger, mock_redis, mock_wdb, default_world, mock_heuristic)
+        robot_mgr.world_sim_t = 10
+        robot_mgr.update_dynamic_obstacles()
+        robot_mgr.set_robot_path(robots[0], [(2, 2), (2, 1), (2, 0), (1, 0)])
+        robot_mgr.set_robot_path(robots[1], [(3, 3), (4, 3), (4, 2)])
+
+        def expected_obstacles(paths):
+            expected = set()
+            for path, path_t_start in paths:
+                for t_step, pos in enumerate(path):
+                    for t in range(t_step - 1, t_step + 2):
+                        if path_t_start + t >= robot_mgr.world_sim_t:
+                            expected.add((pos[0], pos[1], path_t_start + t))
+            return expected
+
+        def table_obstacles(table):
+            return set((row, col, t) for row in range(5) for col in range(5)
+                       for t in range(table.t_start, table.t_end) if (row, col, t) in table)
+
+        # World steps forward, with robot 1 getting a different path from elsewhere
+        for robot in robots:
+            robot.move_to_next_position()
+        robots[1].set_path([(3, 4)])
+        robot_mgr.world_sim_t = 11
+        table = robot_mgr.update_dynamic_obstacles()
+        self.assertEqual(table.t_start, 11)
+        # Robot 0 keeps its path as reserved at t=11, robot 1 is re-reserved from t=12
+        obstacles = table_obstacles(table)
+        self.assertSetEqual(obstacles, expected_obstacles(
+            [([(2, 2), (2, 1), (2, 0), (1, 0)], 11), ([(3, 4)], 12)]))
+        # Which covers a full rebuild from the robots' future paths, plus the buffer around
+        # the step robot 0 just took
+        rebuilt = table_obstacles(robot_mgr.get_all_current_dynamic_obstacles())
+        self.assertSetEqual(obstacles - rebuilt, {(2, 2, 11), (2, 2, 12)})
+        self.assertSetEqual(rebuilt, expected_obstacles(
+            [(robot.future_path, 12) for robot in robots]))
+
+    def test_update_dynamic_obstacles_same_ends(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((0, 2)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        robot_mgr = RobotAllocator(
+            logger, mock_redis, mock_wdb, default_world, mock_heuristic)
+        robot_mgr.world_sim_t = 10
+        robot_mgr.update_dynamic_obstacles()
+        # Reserved in an update that was then reverted, the robot kept another route with
+        # the same length and ends
+        robot_mgr.add_path_as_obstacle(robot_mgr.reservations, robots[0],
+                                       [(0, 2), (1, 2), (2, 2), (3, 2), (3, 3), (3, 4)])
+        robots[0].set_path([(0, 2), (0, 3), (1, 3), (1, 4), (2, 4), (3, 4)])
+        self.assertFalse(robot_mgr.reserved_path_matches(robot_mgr.reservations, robots[0]))
+        table = robot_mgr.update_dynamic_obstacles()
+        self.assertListEqual(table.get_owner_path(RobotId(0))[0], robots[0].future_path)
+        self.assertNotIn((2, 2, 13), table)
+        self.assertIn((2, 4, 15), table)
+
+    def test_update_dynamic_obstacles_parked_end(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((0, 2)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        robot_mgr = RobotAllocator(
+            logger, mock_redis, mock_wdb, default_world, mock_heuristic)
+        robot_mgr.world_sim_t = 10
+        robot_mgr.update_dynamic_obstacles()
+        # Ends in the aisle, so the end stays reserved to the end of the window as it moves
+        robot_mgr.set_robot_path(robots[0], [(0, 3), (1, 3), (1, 4)])
+        for world_t in range(11, 13):
+            robots[0].move_to_next_position()
+            robot_mgr.world_sim_t = world_t
+            table = robot_mgr.update_dynamic_obstacles()
+            self.assertIn((1, 4, table.t_end - 1), table)
+        # Then once there it's a static obstacle
+        robots[0].move_to_next_position()
+        robot_mgr.world_sim_t = 13
+        robot_mgr.update_dynamic_obstacles()
+        self.assertIn((1, 4), robot_mgr.get_current_static_obstacles())
+
+    def test_unknown_path_engine(self):
+        mock_redis.smembers.return_value = set()
+        mock_wdb.get_robots.return_value = []
+        mock_redis.xread.return_value = None
+        with self.assertRaises(ValueError):
+            RobotAllocator(logger, mock_redis, mock_wdb, default_world, mock_heuristic,
+                           path_engine='not_an_engine')
+
+    def test_windowed_planner_mode(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        heuristic_dict = {
+            pos: np.abs(np.indices(default_grid.shape) - np.reshape(pos, (2, 1, 1))).sum(axis=0)
+            for pos in default_world.get_all_zones()}
+        with self.assertRaises(ValueError):
+            RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic_dict,
+                           planner_mode='windowed', window_steps=4, replan_steps=3)
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic_dict,
+                                   planner_mode='windowed', window_steps=4, replan_steps=2)
+        self.assertEqual(robot_mgr.reservations.horizon, 7)
+        robot_mgr.world_sim_t = 10
+        table = robot_mgr.update_dynamic_obstacles()
+        path = robot_mgr.generate_path(Position((2, 3)), Position((1, 0)), table,
+                                       robot_mgr.get_current_static_obstacles())
+        self.assertEqual(path[-1], (1, 0))
+        robot_mgr.set_robot_path(robots[0], path)
+        # Only the window of the path is reserved
+        reserved_path, path_t_start = table.get_owner_path(RobotId(0))
+        self.assertListEqual(reserved_path, path[:4])
+        self.assertEqual(path_t_start, 11)
+
+        # Next step the reservation still matches the path, and isn't due for a replan
+        robots[0].move_to_next_position()
+        robot_mgr.world_sim_t = 11
+        table = robot_mgr.update_dynamic_obstacles()
+        self.assertListEqual(robot_mgr.replan_windowed_paths(), [])
+        self.assertEqual(table.get_owner_path(RobotId(0))[1], 11)
+
+        # After replan_steps the rest of the path is replanned and the window moves on
+        robots[0].move_to_next_position()
+        robot_mgr.world_sim_t = 12
+        table = robot_mgr.update_dynamic_obstacles()
+        # Past the deadline it keeps its reservation and path, and is still due next time
+        future_path = list(robots[0].future_path)
+        reserved = table.get_owner_path(RobotId(0))
+        self.assertListEqual(robot_mgr.replan_windowed_paths(time.perf_counter() - 1), [])
+        self.assertEqual(table.get_owner_path(RobotId(0)), reserved)
+        self.assertListEqual(robots[0].future_path, future_path)
+        robot_mgr.replan_windowed_paths()
+        reserved_path, path_t_start = table.get_owner_path(RobotId(0))
+        self.assertEqual(path_t_start, 13)
+        self.assertEqual(robots[0].future_path[0], robots[0].pos)
+        self.assertEqual(robots[0].future_path[-1], (1, 0))
+        self.assertListEqual(reserved_path, robots[0].future_path[:4])
+
+    def test_planning_pool(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        heuristic_dict = {
+            pos: np.abs(np.indices(default_grid.shape) - np.reshape(pos, (2, 1, 1))).sum(axis=0)
+            for pos in default_world.get_all_zones()}
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic_dict,
+                                   planning_processes=2)
+        try:
+            robot_mgr.world_sim_t = 10
+            for robot, task_key in zip(robots, ['task:station:1:order:2:0:0',
+                                                'task:station:2:order:3:1:0']):
+                job = robot_mgr.assign_task_to_robot(task_key, robot)
+                robot_mgr.jobs[job.job_id] = job
+            mock_redis.pipeline.return_value.execute.return_value = [0, []]
+            robot_mgr.update(robots, t_start=time.perf_counter(), time_left=10)
+            # Both paths planned by the pool, either used or replanned around the other
+            self.assertEqual(sum(robot_mgr.planning_stats.values()), 2)
+            self.assertEqual(robot_mgr.planned_paths, {})
+            for robot, job in zip(robots, robot_mgr.jobs.values()):
+                self.assertEqual(job.state, JobState.PICKING_ITEM)
+                self.assertEqual(robot.future_path[-1], job.item_zone)
+            self.assertEqual(pf.find_all_collisions([robot.future_path for robot in robots]),
+                             [])
+            # Pool is restarted for the new grid when next used
+            robot_mgr.set_cells_blocked([Position((4, 4))])
+            self.assertIsNone(robot_mgr.planning_pool)
+        finally:
+            robot_mgr.close()
+
+    def test_path_cache(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        heuristic = LazyHeuristic(default_grid, HeuristicStore.build(
+            default_grid, default_world.get_all_zones()))
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic,
+                                   path_cache=True)
+        robot_mgr.set_robot_path(robots[1], [(3, 4), (3, 3), (3, 2), (2, 2), (2, 1)])
+        static_obstacles = robot_mgr.get_current_static_obstacles()
+        path = robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles)
+        expected_path = robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles,
+            engine='st_astar')
+        self.assertEqual(len(path), len(expected_path))
+        self.assertEqual(pf.find_all_collisions([path, robots[1].future_path]), [])
+        # Only paths between zones are cached
+        robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles)
+        robot_mgr.generate_path(
+            Position((2, 3)), Position((4, 0)), robot_mgr.reservations, static_obstacles)
+        self.assertEqual(robot_mgr.path_cache.stats()['hits'], 1)
+        self.assertEqual(robot_mgr.path_cache.stats()['cached'], 1)
+        robot_mgr.set_cells_blocked([(2, 2)])
+        self.assertIs(robot_mgr.path_cache.grid, robot_mgr.world_grid)
+
+    def test_first_move_tables(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        heuristic = LazyHeuristic(default_grid, HeuristicStore.build(
+            default_grid, default_world.get_all_zones()))
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic,
+                                   first_move_tables=True)
+        static_obstacles = robot_mgr.get_current_static_obstacles()
+        # No robots in the way, so no search
+        with mock.patch('path_planner.plan_path') as plan_path:
+            path = robot_mgr.generate_path(
+                Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles)
+            plan_path.assert_not_called()
+        self.assertEqual(len(path), 5)
+        self.assertEqual(path[-1], (1, 0))
+        self.assertNotIn((1, 1), path)  # Goes around the other zones
+        # Searched around a robot on the way
+        robot_mgr.set_robot_path(robots[1], [(3, 4), (3, 3), (3, 2), (2, 2), (2, 1)])
+        path = robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles)
+        self.assertEqual(path[-1], (1, 0))
+        self.assertEqual(pf.find_all_collisions([path, robots[1].future_path]), [])
+        # Tables follow grid changes
+        robot_mgr.set_cells_blocked([(2, 1), (2, 2)])
+        self.assertEqual(robot_mgr.first_moves, {})
+        path = robot_mgr.get_first_move_table(Position((1, 0))).path((2, 3))
+        self.assertNotIn((2, 2), path)
+        self.assertEqual(path[-1], (1, 0))
+
+    def test_lns(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        heuristic = LazyHeuristic(default_grid, HeuristicStore.build(
+            default_grid, default_world.get_all_zones()))
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic,
+                                   lns=True)
+        # A detour to the item zone, and a robot crossing below
+        detour = [(2, 3), (3, 3), (4, 3), (4, 2), (4, 1), (4, 0), (3, 0), (2, 0), (1, 0)]
+        crossing = [(3, 4), (3, 3), (3, 2), (2, 2), (2, 1), (1, 1)]
+        robot_mgr.set_robot_path(robots[0], detour)
+        robot_mgr.set_robot_path(robots[1], crossing)
+        self.assertEqual(robot_mgr.optimize_paths(0), [])
+        changed = robot_mgr.optimize_paths(1.0)
+        self.assertIn(robots[0], changed)
+        path = robots[0].future_path
+        self.assertEqual(path[0], (2, 3))
+        self.assertEqual(path[-1], (1, 0))
+        self.assertLess(len(path), len(detour))
+        self.assertEqual(pf.find_all_collisions([path, robots[1].future_path]), [])
+        self.assertTrue(robot_mgr.reserved_path_matches(robot_mgr.reservations, robots[0]))
+        self.assertTrue(robot_mgr.reserved_path_matches(robot_mgr.reservations, robots[1]))
+        # Only changed paths are replaced, and put back with their reservations on revert
+        self.assertListEqual(list(robot_mgr.lns_replaced_paths),
+                             [robot.robot_id for robot in changed])
+        self.assertListEqual(robot_mgr.lns_replaced_paths[RobotId(0)], detour)
+        robot_mgr.restore_lns_paths()
+        self.assertListEqual(robots[0].future_path, detour)
+        self.assertListEqual(robots[1].future_path, crossing)
+        self.assertTrue(robot_mgr.reserved_path_matches(robot_mgr.reservations, robots[0]))
+        self.assertTrue(robot_mgr.reserved_path_matches(robot_mgr.reservations, robots[1]))
+        self.assertEqual(robot_mgr.lns_replaced_paths, {})
+        # Paths LNS changes reach the traffic map like any other
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic,
+                                   lns=True, traffic=True)
+        robot_mgr.set_robot_path(robots[0], detour)
+        occupancy = robot_mgr.traffic.occupancy.sum()
+        robot_mgr.optimize_paths(1.0)
+        self.assertGreater(robot_mgr.traffic.occupancy.sum(), occupancy)
+        # Not in windowed mode
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic,
+                                   planner_mode='windowed', lns=True)
+        self.assertIsNone(robot_mgr.lns)
+
+    def test_traffic(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        heuristic = LazyHeuristic(default_grid, HeuristicStore.build(
+            default_grid, default_world.get_all_zones()))
+        with self.assertRaises(ValueError):
+            RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic,
+                           path_engine='sipp', traffic=True)
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic,
+                                   traffic=True)
+        static_obstacles = robot_mgr.get_current_static_obstacles()
+        path = robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles)
+        self.assertEqual(path, [(2, 3), (2, 2), (2, 1), (2, 0), (1, 0)])
+        # Committed paths count from the next world step, and send later paths around them
+        for _ in range(10):
+            robot_mgr.set_robot_path(robots[0], path)
+        self.assertEqual(robot_mgr.traffic.occupancy[2, 1], 10)
+        robot_mgr.world_sim_t = 0
+        robot_mgr.update_dynamic_obstacles()
+        robot_mgr.traffic.weight = 0.5
+        robot_mgr.traffic.advance(robot_mgr.get_world_t() - robot_mgr.traffic.t)
+        self.assertEqual(robot_mgr.traffic.t, 0)
+        robot_mgr.reservations.release_owner(robots[0].robot_id)
+        busy_path = robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles)
+        self.assertEqual(busy_path[-1], (1, 0))
+        self.assertNotIn((2, 1), busy_path)
+        # Not with an explicit engine
+        self.assertEqual(robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles,
+            engine='st_astar'), path)
+
+    def test_lanes(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        world_info = WorldInfo(default_grid, default_robot_home_zones, default_item_load_zones,
+                               default_station_zones,
+                               parse_lanes(['.....', '.....', '>>>..', '.....', '.....'],
+                                           default_grid.shape))
+        for kwargs in [{'path_engine': 'sipp'}, {'path_cache': True}]:
+            with self.assertRaises(ValueError):
+                RobotAllocator(logger, mock_redis, mock_wdb, world_info, mock_heuristic,
+                               lanes=True, **kwargs)
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, world_info, mock_heuristic,
+                                   lanes=True)
+        robot_mgr.heuristic_dict = LazyHeuristic(default_grid, HeuristicStore.build(
+            default_grid, world_info.get_all_zones(),
+            blocked_moves=robot_mgr.lanes.blocked_moves),
+            blocked_moves=robot_mgr.lanes.blocked_moves)
+        static_obstacles = robot_mgr.get_current_static_obstacles()
+        # Around the lane, leaving it only across to the item zone
+        path = robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles)
+        self.assertEqual(len(path), 7)
+        self.assertEqual(path[-2:], [(2, 0), (1, 0)])
+        self.assertEqual(robot_mgr.lanes.count_against(path), 0)
+        # Not with an explicit engine
+        self.assertEqual(len(robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles,
+            engine='st_astar')), 5)
+        # Grid changes rebuild the heuristic along the lanes
+        robot_mgr.set_cells_blocked([Position((3, 2))])
+        path = robot_mgr.generate_path(
+            Position((2, 3)), Position((1, 0)), robot_mgr.reservations, static_obstacles)
+        self.assertNotIn((3, 2), path)
+        self.assertEqual(robot_mgr.lanes.count_against(path), 0)
+        expected = HeuristicStore.build(robot_mgr.world_grid, [Position((1, 0))],
+                                        blocked_moves=robot_mgr.lanes.blocked_moves)
+        np.testing.assert_array_equal(robot_mgr.heuristic_dict[Position((1, 0))].to_array(),
+                                      expected[Position((1, 0))].to_array())
+
+    def test_job_partial_path(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        heuristic_dict = {
+            pos: np.abs(np.indices(default_grid.shape) - np.reshape(pos, (2, 1, 1))).sum(axis=0)
+            for pos in default_world.get_all_zones()}
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic_dict)
+        job = robot_mgr.assign_task_to_robot('task:station:1:order:2:0:0', robots[0])
+        self.assertEqual(job.item_zone, (1, 0))
+        # Out of time, no path and the robot is home so it stays put
+        robot_mgr.jobs_deadline = time.perf_counter()
+        self.assertFalse(robot_mgr.check_and_update_job(job))
+        self.assertEqual(robots[0].future_path, [])
+        robot_mgr.jobs_deadline = None
+        # Column 2 taken the whole horizon, the robot gets as close as it can instead
+        for row in range(default_grid.shape[0]):
+            robot_mgr.reservations.reserve_path(
+                [(row, 2)] * robot_mgr.reservations.horizon, owner=f'wall{row}')
+        self.assertFalse(robot_mgr.check_and_update_job(job))
+        self.assertEqual(job.state, JobState.WAITING_TO_START)
+        self.assertListEqual(robots[0].future_path, [(2, 3), (1, 3)])
+        self.assertEqual(robots[0].state_description, 'Pathing towards item zone')
+        self.assertEqual(robot_mgr.partial_paths, {})
+        # It parks in the aisle, so its end stays reserved to the end of the window
+        table = robot_mgr.reservations
+        self.assertIn((1, 3, table.t_end - 1), table)
+        self.assertTrue(robot_mgr.reserved_path_matches(table, robots[0]))
+        # And a second job planned after it can't drive through it once it's there
+        table.reserve_path([(0, 4)] * table.horizon, owner='wall_corner')
+        heuristic_dict[(0, 3)] = np.abs(
+            np.indices(default_grid.shape) - np.reshape((0, 3), (2, 1, 1))).sum(axis=0)
+        self.assertListEqual(robot_mgr.generate_path(
+            Position((3, 4)), Position((0, 3)), table,
+            robot_mgr.get_current_static_obstacles()), [])
+        table.release_owner('wall_corner')
+        # Once the way is clear it carries on from there
+        robots[0].future_path.pop(0)
+        robots[0].pos = robots[0].future_path[0]
+        for row in range(default_grid.shape[0]):
+            robot_mgr.reservations.release_owner(f'wall{row}')
+        self.assertTrue(robot_mgr.check_and_update_job(job))
+        self.assertEqual(robots[0].future_path[-1], (1, 0))
+        self.assertEqual(robots[0].future_path[0], (1, 3))
+
+    def test_job_partial_path_planning_pool(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        heuristic_dict = {
+            pos: np.abs(np.indices(default_grid.shape) - np.reshape(pos, (2, 1, 1))).sum(axis=0)
+            for pos in default_world.get_all_zones()}
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic_dict,
+                                   planning_processes=1)
+        try:
+            job = robot_mgr.assign_task_to_robot('task:station:1:order:2:0:0', robots[0])
+            for row in range(default_grid.shape[0]):
+                robot_mgr.reservations.reserve_path(
+                    [(row, 2)] * robot_mgr.reservations.horizon, owner=f'wall{row}')
+            robot_mgr.plan_job_paths([job], timeout=10)
+            self.assertEqual(robot_mgr.planned_paths, {((2, 3), (1, 0)): []})
+            # The pool found no path, so the local search still leaves a partial one
+            self.assertFalse(robot_mgr.check_and_update_job(job))
+            self.assertListEqual(robots[0].future_path, [(2, 3), (1, 3)])
+            self.assertEqual(robot_mgr.planning_stats, {'used': 0, 'replanned': 1})
+        finally:
+            robot_mgr.close()
+
+    def test_pibt_planner_mode(self):
+        mock_redis.smembers.return_value = set()
+        robots = [Robot(RobotId(0), Position((2, 3))),
+                  Robot(RobotId(1), Position((3, 4)))]
+        mock_wdb.get_robots.return_value = robots
+        mock_redis.xread.return_value = None
+        heuristic_dict = {
+            pos: np.abs(np.indices(default_grid.shape) - np.reshape(pos, (2, 1, 1))).sum(axis=0)
+            for pos in default_world.get_all_zones()}
+        with self.assertRaises(ValueError):
+            RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic_dict,
+                           planner_mode='not_a_mode')
+        robot_mgr = RobotAllocator(logger, mock_redis, mock_wdb, default_world, heuristic_dict,
+                                   planner_mode='pibt')
+        # Paths only check the goal is reachable, which becomes the robot's goal
+        path = robot_mgr.generate_path(Position((2, 3)), Position((1, 1)), set(), set())
+        self.assertListEqual(path, [(2, 3), (1, 1)])
+        robot_mgr.set_robot_path(robots[0], path)
+        self.assertTrue(robot_mgr.robot_has_route(robots[0]))
+        self.assertFalse(robot_mgr.robot_has_route(robots[1]))
+
+        # Robot 0 steps to its goal one cell at a time, robot 1 stays at home
+        for _ in range(3):
+            changed_robots = robot_mgr.step_robots_pibt()
+            self.assertListEqual(changed_robots, [robots[0]])
+            self.assertEqual(len(robots[0].future_path), 1)
+            robots[0].move_to_next_position()
+        self.assertEqual(robots[0].pos, (1, 1))
+        self.assertEqual(robots[1].pos, (3, 4))
+        self.assertFalse(robot_mgr.robot_has_route(robots[0]))
+        # At the goal the robot waits there
+        self.assertListEqual(robot_mgr.step_robots_pibt(), [])
+        self.assertListEqual(robots[0].future_path, [])
+
     def test_find_and_assign_task_to_robot(self):
         task_key = 'task:station:1:order:2:0:4'
         task_keys = set([task_key])
@@ -1,7 +1,8 @@
 """ Helper function to load a warehouse yaml file."""
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import numpy as np
 import yaml
+from multiagent_planner.lanes import parse_lanes, transpose_lanes
 
 Position = Tuple[int, int]
 
@@ -33,6 +34,16 @@ def load_warehouse_yaml(filename: str) -> Tuple[
     return grid, robot_home_zones, item_load_zones, station_zones
 
 
+def load_warehouse_lanes(filename: str) -> Optional[np.ndarray]:
+    """Load the lane directions of a warehouse yaml's optional lanes layer, a string per grid
+    row with one of '^v<>' per cell for one-way lanes or '.' for none (see Lanes), else None."""
+    with open(filename, 'r', encoding='utf8') as file:
+        scenario = yaml.safe_load(file)
+    if scenario.get('lanes') is None:
+        return None
+    return parse_lanes(scenario['lanes'], np.shape(scenario['grid']))
+
+
 def load_warehouse_yaml_xy(filename: str) -> Tuple[
         np.ndarray, List[Position], List[Position], List[Position]]:
     """ Load warehouse yaml in x,y coordinates instead of row, col (flipped)"""
@@ -52,11 +63,14 @@ class WorldInfo:
                  robot_home_zones: List[Position],
                  item_load_zones: List[Position],
                  station_zones: List[Position],
+                 lanes: Optional[np.ndarray] = None,
                  ) -> None:
         self.world_grid: np.ndarray = world_grid
         self.robot_home_zones: List[Position] = robot_home_zones
         self.item_load_zones: List[Position] = item_load_zones
         self.station_zones: List[Position] = station_zones
+        # Lane directions per cell from the lanes layer, if any (see Lanes)
+        self.lanes: Optional[np.ndarray] = lanes
     
     def get_all_zones(self):
         return self.robot_home_zones + self.item_load_zones + self.station_zones
@@ -66,4 +80,7 @@ class WorldInfo:
         """Load world info from a warehouse yaml"""
         (world_grid, robot_home_zones,
          item_load_zones, station_zones) = load_warehouse_yaml_xy(filename)
-        return WorldInfo(world_grid, robot_home_zones, item_load_zones, station_zones)
+        lanes = load_warehouse_lanes(filename)
+        if lanes is not None:
+            lanes = transpose_lanes(lanes)  # In x,y like the grid
+        return WorldInfo(world_grid, robot_home_zones, item_load_zones, station_zones, lanes)
@@ -14,6 +14,7 @@ from warehouse_logger import create_warehouse_logger
 from warehouses.warehouse_loader import load_warehouse_yaml
 from robot import Robot, RobotId
 from world_db import WorldDatabaseManager
+from multiagent_planner.batch_collisions import find_batch_collisions
 import redis  # type: ignore
 # pylint: disable=redefined-outer-name
 
@@ -187,6 +188,13 @@ class World(object):
 
         return self.collisions == []
 
+    @timeit
+    def find_future_collisions(self) -> np.ndarray:
+        """Return collisions between the robots future paths, as (t, kind, robot_a, robot_b) rows
+        with t steps from now and robots as indices of self.robots. See find_batch_collisions."""
+        return find_batch_collisions(
+            [[robot.pos] + list(robot.future_path) for robot in self.robots])
+
     def step_robots(self) -> list[bool]:
         """Step robots, and return a bool list of those robots that changed positions."""
         self.past_robot_positions.clear()
@@ -316,6 +324,8 @@ if __name__ == '__main__':
               for i, (row, col) in enumerate(robot_home_zones)]
 
     TIME_STEP_SEC = float(os.getenv("TIME_STEP_SEC", default="1"))
+    # Check robots future paths for collisions every N steps, 0 to disable
+    CHECK_FUTURE_PATHS_STEPS = int(os.getenv("CHECK_FUTURE_PATHS_STEPS", default="0"))
     world = World(grid, robots, TIME_STEP_SEC, redis_con, item_load_zones,
                   station_zones, logger=logger)
     if 'reset' in sys.argv:
@@ -342,4 +352,13 @@ if __name__ == '__main__':
             logger.error(
                 f'World State invalid {len(world.collisions)} collisions. '
                 f'first 10 collision(s): {world.collisions[:10]}')
+        if CHECK_FUTURE_PATHS_STEPS and world.t % CHECK_FUTURE_PATHS_STEPS == 0:
+            future_collisions = world.find_future_collisions()
+            if len(future_collisions):
+                first_collisions = [
+                    (t, kind, world.robots[robot_a].robot_id, world.robots[robot_b].robot_id)
+                    for t, kind, robot_a, robot_b in future_collisions[:10].tolist()]
+                logger.warning(
+                    f'Future paths have {len(future_collisions)} collisions. '
+                    f'first 10 (t, kind, robot_a, robot_b): {first_collisions}')
         world.sleep()